@@ -0,0 +1,155 @@
+#! python3
+# alerts.py - Send SMS alerts in the background, the first hit of a camera at once, the hits after it in one message
+# Last update: 20261018: non-blocking alert queue, per camera cooldown, pluggable transport, first hit not held back
+# Developer: @roboticscats, @jiansuo
+import time, queue, threading, metrics
+
+# seconds between two messages of the same camera. A hit after a quiet cooldown is sent at once,
+# the hits after it (e.g. the other presets of the same guard tour) are sent together when the cooldown ends
+cooldown = 600
+# most alerts waiting to be sent, alert() never waits for a free place
+queue_size = 64
+# most hits listed in one message, the rest are counted
+max_details = 5
+prefix = 'LookOut detects wildfire from the camera '
+
+# send SMS via Twilio, textMyself keeps one client for all messages and is imported only when SMS is used
+class TwilioTransport:
+    def send(self, message):
+        import textMyself
+        textMyself.textmyself(message)
+
+# keep messages instead of sending them, for tests and load tests. latency is the seconds each message takes
+class StubTransport:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        time.sleep(self.latency)
+        with self.lock:
+            self.sent.append(message)
+
+class AlertDispatcher:
+    # settings left as None use the module settings. transport has send(message), default Twilio.
+    # name labels the gauges of this dispatcher in metrics, default alerts-1, alerts-2, ...
+    def __init__(self, transport=None, cooldown=None, queue_size=None, name=None):
+        g = globals()
+        self.transport = transport or TwilioTransport()
+        self.cooldown = g['cooldown'] if cooldown is None else cooldown
+        self.queue = queue.Queue(queue_size or g['queue_size'])
+        # camera -> hits waiting to be sent, and the time of the last message sent
+        self.pending = {}
+        self.last_sent = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'sent': 0, 'coalesced': 0, 'dropped': 0, 'failed': 0}
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+        self.name = name or metrics.queue_name('alerts')
+        metrics.gauge('alert_queue_depth', self.queue.qsize, queue=self.name)
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats[key] + n
+
+    # queue a hit of a camera without waiting. detail tells the preset and time, note (weather) is added once.
+    # Return False if the queue is full and the hit is dropped
+    def alert(self, camera, detail='', note=''):
+        try:
+            self.queue.put_nowait((camera, detail, note))
+            self.count('hits')
+            return True
+        except queue.Full:
+            self.count('dropped')
+            return False
+
+    # add a hit to the waiting message of its camera
+    def add(self, camera, detail, note):
+        p = self.pending.get(camera)
+        if p is None:
+            p = {'first': time.monotonic(), 'details': [], 'hits': 0, 'note': ''}
+            self.pending[camera] = p
+        else:
+            self.count('coalesced')
+        p['hits'] = p['hits'] + 1
+        if detail and detail not in p['details']:
+            p['details'].append(detail)
+        if note:
+            p['note'] = note
+
+    # time the waiting message of a camera can be sent: at once, or when the cooldown of the last message ends
+    def ready_time(self, camera):
+        return max(self.pending[camera]['first'], self.last_sent.get(camera, float('-inf')) + self.cooldown)
+
+    def message(self, camera, p):
+        details = p['details'][:max_details]
+        text = prefix + camera
+        if details:
+            text = text + ': ' + ', '.join(details)
+            if len(p['details']) > max_details:
+                text = text + ' and ' + str(len(p['details']) - max_details) + ' more'
+        if p['hits'] > 1:
+            text = text + ' (' + str(p['hits']) + ' hits)'
+        if p['note']:
+            text = text + '. ' + p['note']
+        return text
+
+    # send the waiting messages that are ready, or all of them when closing
+    def send_ready(self, closing=False):
+        now = time.monotonic()
+        for camera in list(self.pending):
+            if not closing and self.ready_time(camera) > now:
+                continue
+            p = self.pending.pop(camera)
+            self.last_sent[camera] = now
+            try:
+                with metrics.timer('sms', camera):
+                    self.transport.send(self.message(camera, p))
+                self.count('sent')
+            except Exception as e:
+                print(f"Error: {e}")
+                self.count('failed')
+
+    def worker(self):
+        closing = False
+        while True:
+            # wake up for a new hit, or when the first waiting message is ready
+            timeout = min((self.ready_time(camera) for camera in self.pending), default=None)
+            if timeout is not None:
+                timeout = max(timeout - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+                if item is None:
+                    closing = True
+                else:
+                    self.add(*item)
+                self.queue.task_done()
+            except queue.Empty:
+                pass
+            self.send_ready(closing)
+            if closing:
+                return
+
+    # send all waiting messages now, then stop
+    def close(self, timeout=30):
+        self.queue.put(None)
+        self.thread.join(timeout)
+        metrics.drop_gauges(self.name)
+
+    # one line report of the alert counters
+    def report(self):
+        with self.lock:
+            s = dict(self.stats)
+        return str(s['hits']) + ' alert hits, ' + str(s['sent']) + ' SMS sent, ' + str(s['coalesced']) + ' coalesced, ' + str(s['dropped']) + ' dropped, ' + str(s['failed']) + ' failed.'
+
+_dispatcher = None
+_dispatcherLock = threading.Lock()
+
+# the dispatcher shared in this process, made at the first use
+def dispatcher():
+    global _dispatcher
+    with _dispatcherLock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher()
+    return _dispatcher
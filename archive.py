@@ -0,0 +1,329 @@
+#! python3
+# archive.py - Keep the recent frames of every camera and preset on disk to review and replay an incident
+# Last update: 20261018: ring of segment files with batched appends, memory-mapped index per camera, replay through the upload queue
+#              replay on a private spool, replayed frames labelled apart from the live camera
+# Developer: @roboticscats, @jiansuo
+# usage: python archive.py list camera [since] [until]
+#        python archive.py replay camera since until lookout_url [frames_per_second]
+#        since and until are seconds since the epoch or local 'YYYY-MM-DD HH:MM:SS'
+import os, re, sys, json, mmap, time, queue, struct, datetime, threading, metrics
+from pathlib import Path
+
+# the archive folder
+archive_dir = Path.home()/Path('Documents/python/archive')
+# bytes of one segment file
+segment_bytes = 64 * 1024 * 1024
+# the oldest segment is deleted while the archive is larger than max_bytes or older than max_age seconds (None keeps any age)
+max_bytes = 2 * 1024 * 1024 * 1024
+max_age = 7 * 86400
+# frames appended in one write, and the most seconds a frame waits to be written
+batch_size = 32
+flush_interval = 2.0
+# most frames waiting in memory, add() never waits for a free place
+queue_size = 64
+# frames per second of a replay
+replay_rate = 1.0
+
+# index record of a frame: UTC time, preset number, segment number, offset and length in the segment
+record = struct.Struct('<dIIQI')
+# a FrameArchive setting not given, so max_age None can turn the age bound off
+_default = object()
+
+def segment_path(path, n):
+    return Path(path)/Path('seg-%08d.dat' % n)
+
+def index_path(path, n):
+    return Path(path)/Path('index-%d.idx' % n)
+
+# camera and preset names of the archive: {'cameras': {name: number}, 'presets': [name, ...]}
+def load_names(path=None):
+    try:
+        with open(Path(path or archive_dir)/Path('names.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'cameras': {}, 'presets': []}
+
+def save_names(path, names):
+    tmp = Path(path)/Path('names.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(names, f)
+    os.replace(tmp, Path(path)/Path('names.json'))
+
+# numbers of the segment files in the archive, oldest first
+def segments(path=None):
+    found = []
+    for entry in os.scandir(path or archive_dir):
+        match = re.fullmatch(r'seg-(\d+)\.dat', entry.name)
+        if match:
+            found.append(int(match.group(1)))
+    return sorted(found)
+
+# first index record at or after ts (field 0), or at or after a segment number (field 2), in a memory-mapped index of n records.
+# Times and segments only grow in an index, so this is a binary search
+def search(index, n, value, field=0):
+    low, high = 0, n
+    while low < high:
+        mid = (low + high) // 2
+        if record.unpack_from(index, mid * record.size)[field] < value:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+# frames of a camera from since to until (UTC seconds), oldest first, optionally of one preset.
+# Yields dicts of ts, camera, preset and data. Frames of a segment deleted meanwhile are skipped
+def frames(camera, since=None, until=None, preset=None, path=None):
+    path = path or archive_dir
+    names = load_names(path)
+    if camera not in names['cameras']:
+        return
+    presets = names['presets']
+    try:
+        f = open(index_path(path, names['cameras'][camera]), 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        n = os.fstat(f.fileno()).st_size // record.size
+        if n == 0:
+            return
+        with mmap.mmap(f.fileno(), n * record.size, access=mmap.ACCESS_READ) as index:
+            i = search(index, n, since) if since is not None else 0
+            segment, data_file = None, None
+            try:
+                while i < n:
+                    ts, p, seg, offset, length = record.unpack_from(index, i * record.size)
+                    i = i + 1
+                    if until is not None and ts >= until:
+                        break
+                    if preset is not None and presets[p] != preset:
+                        continue
+                    if seg != segment:
+                        if data_file is not None:
+                            data_file.close()
+                        segment = seg
+                        try:
+                            data_file = open(segment_path(path, seg), 'rb')
+                        except FileNotFoundError:
+                            data_file = None
+                    if data_file is None:
+                        continue
+                    data = os.pread(data_file.fileno(), length, offset)
+                    if len(data) == length:
+                        yield {'ts': ts, 'camera': camera, 'preset': presets[p], 'data': data}
+            finally:
+                if data_file is not None:
+                    data_file.close()
+
+# appends frames to the archive from a background thread in batches, and deletes the oldest segments
+class FrameArchive:
+    # settings not given use the module settings, max_age None keeps frames of any age.
+    # name labels the gauges of this archive in metrics, default archive-1, archive-2, ...
+    def __init__(self, path=None, segment_bytes=None, max_bytes=None, max_age=_default, batch_size=None, flush_interval=None, name=None):
+        g = globals()
+        self.path = Path(path or g['archive_dir'])
+        self.segment_bytes = segment_bytes or g['segment_bytes']
+        self.max_bytes = max_bytes or g['max_bytes']
+        self.max_age = g['max_age'] if max_age is _default else max_age
+        self.batch_size = batch_size or g['batch_size']
+        self.flush_interval = flush_interval or g['flush_interval']
+        # size and newest frame time of each segment, the last one is appended to
+        self.segments = {}
+        # newest frame time of each camera, frames of a camera are kept in time order
+        self.last = {}
+        self.queue = queue.Queue(queue_size)
+        self.stats = {'frames': 0, 'written': 0, 'batches': 0, 'bytes': 0, 'dropped': 0, 'expired': 0}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+        self.name = name or metrics.queue_name('archive')
+        metrics.gauge('archive_queue', self.queue.qsize, queue=self.name)
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats[key] + n
+
+    # queue one frame without waiting. ts is the UTC time of the image in seconds
+    def add(self, camera, preset, image_data, ts=None):
+        try:
+            self.queue.put_nowait((time.time() if ts is None else ts, camera, str(preset), image_data))
+            self.count('frames')
+        except queue.Full:
+            self.count('dropped')
+
+    def writer(self):
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            names = load_names(self.path)
+            for n in segments(self.path):
+                stat = segment_path(self.path, n).stat()
+                self.segments[n] = [stat.st_size, stat.st_mtime]
+            if not self.segments:
+                # the time of a segment is that of its newest frame, an empty one has none
+                self.segments[0] = [0, 0.0]
+        except Exception as e:
+            print(f"Error: {e}")
+            return
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.append(batch, names)
+                    self.count('written', len(batch))
+                    self.count('batches')
+                    self.expire(names)
+                except Exception as e:
+                    print(f"Error: {e}")
+                    self.count('dropped', len(batch))
+
+    # write the frames of a batch to the segment in one append, then their index records.
+    # The index never points at bytes not written yet
+    def append(self, batch, names):
+        changed = False
+        records = {}
+        chunks = []
+        n = max(self.segments)
+        size = self.segments[n][0]
+        for ts, camera, preset, image_data in batch:
+            if size > 0 and size + len(image_data) > self.segment_bytes:
+                self.write_segment(n, chunks, size)
+                chunks = []
+                n = n + 1
+                size = 0
+                self.segments[n] = [0, ts]
+            if camera not in names['cameras']:
+                names['cameras'][camera] = len(names['cameras'])
+                changed = True
+            if preset not in names['presets']:
+                names['presets'].append(preset)
+                changed = True
+            ts = max(ts, self.last.get(camera, ts))
+            self.last[camera] = ts
+            records.setdefault(names['cameras'][camera], []).append(record.pack(ts, names['presets'].index(preset), n, size, len(image_data)))
+            chunks.append(image_data)
+            size = size + len(image_data)
+            self.segments[n][1] = max(self.segments[n][1], ts)
+        self.write_segment(n, chunks, size)
+        if changed:
+            save_names(self.path, names)
+        for camera, rows in records.items():
+            with open(index_path(self.path, camera), 'ab') as f:
+                f.write(b''.join(rows))
+
+    def write_segment(self, n, chunks, size):
+        if chunks:
+            with open(segment_path(self.path, n), 'ab') as f:
+                f.write(b''.join(chunks))
+            self.count('bytes', sum(len(chunk) for chunk in chunks))
+        self.segments[n][0] = size
+
+    # delete the oldest segments over the size or age bound, and their records at the start of each index
+    def expire(self, names):
+        expired = False
+        while len(self.segments) > 1:
+            oldest = min(self.segments)
+            total = sum(s[0] for s in self.segments.values())
+            too_old = self.max_age is not None and self.segments[oldest][1] < time.time() - self.max_age
+            if total <= self.max_bytes and not too_old:
+                break
+            segment_path(self.path, oldest).unlink(missing_ok=True)
+            del self.segments[oldest]
+            self.count('expired')
+            expired = True
+        if not expired:
+            return
+        first = min(self.segments)
+        for camera in names['cameras'].values():
+            path = index_path(self.path, camera)
+            try:
+                with open(path, 'rb') as f:
+                    n = os.fstat(f.fileno()).st_size // record.size
+                    if n == 0:
+                        continue
+                    with mmap.mmap(f.fileno(), n * record.size, access=mmap.ACCESS_READ) as index:
+                        keep = search(index, n, first, field=2)
+                        if keep == 0:
+                            continue
+                        rows = index[keep * record.size:]
+            except FileNotFoundError:
+                continue
+            # readers keep their own open copy of the old index
+            tmp = path.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(rows)
+            os.replace(tmp, path)
+
+    # write the waiting frames, then stop
+    def close(self, timeout=30):
+        self.queue.put(None)
+        self.thread.join(timeout)
+        metrics.drop_gauges(self.name)
+
+    # one line report of the archive counters
+    def report(self):
+        with self.lock:
+            s = dict(self.stats)
+        return str(s['written']) + ' frames archived in ' + str(s['batches']) + ' batches (' + str(round(s['bytes'] / 1048576, 1)) + ' MB) to ' + str(self.path) + ', ' + str(s['expired']) + ' segments expired, ' + str(s['dropped']) + ' dropped.'
+
+# HTTP Post the frames of a camera from since to until again at rate frames per second, through an upload queue.
+# url is one LookOut endpoint for all frames, or a dict of the endpoint of each preset.
+# Return a list of (ts, preset, LookOut response or None).
+# Replayed frames are labelled camera 'replay:<camera>', so the uplink measurement and the spool results of a live
+# queue never take them for frames of the live camera. Without uploads, replay uses its own queue on a private
+# temporary spool that is deleted at the end: a frame LookOut does not take is None, it is never sent again later
+def replay(camera, since, until, url, rate=None, preset=None, path=None, uploads=None):
+    import shutil, tempfile, uploadqueue
+    rate = rate or replay_rate
+    label = 'replay:' + camera
+    own = uploads is None
+    if own:
+        spool = tempfile.mkdtemp(prefix='lookout-replay-')
+        uploads = uploadqueue.UploadQueue(spool_dir=spool, name='replay')
+    futures = []
+    start = time.monotonic()
+    try:
+        for n, frame in enumerate(frames(camera, since, until, preset, path)):
+            # frame n is sent n / rate seconds after the first, a slow upload does not push later frames back
+            time.sleep(max(start + n / rate - time.monotonic(), 0))
+            endpoint = url.get(frame['preset']) if isinstance(url, dict) else url
+            if not endpoint:
+                continue
+            futures.append((frame['ts'], frame['preset'], uploads.submit(endpoint, frame['data'], label, frame['preset'])))
+        return [(ts, preset, future.result()) for ts, preset, future in futures]
+    finally:
+        if own:
+            uploads.close()
+            shutil.rmtree(spool, ignore_errors=True)
+
+# seconds since the epoch from a command line argument
+def parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timestamp()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: python archive.py list|replay camera [since] [until] [lookout_url] [frames_per_second]')
+        sys.exit()
+    command, camera = sys.argv[1], sys.argv[2]
+    since = parse_time(sys.argv[3]) if len(sys.argv) >= 4 else None
+    until = parse_time(sys.argv[4]) if len(sys.argv) >= 5 else None
+    if command == 'replay':
+        import detections
+        rate = float(sys.argv[6]) if len(sys.argv) >= 7 else None
+        for ts, preset, response in replay(camera, since, until, sys.argv[5], rate):
+            print(json.dumps({'ts': ts, 'preset': preset, 'status': response.status_code if response is not None else None, 'score': detections.score(response)}))
+    else:
+        for frame in frames(camera, since, until):
+            print(json.dumps({'ts': frame['ts'], 'preset': frame['preset'], 'bytes': len(frame['data'])}))
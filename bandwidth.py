@@ -0,0 +1,134 @@
+#! python3
+# bandwidth.py - Pick the upload resolution and jpeg quality of each site so that a guard tour fits its uplink
+# Last update: 20261018: per site bandwidth and latency from the HTTP Post timings, encoding ladder with floors,
+#              the uplink of a site shared by the tours of all its cameras, posts in flight together share the link
+# Developer: @roboticscats, @jiansuo
+import time, threading, metrics
+from collections import deque
+
+# share of the detection interval a whole guard tour may spend uploading
+budget_share = 0.5
+# most bytes uploaded by one guard tour on a metered link, 0 for no limit
+max_tour_bytes = 0
+# lowest image scale and jpeg quality LookOut still detects on
+min_scale = 0.5
+min_quality = 50
+# upload encodings from the best to the smallest: (scale, jpeg quality, first guess of upload bytes / camera bytes).
+# Quality None keeps the camera jpeg quality
+ladder = [(1.0, None, 1.0), (1.0, 80, 0.8), (1.0, 65, 0.6), (0.75, 65, 0.35), (0.5, 65, 0.16), (0.5, 50, 0.12)]
+# uploads of a site kept to estimate its bandwidth and latency
+window = 32
+# weight of the newest size of an encoding in its size estimate
+alpha = 0.3
+
+# upload state of one site (a camera or tower sharing one uplink)
+class Site:
+    def __init__(self, name):
+        self.name = name
+        self.steps = [(scale, q) for scale, q, ratio in ladder if scale >= min_scale and (q is None or q >= min_quality)] or [ladder[0][:2]]
+        self.ratios = [ratio for scale, q, ratio in ladder if scale >= min_scale and (q is None or q >= min_quality)] or [1.0]
+        # (bytes, seconds, time.monotonic() at the end) of the last uploads
+        self.samples = deque(maxlen=window)
+        # camera -> (images of its tour, interval, time.monotonic() of its last choice), the cameras sharing the uplink
+        self.tours = {}
+        self.counts = [0] * len(self.steps)
+        self.last = None
+        self.lock = threading.Lock()
+        metrics.gauge('uplink_bytes_per_second', lambda: self.estimate()[0], name)
+        metrics.gauge('upload_scale', lambda: self.last and self.last['scale'], name)
+
+    # add the timing of a finished HTTP Post, end is its time.monotonic() at the end, default now
+    def record(self, nbytes, seconds, end=None):
+        if nbytes > 0 and seconds > 0:
+            with self.lock:
+                self.samples.append((nbytes, seconds, time.monotonic() if end is None else end))
+
+    # (bytes, seconds) of the last uploads. Posts of the site in flight at the same time share the uplink,
+    # so the seconds of each are divided by the mean number of posts in flight meanwhile
+    def link_samples(self):
+        with self.lock:
+            samples = list(self.samples)
+        scaled = []
+        for nbytes, seconds, end in samples:
+            busy = sum(max(min(end, e) - max(end - seconds, e - s), 0.0) for b, s, e in samples)
+            scaled.append((nbytes, seconds * seconds / busy))
+        return scaled
+
+    # (bandwidth in bytes per second or None, latency in seconds) from seconds = latency + bytes / bandwidth
+    def estimate(self):
+        samples = self.link_samples()
+        if not samples:
+            return None, 0.0
+        n = len(samples)
+        total_bytes = sum(b for b, s in samples)
+        total_seconds = sum(s for b, s in samples)
+        mean_bytes = total_bytes / n
+        mean_seconds = total_seconds / n
+        var = sum((b - mean_bytes) ** 2 for b, s in samples)
+        # a line fit needs images of different sizes, otherwise all the time is counted as transfer time
+        if n >= 4 and (var / n) ** 0.5 > 0.1 * mean_bytes:
+            slope = sum((b - mean_bytes) * (s - mean_seconds) for b, s in samples) / var
+            if slope > 0:
+                return 1.0 / slope, max(mean_seconds - slope * mean_bytes, 0.0)
+        return total_bytes / total_seconds, 0.0
+
+    # pick the encoding of an image of image_size bytes of camera, whose tour uploads frames images every interval seconds.
+    # The uplink time is shared by the images of all cameras of the site. Return (step, scale, jpeg quality)
+    def choose(self, image_size, frames=1, interval=60, camera=''):
+        frames = max(frames, 1)
+        now = time.monotonic()
+        with self.lock:
+            self.tours[camera] = (frames, interval, now)
+            # a camera that has not uploaded for two of its intervals no longer shares the uplink
+            for key, (f, i, seen) in list(self.tours.items()):
+                if now - seen > 2 * max(i, 1.0):
+                    del self.tours[key]
+            rate = sum(f / i if i > 0 else float('inf') for f, i, seen in self.tours.values())
+        bandwidth, latency = self.estimate()
+        budget = None
+        if bandwidth is not None:
+            budget = bandwidth * max(budget_share / rate - latency, 0.0)
+        if max_tour_bytes:
+            budget = max_tour_bytes / frames if budget is None else min(budget, max_tour_bytes / frames)
+        step = 0
+        if budget is not None:
+            step = len(self.steps) - 1
+            for i, ratio in enumerate(self.ratios):
+                if image_size * ratio <= budget:
+                    step = i
+                    break
+        scale, q = self.steps[step]
+        with self.lock:
+            self.counts[step] = self.counts[step] + 1
+            self.last = {'scale': scale, 'quality': q, 'bandwidth': round(bandwidth) if bandwidth else None, 'latency': round(latency, 3), 'budget': round(budget) if budget is not None else None}
+        return step, scale, q
+
+    # learn the size of an encoding from an encoded image
+    def encoded(self, step, image_size, upload_size):
+        if image_size > 0 and upload_size > 0:
+            with self.lock:
+                self.ratios[step] = (1 - alpha) * self.ratios[step] + alpha * upload_size / image_size
+
+    # one line of the last choice
+    def report(self):
+        last = self.last
+        if last is None:
+            return self.name + ': no upload yet.'
+        return self.name + ': scale ' + str(last['scale']) + ', quality ' + str(last['quality'] or 'camera') + ', uplink ' + str(last['bandwidth']) + ' B/s, latency ' + str(last['latency']) + ' s, budget ' + str(last['budget']) + ' bytes per image.'
+
+    # number of images uploaded with each encoding
+    def usage(self):
+        with self.lock:
+            return {str(scale) + '/' + str(q or 'camera'): n for (scale, q), n in zip(self.steps, self.counts) if n}
+
+_sites = {}
+_sites_lock = threading.Lock()
+
+# the shared upload state of a site
+def site(name):
+    with _sites_lock:
+        s = _sites.get(name)
+        if s is None:
+            s = Site(name)
+            _sites[name] = s
+        return s
@@ -0,0 +1,290 @@
+#! python3
+# benchmark.py - Measure LookOut Messenger throughput offline against local fake camera, LookOut and OpenWeather servers
+# Last update: 20261018: N simulated AXIS cameras driven by the fleet on the engine.py detection cycle, JSON results, hot presets, frame archive,
+#              overlay throughput by number of worker processes, guard tour upload wall time over HTTP/2 and thread per HTTP Post
+# Developer: @roboticscats, @jiansuo
+# usage: python benchmark.py --cameras 8 --presets 3 --cycles 3 --output bench.json
+#        python benchmark.py --overlay-scaling 0,1,2,4 --images 64
+#        python benchmark.py --tour-rounds 20 --presets 5
+import os, sys, json, time, argparse, asyncio, platform, resource, subprocess, tempfile, multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import fakeservers, fleet, weather, uploadqueue, metrics, httppool, http2pool, alerts, detections, deadline, archive
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Offline LookOut Messenger benchmark')
+    parser.add_argument('--cameras', type=int, default=4, help='number of simulated AXIS PTZ cameras')
+    parser.add_argument('--presets', type=int, default=3, help='presets in the guard tour of each camera')
+    parser.add_argument('--webcams', type=int, default=0, help='number of simulated webpage cameras')
+    parser.add_argument('--cycles', type=int, default=3, help='guard tour cycles of each camera')
+    parser.add_argument('--interval', type=float, default=0.0, help='detection interval in seconds, 0 runs cycles back to back')
+    parser.add_argument('--camera-latency', type=float, default=0.05, help='seconds the fake camera takes for each request')
+    parser.add_argument('--camera-tail', type=float, default=0.0, help='share of camera image requests that stall')
+    parser.add_argument('--camera-tail-latency', type=float, default=2.0, help='seconds a stalled camera image request takes more')
+    parser.add_argument('--hedge', action='store_true', help='start a second camera HTTP Get above the recent p95 of the camera')
+    parser.add_argument('--lookout-latency', type=float, default=0.2, help='seconds the fake LookOut takes for each HTTP Post')
+    parser.add_argument('--score-rate', type=float, default=0.05, help='share of LookOut responses with a score')
+    parser.add_argument('--hot-presets', type=int, default=0, help='first presets of each guard tour looking at a fire')
+    parser.add_argument('--hot-rate', type=float, default=0.5, help='share of LookOut responses with a score on the hot presets')
+    parser.add_argument('--planner', action='store_true', help='visit presets that scored recently more often than quiet ones')
+    parser.add_argument('--move-time', type=float, default=0.5, help='seconds the fake camera takes to move between presets')
+    parser.add_argument('--ptz', type=float, default=2.0, help='PTZ movement time of each preset (longest settle wait)')
+    parser.add_argument('--capture', choices=('image', 'stream'), default='image', help='take PTZ images by image.cgi HTTP Get or from an MJPEG stream')
+    parser.add_argument('--processes', type=int, default=0, help='overlay worker processes, 0 draws the overlay in threads')
+    parser.add_argument('--overlay-scaling', help='only measure the overlay stage with each of these numbers of worker processes, e.g. 0,1,2,4')
+    parser.add_argument('--images', type=int, default=64, help='1920x1080 frames drawn for each number of worker processes by --overlay-scaling')
+    parser.add_argument('--uplink', type=float, default=0, help='uplink of the camera sites in KB/s shared by all posts, 0 for no limit')
+    parser.add_argument('--adaptive', action='store_true', help='fit the upload resolution and jpeg quality to the uplink')
+    parser.add_argument('--archive', action='store_true', help='keep the uploaded frames in the frame archive')
+    parser.add_argument('--upload', choices=('threads', 'http2'), default='threads', help='post each image on its own pooled connection, or as a stream of one HTTP/2 connection')
+    parser.add_argument('--h2-window', type=int, default=fakeservers.h2_window, help='HTTP/2 flow control window in bytes of the fake LookOut, 65535 is the protocol default')
+    parser.add_argument('--tour-rounds', type=int, default=0, help='only measure the upload wall time of one guard tour this many times in each upload mode')
+    parser.add_argument('--sms', type=float, default=None, help='send SMS alerts to a local stub taking this many seconds per message')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args(argv)
+    if args.adaptive and args.interval <= 0:
+        # the upload encoding is chosen to fit a guard tour into its interval
+        parser.error('--adaptive needs a positive --interval')
+    return args
+
+# LookOut endpoint path of preset p of camera i
+def hot_path(i, p):
+    return '/cam%d/preset%d' % (i, p)
+
+# run the fake servers in a child process, so their CPU time is not counted as the messenger's
+def serve_fakes(args, conn):
+    fakeservers.h2_window = args.h2_window
+    frames = fakeservers.make_frames()
+    axis = [fakeservers.AxisServer(latency=args.camera_latency, move_time=args.move_time, frames=frames, tail_rate=args.camera_tail, tail_latency=args.camera_tail_latency, seed=i + 1) for i in range(args.cameras + args.webcams)]
+    hot = {hot_path(i, p): args.hot_rate for i in range(args.cameras) for p in range(min(args.hot_presets, args.presets))}
+    lookout = fakeservers.LookOutServer(latency=args.lookout_latency, score_rate=args.score_rate, bandwidth=args.uplink * 1024, hot=hot, http2=True)
+    onecall = fakeservers.OneCallServer()
+    conn.send({'axis': [fakeservers.start(s) for s in axis], 'lookout': fakeservers.start(lookout), 'onecall': fakeservers.start(onecall)})
+    # wait for the benchmark to finish, then report the server counters
+    conn.recv()
+    counts = {'images': 0, 'challenges': 0, 'moves': 0, 'streams': 0, 'stalls': 0}
+    for s in axis:
+        for key in counts:
+            counts[key] = counts[key] + s.counts[key]
+    counts.update(lookout.counts)
+    counts['weather_calls'] = onecall.calls
+    conn.send(counts)
+
+# camera definitions in the fleet format pointing at the fake servers
+def make_cameras(args, urls):
+    cameras = []
+    for i in range(args.cameras):
+        guardtour = [{'preset': 'preset_%d' % p, 'lookout': urls['lookout'] + hot_path(i, p), 'ptz': args.ptz, 'heading': 60 * p, 'FOV': 60} for p in range(args.presets)]
+        cameras.append({'name': 'ptz%d' % i, 'cameraUrl': urls['axis'][i], 'username': 'username', 'password': 'password',
+                        'latitude': 22.0 + i * 0.001, 'longitude': 114.0, 'interval': args.interval, 'capture': args.capture, 'guardtour': guardtour})
+    for i in range(args.webcams):
+        cameras.append({'name': 'web%d' % i, 'inputUrl': urls['axis'][args.cameras + i] + '/axis-cgi/jpg/image.cgi', 'username': 'username', 'password': 'password',
+                        'lookout': urls['lookout'] + '/web%d' % i, 'latitude': 50.88, 'longitude': 119.89, 'interval': args.interval})
+    return cameras
+
+# git commit of this tree, to compare results across versions
+def version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent, capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ''
+
+# peak resident memory of this process in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# images per second of the overlay stage for each number of worker processes, 0 draws in this process.
+# As many threads as the pool has shared memory slots feed it, like the cameras of a fleet
+def overlay_scaling(args):
+    import engine, imagepool, overlay
+    frames = fakeservers.make_frames()
+    results = []
+    for processes in [int(n) for n in args.overlay_scaling.split(',')]:
+        pool = None
+        if processes > 0:
+            pool = imagepool.ImagePool(fleet.FontPath, fleet.FontSize, (20, 30), processes)
+            draw = pool.overlay
+            threads = processes * imagepool.slots_per_process
+        else:
+            draw = overlay.renderer(engine.load_font(fleet.FontPath, fleet.FontSize)).overlay
+            threads = 1
+        try:
+            with ThreadPoolExecutor(threads) as executor:
+                # start the worker processes before the clock does
+                list(executor.map(lambda n: draw(frames[n % len(frames)], '2026-10-18 12:00:00', 'Temp 24.4 C'), range(threads)))
+                wall_start = time.perf_counter()
+                drawn = list(executor.map(lambda n: draw(frames[n % len(frames)], '2026-10-18 12:00:00', 'Temp 24.4 C'), range(args.images)))
+                wall = time.perf_counter() - wall_start
+        finally:
+            if pool is not None:
+                pool.close()
+        results.append({'processes': processes, 'threads': threads, 'images': args.images, 'failed': drawn.count(None),
+                        'wall_seconds': round(wall, 3), 'images_per_second': round(args.images / wall, 2) if wall > 0 else None})
+    for r in results:
+        r['speedup'] = round(r['images_per_second'] / results[0]['images_per_second'], 2) if results[0]['images_per_second'] else None
+    return {
+        'version': version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'params': vars(args),
+        'overlay_scaling': results,
+    }
+
+# wall time of posting the frames of one guard tour, one 1920x1080 frame to the endpoint of each preset, through an upload queue:
+# - threads: the upload queue as shipped, a worker thread and pooled keep-alive connection for each HTTP Post in flight
+# - threads_per_preset: as many workers and connections as presets, so the whole tour is in flight like with HTTP/2
+# - http2: as many workers as presets, each waiting for its stream on one HTTP/2 connection, as engine.GuardTour with uploadMode 'http2'
+# The first round of each mode opens the connections and is not timed. A frame larger than the HTTP/2 window of LookOut (--h2-window)
+# waits a round trip for each window update, the HTTP/1.1 posts are only bound by TCP
+def tour_upload(args):
+    import uploadimage
+    parent, child = multiprocessing.Pipe()
+    fakes = multiprocessing.Process(target=serve_fakes, args=(args, child), daemon=True)
+    fakes.start()
+    urls = parent.recv()
+    uploadqueue.spool_dir = Path(tempfile.mkdtemp(prefix='lookout-bench-'))/Path('spool')
+    frames = fakeservers.make_frames()
+    items = [(urls['lookout'] + hot_path(0, p), frames[p % len(frames)]) for p in range(args.presets)]
+    results = {}
+    for mode, workers, post in (('threads', uploadqueue.workers, uploadimage.upload_image),
+                                ('threads_per_preset', max(uploadqueue.workers, args.presets), uploadimage.upload_image),
+                                ('http2', max(uploadqueue.workers, args.presets), http2pool.post_image)):
+        # new connections for each mode
+        httppool.configure()
+        http2pool.close()
+        before = httppool.stats()['new'] + http2pool.stats()['connections']
+        uploads = uploadqueue.UploadQueue(workers=workers, post=post, name='bench-' + mode)
+        walls = []
+        posted = 0
+        for i in range(args.tour_rounds + 1):
+            started = time.perf_counter()
+            futures = [uploads.submit(url, image_data, 'tour', str(p)) for p, (url, image_data) in enumerate(items)]
+            responses = [future.result() for future in futures]
+            if i > 0:
+                walls.append(time.perf_counter() - started)
+                posted = posted + sum(1 for response in responses if response is not None and response.status_code == 200)
+        uploads.close()
+        walls.sort()
+        results[mode] = {'workers': workers, 'mean': round(sum(walls) / len(walls), 3), 'p95': round(walls[min(int(0.95 * len(walls)), len(walls) - 1)], 3),
+                         'posted': posted, 'connections': httppool.stats()['new'] + http2pool.stats()['connections'] - before}
+    parent.send('stop')
+    server_counts = parent.recv()
+    fakes.join(5)
+    for mode in ('threads', 'threads_per_preset'):
+        results['http2_drop_percent_vs_' + mode] = round(100 * (1 - results['http2']['mean'] / results[mode]['mean']), 1) if results[mode]['mean'] > 0 else None
+    return {
+        'version': version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': vars(args),
+        'frame_bytes': [len(image_data) for url, image_data in items],
+        'tour_upload': results,
+        'http2': http2pool.stats(),
+        'servers': server_counts,
+    }
+
+def run(args):
+    parent, child = multiprocessing.Pipe()
+    fakes = multiprocessing.Process(target=serve_fakes, args=(args, child), daemon=True)
+    fakes.start()
+    urls = parent.recv()
+
+    # point the messenger at the fake servers and a scratch folder
+    scratch = tempfile.mkdtemp(prefix='lookout-bench-')
+    fleet.Flag_Overlay = True
+    fleet.Flag_Weather = True
+    fleet.Flag_SMS = args.sms is not None
+    fleet.overlayProcesses = args.processes
+    fleet.Flag_Adaptive = args.adaptive
+    fleet.Flag_Planner = args.planner
+    fleet.Flag_Archive = args.archive
+    fleet.uploadMode = args.upload
+    fleet.sms_transport = alerts.StubTransport(args.sms or 0.0)
+    deadline.hedge = args.hedge
+    weather.apiUrl = urls['onecall'] + '/data/3.0/onecall'
+    weather.cache_file = Path(scratch)/Path('weather-cache.json')
+    uploadqueue.spool_dir = Path(scratch)/Path('spool')
+    detections.store_path = Path(scratch)/Path('detections.db')
+    archive.archive_dir = Path(scratch)/Path('archive')
+    cameras = make_cameras(args, urls)
+
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start = time.perf_counter()
+    stats = asyncio.run(fleet.run_fleet(cameras, args.cycles))
+    wall = time.perf_counter() - wall_start
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    # overlay worker processes have ended here, the fake servers have not
+    children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    parent.send('stop')
+    server_counts = parent.recv()
+    fakes.join(5)
+
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    cpu = cpu + (children_end.ru_utime - children_start.ru_utime) + (children_end.ru_stime - children_start.ru_stime)
+    cycles = sum(s['cycle'] for s in stats.values())
+    uploads = sum(s['uploads'] for s in stats.values())
+    # a fire on a hot preset waits on average about the time between two hits of the preset to be detected
+    hot = {('ptz%d' % i, 'preset_%d' % p) for i in range(args.cameras) for p in range(min(args.hot_presets, args.presets))}
+    rates = detections.hit_rates()
+    presets = {}
+    for group, names in (('hot', hot), ('quiet', {(r['camera'], r['preset']) for r in rates} - hot)):
+        images = sum(r['images'] for r in rates if (r['camera'], r['preset']) in names)
+        hits = sum(r['hits'] for r in rates if (r['camera'], r['preset']) in names)
+        presets[group] = {'presets': len(names), 'images': images, 'hits': hits,
+                          'visits_per_hour': round(3600 * images / wall / len(names), 1) if names and wall > 0 else None,
+                          'seconds_between_hits': round(wall * len(names) / hits, 2) if hits else None}
+    return {
+        'version': version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': vars(args),
+        'wall_seconds': round(wall, 3),
+        'cycles': cycles,
+        'cycles_per_second': round(cycles / wall, 3) if wall > 0 else None,
+        'frames_posted': uploads,
+        'frames_per_second': round(uploads / wall, 3) if wall > 0 else None,
+        'frame_latency': metrics.stage_summary('frame'),
+        'stages': {stage: metrics.stage_summary(stage) for stage in ('ptz', 'get', 'screen', 'overlay', 'post', 'cycle', 'late', 'frame_age')},
+        'cpu_seconds': round(cpu, 3),
+        'cpu_percent': round(100 * cpu / wall, 1) if wall > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'failures': sum(s['failure'] for s in stats.values()),
+        'detections': sum(s['detection'] for s in stats.values()),
+        'cadence': {name: s['cadence'] for name, s in stats.items()},
+        'encodings': {name: s['encodings'] for name, s in stats.items() if 'encodings' in s},
+        'hit_rates': rates,
+        'presets': presets,
+        'sms': dict(fleet.sms.stats) if fleet.sms is not None else None,
+        'archive': dict(fleet.frame_archive.stats) if fleet.frame_archive is not None else None,
+        'camera_gets': deadline.stats(),
+        'connections': httppool.stats(),
+        'http2': http2pool.stats() if args.upload == 'http2' else None,
+        'servers': server_counts,
+    }
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    # stdout has only the JSON results, what this process, the overlay workers and the fake servers print goes to stderr
+    sys.stdout.flush()
+    results_file = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    if args.overlay_scaling:
+        results = overlay_scaling(args)
+    elif args.tour_rounds > 0:
+        results = tour_upload(args)
+    else:
+        results = run(args)
+    text = json.dumps(results, indent=2)
+    print(text, file=results_file)
+    results_file.flush()
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
@@ -0,0 +1,87 @@
+#! python3
+# changedetect.py - Skip images that have not changed since the last upload
+# Last update: 20261018: conditional HTTP Get and perceptual hash of each camera or preset, perceptual skip only when asked for
+# Developer: @roboticscats, @jiansuo
+import io, time, hashlib
+from PIL import Image
+
+# largest number of different bits (out of 64) between two perceptual hashes counted as the same picture.
+# None skips only images not modified or byte for byte the same: a thin smoke plume can be 4 bits away from the
+# picture before it, so set it only for a camera whose picture changes little, e.g. a webpage image
+threshold = None
+# an unchanged image is still uploaded after this many seconds, so LookOut always sees the scene
+max_skip_time = 60
+
+# 64 bit difference hash of the image: each bit tells if a pixel is brighter than its right neighbour on a 9x8 grey image
+def dhash(image_data):
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            # let the jpeg decoder scale down while decoding, much faster than decoding the full frame
+            image.draft('L', (64, 64))
+            pixels = image.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+# number of different bits of two hashes
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+class ChangeDetector:
+    def __init__(self, threshold=threshold, max_skip_time=max_skip_time):
+        self.threshold = threshold
+        self.max_skip_time = max_skip_time
+        # key (camera url or preset) -> validators of the last response and hashes of the last uploaded image
+        self.state = {}
+        self.skipped = {'not modified': 0, 'identical': 0, 'similar': 0}
+
+    # True if the last upload of key is older than max_skip_time
+    def due(self, state):
+        return time.monotonic() - state.get('uploaded', float('-inf')) > self.max_skip_time
+
+    # request headers of a conditional HTTP Get of key
+    def headers(self, key):
+        headers = {'Cache-Control': 'no-cache'}
+        state = self.state.get(key, {})
+        if self.due(state):
+            return headers
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    # True if the response image of key should be drawn and uploaded, False if it is the same as the last upload
+    def changed(self, key, response):
+        state = self.state.setdefault(key, {})
+        if response.status_code == 304:
+            self.skipped['not modified'] = self.skipped['not modified'] + 1
+            return False
+        state['etag'] = response.headers.get('ETag')
+        state['last_modified'] = response.headers.get('Last-Modified')
+        digest = hashlib.sha1(response.content).digest()
+        image_hash = None
+        if not self.due(state):
+            if digest == state.get('digest'):
+                self.skipped['identical'] = self.skipped['identical'] + 1
+                return False
+            if self.threshold is not None:
+                image_hash = dhash(response.content)
+                if image_hash is not None and state.get('hash') is not None and distance(image_hash, state['hash']) <= self.threshold:
+                    self.skipped['similar'] = self.skipped['similar'] + 1
+                    return False
+        # keep the hashes of the uploaded image, later images are compared with it
+        state['digest'] = digest
+        if self.threshold is not None:
+            state['hash'] = image_hash if image_hash is not None else dhash(response.content)
+        state['uploaded'] = time.monotonic()
+        return True
+
+    # one line report of the skipped images
+    def report(self):
+        return str(sum(self.skipped.values())) + ' unchanged images skipped (' + str(self.skipped['not modified']) + ' not modified, ' + str(self.skipped['identical']) + ' identical, ' + str(self.skipped['similar']) + ' similar).'
@@ -0,0 +1,219 @@
+#! python3
+# deadline.py - Time budget of a detection cycle: hard timeouts on every HTTP call, cancellation, hedged camera HTTP Get
+# Last update: 20261018: deadlines from the remaining cycle budget, a second camera HTTP Get above the recent p95,
+#              a cancelled call drops its connection, the first HTTP Get runs in the caller's thread
+# Developer: @roboticscats, @jiansuo
+import time, threading, requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# seconds to open a connection and the longest wait for the next bytes of a response, also of calls without a deadline
+connect_timeout = 3.05
+read_timeout = 30.0
+# share of the detection interval a whole cycle may take, the presets of a guard tour share what is left in turn
+cycle_share = 1.0
+# share of the cycle budget of a webpage camera its HTTP Get may take, the rest is for the HTTP Post
+get_share = 0.5
+# a call is not started with less than this many seconds left
+min_timeout = 0.05
+# bytes of a response read between two deadline checks
+chunk_size = 16 * 1024
+# start a second camera HTTP Get when the first has not answered after the recent p95 of the camera
+hedge = False
+hedge_quantile = 0.95
+# camera HTTP Get timings kept for the p95, and the fewest needed before hedging
+hedge_window = 100
+hedge_min_samples = 20
+# the second HTTP Get never starts earlier than this many seconds
+hedge_min_delay = 0.1
+# threads starting and running the second camera HTTP Gets, the first runs in the caller's thread.
+# A camera has one HTTP Get at a time, so one thread per camera is enough, see configure()
+hedge_workers = 8
+
+# the time budget of a call ran out, or it was cancelled
+class DeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+# a point on the monotonic clock calls must finish by. seconds None has no end of its own.
+# A child deadline ends with its parent at the latest, and is cancelled with it
+class Deadline:
+    def __init__(self, seconds=None, parent=None):
+        self.at = None if seconds is None else time.monotonic() + max(seconds, 0.0)
+        if parent is not None and parent.at is not None:
+            self.at = parent.at if self.at is None else min(self.at, parent.at)
+        self.parent = parent
+        self.cancelled = False
+        # functions called by cancel(), e.g. to drop the connection of a call in flight
+        self.callbacks = []
+        self.lock = threading.Lock()
+        if parent is not None:
+            parent.on_cancel(self.cancel)
+
+    # a deadline of at most seconds within this one
+    def child(self, seconds=None):
+        return Deadline(seconds, self)
+
+    # seconds left, None if there is no end
+    def remaining(self):
+        return None if self.at is None else max(self.at - time.monotonic(), 0.0)
+
+    # calls waiting on this deadline give up at their next check, calls blocked on the network drop their connection
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            callbacks = self.callbacks
+            self.callbacks = []
+        for func in callbacks:
+            try:
+                func()
+            except Exception as e:
+                print(f"Error: {e}")
+
+    # call func when this deadline is cancelled, at once if it already is
+    def on_cancel(self, func):
+        with self.lock:
+            if not self.cancelled:
+                self.callbacks.append(func)
+                return
+        func()
+
+    # forget a function given to on_cancel(), e.g. when its call is done
+    def discard(self, func):
+        with self.lock:
+            if func in self.callbacks:
+                self.callbacks.remove(func)
+
+    def is_cancelled(self):
+        return self.cancelled or (self.parent is not None and self.parent.is_cancelled())
+
+    def expired(self):
+        remaining = self.remaining()
+        return self.is_cancelled() or (remaining is not None and remaining < min_timeout)
+
+    # raise DeadlineExceeded if the time is up or the call is cancelled
+    def check(self):
+        if self.is_cancelled():
+            raise DeadlineExceeded('cancelled')
+        if self.expired():
+            raise DeadlineExceeded('deadline exceeded')
+
+    # (connect, read) timeout of requests for a call started now
+    def timeout(self):
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return (connect_timeout, read_timeout)
+        return (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+    # seconds to wait for something that takes at most limit seconds
+    def limit(self, seconds):
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+# recent camera HTTP Get timings and the hedge counters
+_samples = {}
+_stats = {'gets': 0, 'hedged': 0, 'hedge_won': 0, 'timeouts': 0}
+_executor = None
+_lock = threading.Lock()
+
+def count(key, n=1):
+    with _lock:
+        _stats[key] = _stats[key] + n
+
+# add the seconds a camera HTTP Get of key (e.g. camera name) took
+def observe(key, seconds):
+    with _lock:
+        samples = _samples.get(key)
+        if samples is None:
+            samples = deque(maxlen=hedge_window)
+            _samples[key] = samples
+        samples.append(seconds)
+
+# seconds after which a second HTTP Get of key is started, None if there are too few timings yet
+def hedge_delay(key):
+    with _lock:
+        samples = sorted(_samples.get(key, ()))
+    if len(samples) < hedge_min_samples:
+        return None
+    return max(samples[min(int(hedge_quantile * len(samples)), len(samples) - 1)], hedge_min_delay)
+
+# change the number of hedge threads, e.g. to the number of cameras of a fleet
+def configure(workers=None):
+    global hedge_workers, _executor
+    with _lock:
+        if workers is not None and workers != hedge_workers:
+            hedge_workers = workers
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+                _executor = None
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(hedge_workers, thread_name_prefix='hedge')
+        return _executor
+
+# HTTP Get of a camera image under a deadline. With hedge on, a second HTTP Get starts when the first is slower
+# than the recent p95 of key, the first answer wins and the other is cancelled. Return the response, raise on failure
+def get(url, key='', deadline=None, **kwargs):
+    import httppool
+    deadline = deadline or Deadline()
+    count('gets')
+    started = time.perf_counter()
+    delay = hedge_delay(key) if hedge else None
+    try:
+        if delay is None or (deadline.remaining() is not None and deadline.remaining() <= delay):
+            response = httppool.get(url, deadline=deadline, **kwargs)
+        else:
+            response = hedged(url, deadline, delay, **kwargs)
+    except requests.exceptions.Timeout:
+        count('timeouts')
+        raise
+    observe(key, time.perf_counter() - started)
+    return response
+
+# the first HTTP Get runs in the caller's thread, a hedge thread starts the second one if the first is not done after delay.
+# The losing HTTP Get is cancelled and drops its connection, so neither thread stays blocked on it
+def hedged(url, deadline, delay, **kwargs):
+    import httppool
+    first = deadline.child()
+    second = deadline.child()
+    first_done = threading.Event()
+    def backup():
+        if first_done.wait(delay):
+            return None
+        count('hedged')
+        response = httppool.get(url, deadline=second, **kwargs)
+        first.cancel()
+        return response
+    pending = executor().submit(backup)
+    try:
+        response = httppool.get(url, deadline=first, **kwargs)
+        first_done.set()
+        second.cancel()
+        return response
+    except Exception as e:
+        first_done.set()
+        error = e
+    # the first HTTP Get failed, or was cancelled because the second one answered
+    try:
+        response = pending.result(timeout=deadline.remaining())
+    except Exception:
+        response = None
+    if response is None:
+        second.cancel()
+        raise error
+    count('hedge_won')
+    return response
+
+# the camera HTTP Get counters
+def stats():
+    with _lock:
+        return dict(_stats)
+
+# one line report of the camera HTTP Get counters
+def report():
+    with _lock:
+        s = dict(_stats)
+    return str(s['gets']) + ' camera HTTP Gets, ' + str(s['hedged']) + ' hedged, ' + str(s['hedge_won']) + ' won by the second Get, ' + str(s['timeouts']) + ' out of time.'
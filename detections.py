@@ -0,0 +1,170 @@
+#! python3
+# detections.py - Keep every LookOut result as a structured record and query hit rates and latency over months
+# Last update: 20261018: parse each LookOut response once, insert-only sqlite store with batched writes and indexes
+# Developer: @roboticscats, @jiansuo
+# usage: python detections.py [detections.db] [hits|latency|recent] [camera]
+import re, sys, json, time, queue, sqlite3, threading, metrics
+from contextlib import closing
+from pathlib import Path
+
+# the store file
+store_path = Path.home()/Path('Documents/python/detections.db')
+# records written in one transaction, and the most seconds a record waits to be written
+batch_size = 200
+flush_interval = 5.0
+# most records waiting in memory, add() never waits for a free place
+queue_size = 10000
+
+schema = [
+    'CREATE TABLE IF NOT EXISTS detections (ts REAL NOT NULL, camera TEXT NOT NULL, preset TEXT NOT NULL, heading REAL, fov REAL, score REAL, latency REAL, status INTEGER, bytes INTEGER)',
+    'CREATE INDEX IF NOT EXISTS detections_camera_preset_ts ON detections (camera, preset, ts)',
+    'CREATE INDEX IF NOT EXISTS detections_ts ON detections (ts)',
+]
+fields = ('ts', 'camera', 'preset', 'heading', 'fov', 'score', 'latency', 'status', 'bytes')
+
+# highest score of a LookOut response, None if there is no detection (or no response)
+def score(response):
+    if response is None or response.status_code != 200:
+        return None
+    text = response.text
+    if 'score' not in text:
+        return None
+    try:
+        result = json.loads(text)
+        items = result if isinstance(result, list) else result.get('detections', [result])
+        known = [item for item in items if isinstance(item, dict) and 'score' in item]
+        # the JSON we know: detections with a null score, or none at all, are no detection
+        if known or not items:
+            scores = [float(item['score']) for item in known if item['score'] is not None]
+            return max(scores) if scores else None
+    except Exception:
+        pass
+    # not the JSON we know, take the first number after score
+    found = re.search(r'score\W*([0-9.]+)', text)
+    return float(found.group(1)) if found else 1.0
+
+# open the store and make the table and indexes
+def connect(path=None):
+    path = Path(path or store_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30)
+    # readers do not block the writer, a crash loses at most the last transaction
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+# appends records to the store from a background thread in batches
+class DetectionStore:
+    # name labels the gauges of this store in metrics, default detections-1, detections-2, ...
+    def __init__(self, path=None, batch_size=None, flush_interval=None, name=None):
+        g = globals()
+        self.path = Path(path or g['store_path'])
+        self.batch_size = batch_size or g['batch_size']
+        self.flush_interval = flush_interval or g['flush_interval']
+        self.queue = queue.Queue(queue_size)
+        self.stats = {'records': 0, 'written': 0, 'batches': 0, 'dropped': 0}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+        self.name = name or metrics.queue_name('detections')
+        metrics.gauge('detection_store_queue', self.queue.qsize, queue=self.name)
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats[key] + n
+
+    # queue one record without waiting. ts is the UTC time of the image in seconds, latency the seconds from image to result
+    def add(self, camera, preset='', heading=None, fov=None, ts=None, score=None, latency=None, status=None, nbytes=None):
+        try:
+            self.queue.put_nowait((time.time() if ts is None else ts, camera, str(preset), heading, fov, score, latency, status, nbytes))
+            self.count('records')
+        except queue.Full:
+            self.count('dropped')
+
+    def writer(self):
+        try:
+            conn = connect(self.path)
+        except Exception as e:
+            print(f"Error: {e}")
+            return
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    with conn:
+                        conn.executemany('INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                    self.count('written', len(batch))
+                    self.count('batches')
+                except Exception as e:
+                    print(f"Error: {e}")
+                    self.count('dropped', len(batch))
+        conn.close()
+
+    # write the waiting records, then stop
+    def close(self, timeout=30):
+        self.queue.put(None)
+        self.thread.join(timeout)
+        metrics.drop_gauges(self.name)
+
+    # one line report of the store counters
+    def report(self):
+        with self.lock:
+            s = dict(self.stats)
+        return str(s['written']) + ' detection records written in ' + str(s['batches']) + ' batches to ' + str(self.path) + ', ' + str(s['dropped']) + ' dropped.'
+
+# the where clause and values of the common query filters
+def where(camera=None, preset=None, since=None, until=None):
+    clauses, values = ['status = 200'], []
+    for clause, value in (('camera = ?', camera), ('preset = ?', preset), ('ts >= ?', since), ('ts < ?', until)):
+        if value is not None:
+            clauses.append(clause)
+            values.append(value)
+    return ' WHERE ' + ' AND '.join(clauses), values
+
+# images, hits and hit rate of each camera and preset: list of dicts
+def hit_rates(path=None, camera=None, since=None, until=None):
+    clause, values = where(camera, None, since, until)
+    with closing(connect(path)) as conn:
+        rows = conn.execute('SELECT camera, preset, COUNT(*), COUNT(score) FROM detections' + clause + ' GROUP BY camera, preset ORDER BY camera, preset', values).fetchall()
+    return [{'camera': c, 'preset': p, 'images': n, 'hits': h, 'rate': round(h / n, 4) if n else None} for c, p, n, h in rows]
+
+# latency of each bucket of seconds (default a day): list of dicts of the bucket start time, images, mean and max latency
+def latency_trend(path=None, camera=None, preset=None, since=None, until=None, bucket=86400):
+    clause, values = where(camera, preset, since, until)
+    with closing(connect(path)) as conn:
+        rows = conn.execute('SELECT CAST(ts / ? AS INTEGER) * ? AS start, COUNT(latency), AVG(latency), MAX(latency) FROM detections' + clause + ' GROUP BY start ORDER BY start', [bucket, bucket] + values).fetchall()
+    return [{'start': start, 'images': n, 'mean': round(mean, 3) if mean is not None else None, 'max': round(high, 3) if high is not None else None} for start, n, mean, high in rows]
+
+# the last hits of a camera, newest first: list of dicts
+def recent_hits(path=None, camera=None, limit=20):
+    clause, values = where(camera)
+    with closing(connect(path)) as conn:
+        rows = conn.execute('SELECT ' + ', '.join(fields) + ' FROM detections' + clause + ' AND score IS NOT NULL ORDER BY ts DESC LIMIT ?', values + [limit]).fetchall()
+    return [dict(zip(fields, row)) for row in rows]
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) >= 2 else store_path
+    query = sys.argv[2] if len(sys.argv) >= 3 else 'hits'
+    camera = sys.argv[3] if len(sys.argv) >= 4 else None
+    if query == 'latency':
+        rows = latency_trend(path, camera)
+    elif query == 'recent':
+        rows = recent_hits(path, camera)
+    else:
+        rows = hit_rates(path, camera)
+    for row in rows:
+        print(json.dumps(row))
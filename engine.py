@@ -0,0 +1,609 @@
+#! python3
+# engine.py - LookOut Messenger as a library: a webpage camera or an AXIS PTZ guard tour you can run one cycle at a time
+# Last update: 20261018: importable engine, no work at import, optional modules imported only when used, tour planner, frame archive,
+#              the one detection cycle of messenger.py, messenger-ptz.py and fleet.py, per camera concurrency limit,
+#              uploads of a guard tour as streams of one HTTP/2 connection
+# Developer: @roboticscats, @jiansuo
+#
+# usage:
+#   import engine
+#   tour = engine.GuardTour({'name':..., 'cameraUrl':..., 'guardtour':[...]}, location='Asia/Hong_Kong')
+#   tour.run(3)
+#   tour.save_summary('summary-wwf.txt')
+import time, datetime, threading, pytz
+import weather, overlay, httppool, ptz, uploadqueue, changedetect, metrics, scheduler, deadline
+
+# settings of an engine left as None in its constructor
+Flag_Overlay = True
+Flag_Weather = False
+Flag_SMS = False
+Flag_Adaptive = False
+# visit presets that scored recently or look hazy or smoky more often than quiet ones, see planner.py
+Flag_Planner = False
+# keep the uploaded frames of the last days on disk to review and replay, see archive.py
+Flag_Archive = False
+# 'threads' posts each image of a guard tour on its own pooled keep-alive connection, 'http2' posts them as streams
+# of one HTTP/2 connection per LookOut host, see http2pool.py. A camera may set its own 'upload'
+uploadMode = 'threads'
+location = 'UTC'
+# font to draw text on image, loaded at the first overlay
+FontPath = '/usr/share/fonts/truetype/freefont/FreeMonoBold.ttf'
+FontSize = 20
+# seconds the start waits for the first weather info, 0 draws '' until the background call is done
+weather_wait = 0
+# most images of a camera in flight at the same time, from the HTTP Get through the overlay to the end of the HTTP Post.
+# A camera may set its own 'concurrency'. A camera whose uploads are slow waits for its own slots, it cannot fill
+# the upload queue shared with other cameras
+concurrency = 2
+
+_fonts = {}
+_fonts_lock = threading.Lock()
+
+# the overlay font of a path and size, loaded once. Falls back to the Pillow default font when the file is missing
+def load_font(path, size):
+    with _fonts_lock:
+        font = _fonts.get((path, size))
+        if font is None:
+            from PIL import ImageFont
+            try:
+                font = ImageFont.truetype(path, size)
+            except Exception as e:
+                print(f"Error: {e}")
+                font = ImageFont.load_default()
+            _fonts[(path, size)] = font
+        return font
+
+# settings and state shared by the webpage camera and the guard tour.
+# camera is a dict in the format of fleet.cameras. uploads, store, sms, archive and images (imagepool.ImagePool drawing
+# the overlay in worker processes) may be shared by many engines, an engine closes only the ones it made itself
+class Engine:
+    summary_file = 'summary.txt'
+
+    def __init__(self, camera, location=None, Flag_Overlay=None, Flag_Weather=None, Flag_SMS=None, Flag_Adaptive=None, Flag_Planner=None, Flag_Archive=None,
+                 font_path=None, font_size=None, position=(20, 30), uploads=None, store=None, sms=None, archive=None, images=None):
+        g = globals()
+        self.camera = camera
+        self.name = camera['name']
+        self.interval = camera.get('interval', 60)
+        self.location = location or g['location']
+        self.flags = {'overlay': g['Flag_Overlay'] if Flag_Overlay is None else Flag_Overlay,
+                      'weather': g['Flag_Weather'] if Flag_Weather is None else Flag_Weather,
+                      'sms': g['Flag_SMS'] if Flag_SMS is None else Flag_SMS,
+                      'adaptive': g['Flag_Adaptive'] if Flag_Adaptive is None else Flag_Adaptive,
+                      'planner': g['Flag_Planner'] if Flag_Planner is None else Flag_Planner,
+                      'archive': g['Flag_Archive'] if Flag_Archive is None else Flag_Archive}
+        self.font_path = font_path or g['FontPath']
+        self.font_size = font_size or g['FontSize']
+        self.position = position
+        self.uploads = uploads
+        self.store = store
+        self.sms = sms
+        self.archive = archive
+        self.images = images
+        # digest auth of the camera, shared by every request to it
+        self.auth = httppool.digest_auth(camera['username'], camera['password'], camera.get('cameraUrl') or camera.get('inputUrl', '')) if 'username' in camera else None
+        self.owned = []
+        self.site = None
+        self.weather_now = ''
+        self.schedule = None
+        self.changes = None
+        self.planner = None
+        # time budget of the cycle running now
+        self.cycle = None
+        self.started = False
+        self.utc_start = None
+        self.min_cycle_time = 180.0
+        # cycles of the current run, None runs until stopped
+        self.max_cycles = None
+        self.stats = {'cycles': 0, 'visits': 0, 'uploads': 0, 'detections': 0, 'failures': 0, 'throttled': 0}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(camera.get('concurrency', g['concurrency']))
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats[key] + n
+
+    # local time string of now
+    def local_now(self, fmt='%Y-%m-%d %H:%M:%S'):
+        return pytz.utc.localize(datetime.datetime.utcnow()).astimezone(pytz.timezone(self.location)).strftime(fmt)
+
+    # make the shared services this engine needs and were not given. run_cycle() starts the engine when needed
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self.utc_start = pytz.utc.localize(datetime.datetime.utcnow())
+        if self.flags['weather']:
+            self.weather_now = weather.current(self.camera['latitude'], self.camera['longitude'], wait=weather_wait)
+        if self.store is None:
+            # every LookOut result is kept in the detection store, query it with detections.py
+            import detections
+            self.store = detections.DetectionStore()
+            self.owned.append(self.store)
+        if self.sms is None and self.flags['sms']:
+            # SMS alerts are sent in the background, at most one every alerts.cooldown seconds
+            import alerts
+            self.sms = alerts.AlertDispatcher()
+            self.owned.append(self.sms)
+        if self.archive is None and self.flags['archive']:
+            # uploaded frames are kept in a ring of segment files, list and replay them with archive.py
+            import archive
+            self.archive = archive.FrameArchive()
+            self.owned.append(self.archive)
+        if self.flags['adaptive']:
+            # upload encoding state of this site, measured from the HTTP Post timings
+            import bandwidth
+            self.site = bandwidth.site(self.camera.get('site', self.name))
+        # skip images not changed since the last upload
+        self.changes = changedetect.ChangeDetector(self.camera.get('threshold', changedetect.threshold))
+        self.schedule = scheduler.Scheduler(self.camera.get('missed'))
+
+    # weather info from the cache, refreshed in the background
+    def update_weather(self):
+        if self.flags['weather']:
+            self.weather_now = weather.current(self.camera['latitude'], self.camera['longitude'])
+        return self.weather_now
+
+    # draw the header and encode the image in the resolution and jpeg quality that fit the uplink.
+    # Return the new image bytes, None if the image is broken
+    def encode(self, image_data, local_time, frames, preset=''):
+        step, scale, jpeg_quality = self.site.choose(len(image_data), frames, self.interval, self.name) if self.site is not None else (0, 1.0, None)
+        size = len(image_data)
+        if self.flags['overlay']:
+            # write 'roboticscats.com | local time | weather' on the image top left corner
+            draw = self.images.overlay if self.images is not None else overlay.renderer(load_font(self.font_path, self.font_size), self.position).overlay
+            with metrics.timer('overlay', self.name, preset):
+                image_data = draw(image_data, local_time, self.weather_now, scale, jpeg_quality)
+        elif step > 0:
+            with metrics.timer('overlay', self.name, preset):
+                image_data = overlay.reencode(image_data, scale, jpeg_quality) or image_data
+        if image_data is not None and self.site is not None:
+            self.site.encoded(step, size, len(image_data))
+        return image_data
+
+    # count and store the result of an upload, and queue an SMS alert if LookOut detects wildfire.
+    # started is the time.perf_counter() before the HTTP Get of the image
+    def record(self, response, started, nbytes, preset='', heading=None, fov=None, detail='', note=''):
+        import detections
+        # frame latency from HTTP Get of the image to the LookOut result
+        latency = time.perf_counter() - started
+        metrics.observe('frame', latency, self.name, preset)
+        score = detections.score(response)
+        self.store.add(self.name, preset, heading, fov, time.time() - latency, score, latency, response.status_code if response is not None else None, nbytes)
+        if response is None or response.status_code != 200:
+            self.count('failures')
+            return score
+        self.count('uploads')
+        if score is not None:
+            self.count('detections')
+            if self.sms is not None:
+                self.sms.alert(self.name, detail, note)
+        if self.planner is not None:
+            self.planner.record(preset, score)
+        return score
+
+    # take a slot of this camera for one image, waiting at most until the deadline. Return False if no slot was free
+    def acquire(self, until=None):
+        remaining = until.remaining() if until is not None else None
+        if self.slots.acquire(timeout=remaining):
+            return True
+        print('No free slot of ' + self.name + ', ' + str(self.camera.get('concurrency', concurrency)) + ' images in flight.')
+        self.count('throttled')
+        return False
+
+    # the time budget of a cycle starting now: it has to be done by the next tick
+    def begin_cycle(self):
+        self.cycle = deadline.Deadline(self.interval * deadline.cycle_share if self.interval > 0 else None)
+        return self.cycle
+
+    # stop the cycle running now, e.g. from another thread: HTTP calls in flight drop their connections
+    def cancel(self):
+        if self.cycle is not None:
+            self.cycle.cancel()
+
+    # time of a finished run_cycle(). utc_now is its start time, visits the images it took.
+    # cycle_start is the start time of the detection cycle it completes, None if the cycle is not complete yet
+    def end_cycle(self, utc_now, visits, cycle_start=None):
+        self.cycle.cancel()
+        utc_last = pytz.utc.localize(datetime.datetime.utcnow())
+        dt = utc_last - utc_now
+        metrics.observe('cycle', dt.total_seconds(), self.name)
+        self.count('visits', visits)
+        if cycle_start is not None:
+            seconds = round((utc_last - cycle_start).total_seconds(), 2)
+            if self.min_cycle_time > seconds:
+                self.min_cycle_time = seconds
+            self.count('cycles')
+        return dt
+
+    # run cycles until max_cycles are done (None runs until stop is set), then close
+    def run(self, max_cycles=None, stop=None):
+        self.max_cycles = max_cycles
+        try:
+            while (max_cycles is None or self.stats['cycles'] < max_cycles) and not (stop is not None and stop.is_set()):
+                self.run_cycle()
+        finally:
+            self.close()
+
+    # wait for the last uploads, then send the last SMS alert and write the last detection records
+    def close(self):
+        if self.schedule is not None:
+            self.schedule.release()
+        for service in self.owned:
+            service.close()
+        self.owned = []
+
+    # lines of the detection cadence report
+    def cadence_lines(self):
+        return self.schedule.report_lines() if self.schedule is not None else []
+
+class Messenger(Engine):
+    summary_file = 'summary.txt'
+
+    def start(self):
+        if self.started:
+            return
+        super().start()
+        # detection ticks every interval seconds on the monotonic clock, a slow cycle does not push later ticks back
+        self.schedule.add(self.name, self.interval)
+
+    # wait till the next detection tick, get the image, draw the header and HTTP Post it to LookOut.
+    # Return the LookOut response, None if the image was not uploaded
+    def run_cycle(self):
+        self.start()
+        name = self.name
+        inputUrl = self.camera['inputUrl']
+        self.schedule.sleep()
+        self.schedule.due()
+        metrics.observe('late', self.schedule.start(name), name)
+
+        utc_now = pytz.utc.localize(datetime.datetime.utcnow())
+        location_now_str = utc_now.astimezone(pytz.timezone(self.location)).strftime('%Y-%m-%d-%H:%M:%S')
+        cycle = self.begin_cycle()
+
+        # sanity check
+        print('Detection cycle #' + str(self.stats['cycles'] + 1) + ('/' + str(self.max_cycles) if self.max_cycles else '') + ' : ' + location_now_str)
+
+        # conditional HTTP Get of the image, no-cache asks caches on the way to check the latest image with the webpage.
+        # It may take deadline.get_share of the cycle budget, the HTTP Post has the rest
+        result = None
+        res = None
+        started = time.perf_counter()
+        # a slot of this camera from the HTTP Get to the end of the HTTP Post
+        slot = self.acquire(cycle)
+        try:
+            if slot:
+                with metrics.timer('get', name):
+                    res = deadline.get(inputUrl, name, cycle.child(cycle.remaining() * deadline.get_share) if cycle.remaining() is not None else cycle, auth=self.auth, headers=self.changes.headers(inputUrl))
+        except Exception as exc:
+            print('There was a problem: %s' % (exc))
+
+        if res is None:
+            self.count('failures')
+
+        # if the image is the same as the last upload, skip overlay and HTTP Post
+        elif res.status_code in (200, 304) and not self.changes.changed(inputUrl, res):
+            print('Image not changed since the last upload.')
+
+        # if HTTP Get successes
+        elif res.status_code == 200:
+            self.update_weather()
+            # Keep the downloaded image in memory and write header on the image top left corner
+            # in the resolution and jpeg quality that fit the uplink
+            image_data = self.encode(res.content, location_now_str, 1)
+            if self.site is not None and image_data is not None:
+                print('Upload encoding of ' + self.site.report())
+            if image_data and self.archive is not None:
+                self.archive.add(name, '', image_data)
+
+            # if downloaded image is ready, then HTTP Post image to LookOut
+            if image_data:
+                import uploadimage
+                with metrics.timer('post', name) as post_timer:
+                    result = uploadimage.upload_image(self.camera['lookout'], image_data, cycle)
+                if result is not None and result.status_code == 200 and self.site is not None:
+                    self.site.record(len(image_data), post_timer.seconds)
+                self.record(result, started, len(image_data), detail='at ' + location_now_str, note='Current weather: ' + self.weather_now)
+            else:
+                self.count('failures')
+
+        else:
+            self.count('failures')
+
+        if slot:
+            self.slots.release()
+        dt = self.end_cycle(utc_now, 1, utc_now)
+
+        # sanity check
+        print('Result from LookOut: ' + (result.text if result is not None else 'N/A'))
+        print('Time used in second: ' + str(round((dt.total_seconds()),2)) + '\n')
+
+        self.schedule.finish(name)
+        return result
+
+    # save detection information of the run
+    def save_summary(self, path=None):
+        utc_last = pytz.utc.localize(datetime.datetime.utcnow())
+        location_start = self.utc_start.astimezone(pytz.timezone(self.location))
+        location_last_str = utc_last.astimezone(pytz.timezone(self.location)).strftime('%Y-%m-%d %H:%M:%S')
+        time_spent = utc_last - self.utc_start
+        with open(path or self.summary_file, mode='w') as file_object:
+            print('LookOut Messenger mission completed.\n', file=file_object)
+            print('LookOut camera: ' + self.name, file=file_object)
+            print('Detection interval: ' + str(self.interval) + ' seconds\n', file=file_object)
+            print('Start time: ' + location_start.strftime('%Y-%m-%d %H:%M:%S') + ', ' + self.location, file=file_object)
+            print('Last time: ' + location_last_str + ', ' + self.location +'\n', file=file_object)
+            print(str(self.stats['cycles']) + ' detection cycles made in the last ' + str(int(time_spent.total_seconds())) + ' seconds.', file=file_object)
+            print(str(self.stats['detections']) + ' images with positives.', file=file_object)
+            print(str(self.stats['failures']) + ' fail image uploads.', file=file_object)
+            print(self.changes.report(), file=file_object)
+            print(httppool.report(), file=file_object)
+            print(deadline.report(), file=file_object)
+            if self.sms is not None:
+                print(self.sms.report(), file=file_object)
+            print(self.store.report(), file=file_object)
+            if self.archive is not None:
+                print(self.archive.report(), file=file_object)
+            print('Detection cadence:', file=file_object)
+            for line in self.cadence_lines():
+                print(line, file=file_object)
+        return location_last_str
+
+class GuardTour(Engine):
+    summary_file = 'summary-wwf.txt'
+
+    def __init__(self, camera, *args, **kwargs):
+        super().__init__(camera, *args, **kwargs)
+        self.guardtour = camera['guardtour']
+        self.cameraUrl = camera['cameraUrl']
+        self.stream = None
+        # camera position where the last preset settled, None if unknown
+        self.settled_position = None
+        # time.monotonic() when the camera last settled, a stream frame older than this may be taken while moving
+        self.settled_time = 0.0
+        # preset the camera was last sent to, and if it may still be moving there
+        self.target = None
+        self.moving = False
+        # positions visited in the guard tour cycle going on and when it started. Presets may be due at different
+        # times, e.g. with the tour planner, a cycle is done when every preset has been visited once
+        self.toured = set()
+        self.tour_start = None
+
+    def start(self):
+        if self.started:
+            return
+        super().start()
+        if self.uploads is None:
+            # fixed pool of upload workers behind a bounded queue, images are spooled to disk while LookOut is down
+            post, workers = None, None
+            if self.camera.get('upload', uploadMode) == 'http2':
+                # the images of a whole tour are in flight on one connection, the workers only wait for their streams
+                import http2pool
+                post, workers = http2pool.post_image, max(uploadqueue.workers, len(self.guardtour))
+            self.uploads = uploadqueue.UploadQueue(workers=workers, post=post, on_post=lambda camera, nbytes, seconds: self.site.record(nbytes, seconds) if self.site is not None else None,
+                                                   on_result=lambda camera, *args: self.record_spooled(camera, *args) if camera == self.name else None)
+            self.owned.insert(0, self.uploads)
+        if self.camera.get('capture') == 'stream':
+            # one MJPEG stream of the camera kept open in the background
+            import mjpeg
+            self.stream = mjpeg.StreamGrabber(self.cameraUrl, self.auth, self.name)
+            self.owned.append(self.stream)
+        if self.flags['planner'] or self.camera.get('planner'):
+            # preset intervals from recent LookOut scores, the detection store history and a pre-screen of each frame
+            import planner
+            self.planner = planner.Planner(self.name, self.guardtour, self.interval)
+            self.planner.seed(self.store.path)
+        # each preset is due every interval seconds on the monotonic clock, presets due together make one guard tour cycle
+        for position in range(len(self.guardtour)):
+            self.schedule.add(position, self.guardtour[position].get('interval', self.interval))
+        # the first move of the guard tour, later moves start as soon as the image of the previous preset is taken
+        if len(self.guardtour) > 1:
+            self.goto(self.schedule.peek()[1])
+
+    # move the AXIS camera to a specific position in the guardtour. Return True if the camera took the command,
+    # after a failed move the target is unknown and the next settle() sends the camera again
+    def goto(self, position, until=None):
+        status = ptz.movetopreset(self.cameraUrl, self.guardtour[position]['preset'], self.auth, until)
+        if status is None or status >= 400:
+            self.target = None
+            return False
+        self.target = position
+        self.moving = True
+        return True
+
+    # wait for camera to settle at the preset, at most the PTZ movement time and never past until.
+    # Return False if the camera could not be sent to the preset
+    def settle(self, position, until):
+        if len(self.guardtour) > 1:
+            if self.target != position and not self.goto(position, until):
+                return False
+            if self.moving:
+                self.settled_position = ptz.wait_settled(self.cameraUrl, self.auth, self.guardtour[position]['ptz'], self.settled_position, until)
+                self.moving = False
+                self.settled_time = time.monotonic() - ptz.poll_interval
+        else:
+            time.sleep(until.limit(self.guardtour[position]['ptz']))
+            self.settled_time = time.monotonic()
+        return True
+
+    # HTTP Get image from an AXIS visual camera by until: the newest frame of the stream if it arrived after the camera settled,
+    # otherwise HTTP Get of image.cgi. Return the response or None
+    def capture(self, until):
+        try:
+            res = None
+            if self.stream is not None:
+                import mjpeg
+                res = self.stream.capture(self.settled_time, until.limit(mjpeg.capture_timeout))
+            if res is None:
+                res = deadline.get(self.cameraUrl + '/axis-cgi/jpg/image.cgi?resolution=1920X1080', self.name, until, auth=self.auth)
+            return res
+        except Exception as exc:
+            print('There was a problem: %s' % (exc))
+            return None
+
+    # record the result of a queued upload. A spooled image is recorded when it is sent from the spool, see record_spooled()
+    def uploaded(self, future, started, nbytes, preset, detail, note):
+        if not getattr(future, 'spooled', False):
+            self.record(future.result(), started, nbytes, preset['preset'], preset['heading'], preset['FOV'], detail, note)
+
+    # record the LookOut response of an image of preset sent from the disk spool, ts is the UTC time it was queued.
+    # The detection store, the SMS alert and the planner see its score like that of any other upload
+    def record_spooled(self, camera, preset, response, ts, nbytes):
+        ts = time.time() if ts is None else ts
+        p = next((p for p in self.guardtour if p['preset'] == preset), {})
+        local_time = datetime.datetime.fromtimestamp(ts, pytz.timezone(self.location)).strftime('%Y-%m-%d %H:%M:%S')
+        started = time.perf_counter() - (time.time() - ts)
+        return self.record(response, started, nbytes, preset, p.get('heading'), p.get('FOV'), str(preset) + ' at ' + local_time, 'Sent from the upload spool.')
+
+    # wait till the next presets are due and run them in guard tour order: move the camera, get, draw and queue the images.
+    # Return a list of (preset, Future of the LookOut response) of the images uploaded
+    def run_cycle(self):
+        self.start()
+        name = self.name
+        guardtour = self.guardtour
+
+        # wait till the next preset is due, presets due within scheduler.slack seconds join this cycle in guard tour order
+        self.schedule.sleep()
+        positions = sorted(self.schedule.due(scheduler.slack))
+
+        utc_now = pytz.utc.localize(datetime.datetime.utcnow())
+        location_now_str = utc_now.astimezone(pytz.timezone(self.location)).strftime('%Y-%m-%d %H:%M:%S')
+        cycle = self.begin_cycle()
+        if self.tour_start is None:
+            self.tour_start = utc_now
+        # True if these presets complete the guard tour cycle, and if that is the last cycle of the run
+        complete = len(self.toured | set(positions)) == len(guardtour)
+        last = complete and self.max_cycles is not None and self.stats['cycles'] + 1 >= self.max_cycles
+
+        futures = []
+        for n, position in enumerate(positions):
+            preset = guardtour[position]['preset']
+            position_loc_now_str = self.local_now()
+            # each preset may take its share of what is left of the cycle budget, a hung camera does not starve the others
+            until = cycle.child(cycle.remaining() / (len(positions) - n)) if cycle.remaining() is not None else cycle
+
+            with metrics.timer('ptz', name, preset):
+                ready = self.settle(position, until)
+            metrics.observe('late', self.schedule.start(position), name, preset)
+
+            started = time.perf_counter()
+            res = None
+            # a slot of this camera from the HTTP Get until the HTTP Post of the image is done
+            slot = ready and self.acquire(until)
+            if slot:
+                with metrics.timer('get', name, preset):
+                    res = self.capture(until)
+            self.schedule.finish(position)
+
+            # move the camera to the next preset while this image is drawn and uploaded,
+            # after the last preset of this cycle to the preset due first in the next cycle.
+            # That move has the PTZ movement time of the preset, what is left of this cycle may be nearly spent
+            if n + 1 < len(positions):
+                next_position = positions[n + 1]
+            elif not last:
+                next_position = self.schedule.peek()[1]
+            else:
+                next_position = None
+            if len(guardtour) > 1 and next_position is not None and next_position != self.target:
+                self.goto(next_position, cycle if n + 1 < len(positions) else deadline.Deadline(guardtour[next_position]['ptz']))
+
+            if res is None or res.status_code != 200:
+                self.count('failures')
+
+            # if the image is the same as the last upload of this preset, skip overlay and HTTP Post
+            elif not self.changes.changed(preset, res):
+                pass
+
+            else:
+                if self.planner is not None:
+                    with metrics.timer('screen', name, preset):
+                        self.planner.screen(preset, res.content)
+                self.update_weather()
+                # the upload resolution and jpeg quality that fit the whole guard tour into the uplink
+                image_data = self.encode(res.content, position_loc_now_str, len(guardtour), preset) if len(res.content) > 0 else None
+                if image_data is None and len(res.content) > 0:
+                    image_data = res.content
+                if image_data:
+                    if self.archive is not None:
+                        self.archive.add(name, preset, image_data)
+                    detail = str(preset) + ' at ' + location_now_str
+                    note = 'Weather: ' + self.weather_now if self.weather_now else ''
+                    # the image is posted before the next image of the preset is due, or goes to the disk spool
+                    interval = guardtour[position].get('interval', self.interval)
+                    try:
+                        # upload workers achieve concurrent network uploads, the guard tour does not wait for them
+                        future = self.uploads.submit(guardtour[position]['lookout'], image_data, name, preset, deadline.Deadline(interval) if interval > 0 else None)
+                        # the upload worker frees the slot when the HTTP Post is done
+                        future.add_done_callback(lambda future: self.slots.release())
+                        slot = False
+                        future.add_done_callback(lambda future, position=position, started=started, nbytes=len(image_data), detail=detail, note=note:
+                                                 self.uploaded(future, started, nbytes, guardtour[position], detail, note))
+                        futures.append((preset, future))
+                    except Exception as e:
+                        print(f"Error3: {e}")
+                        self.count('failures')
+                else:
+                    self.count('failures')
+            if slot:
+                self.slots.release()
+
+        self.toured.update(positions)
+        self.end_cycle(utc_now, len(positions), self.tour_start if complete else None)
+        if complete:
+            self.toured = set()
+            self.tour_start = None
+
+        # presets waiting for their next visit move to the intervals planned from the scores and frames so far
+        if self.planner is not None:
+            intervals = self.planner.plan()
+            for position in range(len(guardtour)):
+                self.schedule.retime(position, intervals[guardtour[position]['preset']])
+
+        # upload encoding chosen in this cycle
+        if self.site is not None:
+            print('Cycle ' + str(self.stats['cycles']) + ' upload encoding of ' + self.site.report())
+        return futures
+
+    # save detection information of the run
+    def save_summary(self, path=None):
+        utc_last = pytz.utc.localize(datetime.datetime.utcnow())
+        location_start = self.utc_start.astimezone(pytz.timezone(self.location))
+        location_last_str = utc_last.astimezone(pytz.timezone(self.location)).strftime('%Y-%m-%d %H:%M:%S')
+        time_spent = utc_last - self.utc_start
+        with open(path or self.summary_file, mode='w') as file_object:
+            print('LookOut Messenger mission completed.\n', file=file_object)
+
+            print('LookOut camera: ' + self.name, file=file_object)
+            print('Detection interval: ' + str(self.interval) + ' seconds', file=file_object)
+            print('Guard tour cycle: ' + str(self.max_cycles or self.stats['cycles']) + '\n', file=file_object)
+
+            print('Start time: ' + location_start.strftime('%Y-%m-%d %H:%M:%S') + ', ' + self.location, file=file_object)
+            print('Last time: ' + location_last_str + ', ' + self.location +'\n', file=file_object)
+
+            print(str(self.stats['cycles']) + ' guard tour cycles made in the last ' + str(int(time_spent.total_seconds())) + ' seconds.', file=file_object)
+            print(str(self.stats['visits']) + ' preset visits, a cycle is done when every preset has been visited once.', file=file_object)
+            print('Fastest cycle is ' + str(self.min_cycle_time) + ' seconds.', file=file_object)
+            print(str(self.stats['uploads']) + ' image uploads and ' + str(self.stats['failures']) + ' upload failure.', file=file_object)
+            print(self.changes.report(), file=file_object)
+            print(str(self.stats['detections']) + ' images with positives.', file=file_object)
+            print(self.uploads.report(), file=file_object)
+            if self.camera.get('upload', uploadMode) == 'http2':
+                import http2pool
+                print(http2pool.report(), file=file_object)
+            if self.site is not None:
+                print('Upload encoding of ' + self.site.report() + ' Images by scale/quality: ' + str(self.site.usage()), file=file_object)
+            if self.sms is not None:
+                print(self.sms.report(), file=file_object)
+            print(self.store.report(), file=file_object)
+            if self.archive is not None:
+                print(self.archive.report(), file=file_object)
+            if self.stream is not None:
+                print(self.stream.report(), file=file_object)
+            print(httppool.report(), file=file_object)
+            print(deadline.report(), file=file_object)
+            print('\nDetection cadence of each preset:', file=file_object)
+            if self.planner is not None:
+                print(self.planner.report_line(), file=file_object)
+            for position, r in self.schedule.report().items():
+                print(self.guardtour[position]['preset'] + ': target ' + str(r['target']) + ' s, actual ' + str(r['actual']) + ' s, ' + str(r['per_hour']) + ' visits per hour, ' + str(r['ticks']) + ' visits, ' + str(r['missed']) + ' missed, ' + str(r['late_max']) + ' s latest start.', file=file_object)
+        return location_last_str
@@ -0,0 +1,299 @@
+#! python3
+# fakeservers.py - Local stand-ins of an AXIS camera, LookOut and OpenWeather for testing and benchmarks
+# Last update: 20261018: digest auth AXIS camera with MJPEG stream, LookOut endpoint, One Call stub
+#              LookOut endpoint also over HTTP/2 with prior knowledge
+# Developer: @roboticscats, @jiansuo
+import io, json, time, random, socket, hashlib, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+
+# flow control window in bytes of the HTTP/2 LookOut endpoint, for each stream and for the connection. 65535 is the HTTP/2 default,
+# a larger image waits for window updates
+h2_window = 65535
+
+# number of different jpeg frames a fake camera rotates through, so frames are not skipped as unchanged
+frame_variants = 8
+
+# different noise jpeg frames of a size
+def make_frames(size=(1920, 1080), count=frame_variants, quality=85):
+    frames = []
+    for i in range(count):
+        # smooth noise looks more like a landscape than pixel noise, and encodes to a camera-like jpeg size
+        small = (max(size[0] // 8, 1), max(size[1] // 8, 1))
+        image = Image.merge('RGB', [Image.effect_noise(small, 40 + 5 * i).point(lambda v, c=c: min(255, v + c)) for c in (0, 20, 40)]).resize(size, Image.BICUBIC)
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality)
+        frames.append(output.getvalue())
+    return frames
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+# an AXIS camera with digest auth: /axis-cgi/jpg/image.cgi, /axis-cgi/mjpg/video.cgi, /axis-cgi/com/ptz.cgi
+class AxisHandler(QuietHandler):
+    def authorized(self):
+        server = self.server
+        auth = self.headers.get('Authorization', '')
+        if auth.startswith('Digest '):
+            fields = {}
+            for part in auth[7:].split(','):
+                key, _, value = part.strip().partition('=')
+                fields[key] = value.strip('"')
+            md5 = lambda text: hashlib.md5(text.encode()).hexdigest()
+            ha1 = md5(server.username + ':' + server.realm + ':' + server.password)
+            ha2 = md5(self.command + ':' + fields.get('uri', ''))
+            expected = md5(ha1 + ':' + fields.get('nonce', '') + ':' + fields.get('nc', '') + ':' + fields.get('cnonce', '') + ':' + fields.get('qop', '') + ':' + ha2)
+            if fields.get('nonce') == server.nonce and fields.get('response') == expected:
+                return True
+        server.count('challenges')
+        self.reply(401, headers={'WWW-Authenticate': 'Digest realm="' + server.realm + '", nonce="' + server.nonce + '", qop="auth", algorithm=MD5'})
+        return False
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        time.sleep(server.latency)
+        if url.path == '/axis-cgi/jpg/image.cgi':
+            server.count('images')
+            with server.lock:
+                slow = server.random.random() < server.tail_rate
+            if slow:
+                # a camera that sometimes stalls, e.g. busy encoding or a lost packet
+                server.count('stalls')
+                time.sleep(server.tail_latency)
+            self.reply(200, server.next_frame(), 'image/jpeg')
+        elif url.path == '/axis-cgi/mjpg/video.cgi':
+            server.count('streams')
+            self.stream(float(query.get('fps', ['10'])[0]))
+        elif url.path == '/axis-cgi/com/ptz.cgi' and 'gotoserverpresetname' in query:
+            server.goto(query['gotoserverpresetname'][0])
+            self.reply(204)
+        elif url.path == '/axis-cgi/com/ptz.cgi' and 'query' in query:
+            self.reply(200, ('pan=%.4f\ntilt=0.0000\nzoom=1\n' % server.pan()).encode())
+        else:
+            self.reply(404)
+
+    # send frames at fps as multipart parts until the client disconnects or the server stops
+    def stream(self, fps):
+        server = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=myboundary')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while not server.stopped:
+                frame = server.next_frame()
+                self.wfile.write(b'--myboundary\r\nContent-Type: image/jpeg\r\nContent-Length: ' + str(len(frame)).encode() + b'\r\n\r\n' + frame + b'\r\n')
+                self.wfile.flush()
+                time.sleep(1.0 / fps)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class AxisServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # tail_rate of the image.cgi requests take tail_latency seconds more
+    def __init__(self, address=('127.0.0.1', 0), username='username', password='password', latency=0.0, move_time=1.0, frames=None, tail_rate=0.0, tail_latency=0.0, seed=1):
+        super().__init__(address, AxisHandler)
+        self.username = username
+        self.password = password
+        self.realm = 'AXIS_FAKE'
+        self.nonce = hashlib.md5(str(random.random()).encode()).hexdigest()
+        self.latency = latency
+        self.move_time = move_time
+        self.frames = frames or make_frames()
+        self.frame = 0
+        self.presets = {}
+        self.move = (0.0, 0.0, 0.0)
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.random = random.Random(seed)
+        self.counts = {'images': 0, 'challenges': 0, 'moves': 0, 'streams': 0, 'stalls': 0}
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts[key] + 1
+
+    def next_frame(self):
+        with self.lock:
+            self.frame = (self.frame + 1) % len(self.frames)
+            return self.frames[self.frame]
+
+    # start moving to a preset, every new preset is 60 degrees further
+    def goto(self, preset):
+        with self.lock:
+            target = self.presets.setdefault(preset, 60.0 * len(self.presets))
+            self.move = (self.pan_at(time.monotonic()), target, time.monotonic())
+            self.counts['moves'] = self.counts['moves'] + 1
+
+    def pan_at(self, now):
+        start, target, started = self.move
+        done = 1.0 if self.move_time <= 0 else min((now - started) / self.move_time, 1.0)
+        return start + (target - start) * done
+
+    def pan(self):
+        with self.lock:
+            return self.pan_at(time.monotonic())
+
+# LookOut endpoint: any POST path, the response has a score with probability score_rate.
+# bandwidth (bytes per second, 0 for no limit) simulates a slow uplink of the camera site
+class LookOutHandler(QuietHandler):
+    def handle(self):
+        self.server.count('connections')
+        # an HTTP/2 client with prior knowledge opens with the connection preface, no HTTP/1.1 method starts with PRI
+        if self.server.http2 and self.connection.recv(3, socket.MSG_PEEK | socket.MSG_WAITALL) == b'PRI':
+            self.handle_h2()
+        else:
+            super().handle()
+
+    def do_POST(self):
+        self.reply(*self.server.answer(self.path, self.read_body()), 'application/json')
+
+    # HTTP/2 without TLS (h2c): each stream is answered in its own thread, so the streams of a connection overlap like the requests of many connections
+    def handle_h2(self):
+        import h2.config, h2.connection, h2.events, h2.exceptions, h2.settings
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        lock = threading.Lock()
+        requests = {}
+
+        def send(write):
+            with lock:
+                try:
+                    write()
+                except h2.exceptions.H2Error:
+                    # the client reset the stream meanwhile
+                    pass
+                data = conn.data_to_send()
+                try:
+                    self.connection.sendall(data)
+                except OSError:
+                    pass
+
+        def answer(stream_id, path, body):
+            status, reply = self.server.answer(path, body)
+            def write():
+                conn.send_headers(stream_id, [(':status', str(status)), ('content-type', 'application/json'), ('content-length', str(len(reply)))])
+                conn.send_data(stream_id, reply, end_stream=True)
+            send(write)
+
+        def start():
+            # the flow control windows of each stream and of the connection
+            conn.initiate_connection()
+            conn.update_settings({h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: h2_window})
+            conn.increment_flow_control_window(h2_window)
+        send(start)
+        while not self.server.stopped:
+            try:
+                data = self.connection.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            with lock:
+                events = conn.receive_data(data)
+            for event in events:
+                if isinstance(event, h2.events.RequestReceived):
+                    requests[event.stream_id] = (dict(event.headers)[b':path'].decode(), [])
+                elif isinstance(event, h2.events.DataReceived):
+                    requests[event.stream_id][1].append(event.data)
+                    send(lambda event=event: conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id))
+                elif isinstance(event, h2.events.StreamEnded):
+                    path, chunks = requests.pop(event.stream_id)
+                    threading.Thread(target=answer, args=(event.stream_id, path, b''.join(chunks)), daemon=True).start()
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+            # settings acknowledgements and pings
+            send(lambda: None)
+
+# http2 True also answers HTTP/2 clients with prior knowledge on the same port, needs the h2 package
+class LookOutServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, score_rate=0.05, fail_rate=0.0, seed=1, bandwidth=0, hot=None, http2=False):
+        super().__init__(address, LookOutHandler)
+        self.latency = latency
+        # score rate of the endpoint paths of presets looking at a fire, the others have score_rate
+        self.hot = hot or {}
+        self.bandwidth = bandwidth
+        self.link_free = 0.0
+        self.score_rate = score_rate
+        self.fail_rate = fail_rate
+        self.http2 = http2
+        self.random = random.Random(seed)
+        self.counts = {'posts': 0, 'bytes': 0, 'connections': 0}
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts[key] + 1
+
+    # status and JSON body of the HTTP Post of image_data to an endpoint path
+    def answer(self, path, image_data):
+        if self.bandwidth:
+            # all posts share one uplink of bandwidth bytes per second, each waits for its turn on the link
+            with self.lock:
+                start = max(time.monotonic(), self.link_free)
+                self.link_free = start + len(image_data) / self.bandwidth
+                done = self.link_free
+            time.sleep(max(done - time.monotonic(), 0))
+        time.sleep(self.latency)
+        with self.lock:
+            self.counts['posts'] = self.counts['posts'] + 1
+            self.counts['bytes'] = self.counts['bytes'] + len(image_data)
+            hit = self.random.random() < self.hot.get(path, self.score_rate)
+            failed = self.random.random() < self.fail_rate
+        if failed:
+            return 503, b'{"error": "busy"}'
+        elif hit:
+            return 200, b'{"score": 0.87, "bbox": [100, 200, 180, 260]}'
+        else:
+            return 200, b'{}'
+
+# OpenWeather One Call API stub: /data/3.0/onecall
+class OneCallHandler(QuietHandler):
+    def do_GET(self):
+        self.server.calls = self.server.calls + 1
+        time.sleep(self.server.latency)
+        body = json.dumps({'lat': 22.0, 'lon': 114.0, 'current': {'temp': 24.36, 'humidity': 78, 'wind_speed': 3.6}}).encode()
+        self.reply(200, body, 'application/json')
+
+class OneCallServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0):
+        super().__init__(address, OneCallHandler)
+        self.latency = latency
+        self.calls = 0
+
+# serve a fake server in the background, return its base url
+def start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://%s:%d' % server.server_address[:2]
+
+def stop(server):
+    server.stopped = True
+    server.shutdown()
+    server.server_close()
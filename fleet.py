@@ -0,0 +1,235 @@
+#! python3
+# fleet.py - Run many LookOut cameras and PTZ guard tours in one process, each camera in its own thread
+# LookOut Messeger (beta) is a free application for LookOut Wildfire Detection SaaS customers
+# Last update: 20261018: one process for a fleet of cameras, tour planner of each guard tour, frame archive,
+#              each camera runs the detection cycle of engine.py in its own thread, started and joined by one event loop,
+#              per camera concurrency limit of its images in flight, uploads as streams of one HTTP/2 connection per LookOut host
+# Developer: @roboticscats, @jiansuo
+import sys, json, datetime, pytz, asyncio
+from concurrent.futures import ThreadPoolExecutor
+import engine, httppool, http2pool, uploadqueue, metrics, alerts, imagepool, detections, deadline, archive
+
+# BELOW this line is customer-specific information
+# The flags to turn on/off of local time overlay, weather info, and SMS alert
+Flag_Overlay = True
+Flag_Weather = False
+Flag_SMS = False
+# The flag to fit the upload resolution and jpeg quality of each site to its uplink, see bandwidth.py for the floors
+Flag_Adaptive = False
+# The flag to visit presets that scored recently or look hazy or smoky more often than quiet ones, see planner.py
+Flag_Planner = False
+# The flag to keep the uploaded frames of the last days on disk to review and replay, see archive.py
+Flag_Archive = False
+# 'threads' posts each image on its own pooled keep-alive connection, 'http2' posts the images of all cameras
+# as streams of one HTTP/2 connection per LookOut host, see http2pool.py
+uploadMode = 'threads'
+# your location for timezone info
+location = 'Asia/Hong_Kong'
+# local port of the metrics endpoint, http://127.0.0.1:9108/metrics and /metrics.json. 0 to turn off
+metricsPort = 9108
+# worker processes drawing the overlay, 0 draws it in the threads of this process, None uses all cores
+overlayProcesses = 0
+# font to draw text on image
+FontPath = '/usr/share/fonts/truetype/freefont/FreeMonoBold.ttf'
+FontSize = 20
+# cameras is a list of LookOut cameras run by this process.
+# A camera with 'inputUrl' is a webpage image posted to its 'lookout' endpoint.
+# A camera with 'cameraUrl' is an AXIS PTZ camera running its 'guardtour' (same format as messenger-ptz.py).
+# 'interval' is 60 for standard plan and 30 for premium plan respectively.
+# 'threshold' (optional) is the perceptual hash distance below which an image counts as unchanged and is not uploaded,
+#   e.g. 4 for a webpage image. Without it only images not modified or byte for byte the same are skipped.
+# 'capture' (optional) of a PTZ camera is 'stream' to take images from one open MJPEG stream instead of an image.cgi HTTP Get each.
+# 'site' (optional) names the uplink shared by cameras on the same tower, default the camera name.
+# 'concurrency' (optional) is the most images of the camera in flight at the same time, from the HTTP Get through the overlay
+#   to the end of the HTTP Post, default engine.concurrency. A camera with slow uploads waits for its own slots.
+# 'missed' (optional) is 'skip' to drop detection ticks missed by a slow cycle, or 'catchup' to run them back to back.
+# A preset of a guard tour may have its own 'interval', otherwise it is visited every camera interval.
+# 'planner' (optional) True runs the tour planner on this guard tour also when Flag_Planner is off.
+cameras = [
+    {'name':'CA-BC-SunPeaks', 'inputUrl':'https://www.sunpeaksresort.com/sites/default/files/webcams/ele_view_of_morrisey.jpg',
+     'lookout':'', 'latitude':50.88, 'longitude':119.89, 'interval':60, 'concurrency':2},
+    {'name':'your_camera_name', 'cameraUrl':'http://your_camera_hostname_or_IP_address', 'username':'username', 'password':'password',
+     'latitude':22.00, 'longitude':114.00, 'interval':60, 'concurrency':3,
+     'guardtour':[
+        {'preset':'preset_name_1', 'lookout':'your_lookout_endpoint_url_of_preset_name_1', 'ptz':5, 'heading':0, 'FOV':60},
+        {'preset':'preset_name_2', 'lookout':'your_lookout_endpoint_url_of_preset_name_2', 'ptz':5, 'heading':60, 'FOV':60}
+     ]}
+    ]
+# ABOVE this line is customer-specific information
+
+# BELOW this line is program code. Please DO NOT modify if you are not sure what you do.
+
+# upload workers shared by all cameras
+uploads = None
+# overlay worker processes shared by all cameras, None when the overlay is drawn in threads
+images = None
+# every LookOut result of all cameras is kept in the detection store
+store = None
+# uploaded frames of all cameras, when Flag_Archive is on
+frame_archive = None
+# SMS alerts of all cameras are sent in the background, transport None is Twilio
+sms = None
+sms_transport = None
+# engine.Messenger or engine.GuardTour of each camera name
+messengers = {}
+
+# local time string of a UTC time
+def local_str(utc_time):
+    return utc_time.astimezone(pytz.timezone(location)).strftime('%Y-%m-%d %H:%M:%S')
+
+# HTTP Post image bytes to LookOut by the deadline, return the response or None
+def post_image(url, image_data, deadline=None):
+    try:
+        return httppool.post(url, headers={'Content-Type': 'image/jpeg'}, data=image_data, deadline=deadline)
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+# measure the uplink of the site of a camera from a successful HTTP Post
+def record_upload(camera, nbytes, seconds):
+    messenger = messengers.get(camera)
+    if messenger is not None and messenger.site is not None:
+        messenger.site.record(nbytes, seconds)
+
+# score the LookOut response of an image sent from the disk spool like any other upload of its camera
+def record_spooled(camera, preset, response, ts, nbytes):
+    messenger = messengers.get(camera)
+    if messenger is not None and hasattr(messenger, 'record_spooled'):
+        messenger.record_spooled(camera, preset, response, ts, nbytes)
+
+# the engine of a camera: a webpage camera with 'inputUrl' or a guard tour with 'cameraUrl', on the shared services
+def make_messenger(cam):
+    kind = engine.GuardTour if 'guardtour' in cam else engine.Messenger
+    return kind(cam, location, Flag_Overlay=Flag_Overlay, Flag_Weather=Flag_Weather, Flag_SMS=Flag_SMS, Flag_Adaptive=Flag_Adaptive, Flag_Planner=Flag_Planner, Flag_Archive=Flag_Archive,
+                font_path=FontPath, font_size=FontSize, position=(20, 30), uploads=uploads, store=store, sms=sms, archive=frame_archive, images=images)
+
+# run MaxCycle detection cycles of one camera in a thread of the executor, a camera that fails does not stop the others
+async def run_camera(messenger, MaxCycle):
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, messenger.run, MaxCycle)
+    except Exception as e:
+        print(f"Error: {e}")
+        messenger.count('failures')
+
+# the statistics of a camera after its run
+def camera_stats(messenger):
+    s = {'cycle': messenger.stats['cycles'], 'visits': messenger.stats['visits'], 'uploads': messenger.stats['uploads'],
+         'skipped': sum(messenger.changes.skipped.values()) if messenger.changes is not None else 0,
+         'detection': messenger.stats['detections'], 'failure': messenger.stats['failures'], 'throttled': messenger.stats['throttled'],
+         'min_cycle_time': messenger.min_cycle_time if messenger.stats['cycles'] else None, 'cadence': cadence(messenger)}
+    if messenger.planner is not None:
+        s['planner'] = messenger.planner.report_line()
+    if messenger.site is not None:
+        s['encoding'] = messenger.site.report()
+        s['encodings'] = messenger.site.usage()
+    if getattr(messenger, 'stream', None) is not None:
+        s['stream'] = messenger.stream.report()
+    return s
+
+# run all cameras together, return the statistics of each camera
+async def run_fleet(cameras, MaxCycle):
+    global uploads, sms, images, store, frame_archive
+    loop = asyncio.get_running_loop()
+    # each camera runs its cycles in its own thread, a few more close the shared services
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=len(cameras) + 4))
+    # a camera has one hedged HTTP Get at a time, the first runs in its own thread and the second in a hedge thread
+    deadline.configure(workers=max(len(cameras), 1))
+    # keep enough keep-alive connections for every camera host and LookOut host
+    httppool.configure(connections=max(2 * len(cameras), httppool.pool_connections), maxsize=max(uploadqueue.workers, len(cameras), httppool.pool_maxsize))
+    uploads = uploadqueue.UploadQueue(workers=max(uploadqueue.workers, len(cameras)), post=http2pool.post_image if uploadMode == 'http2' else post_image,
+                                      on_post=record_upload, on_result=record_spooled)
+    if Flag_Overlay and overlayProcesses != 0:
+        images = imagepool.ImagePool(FontPath, FontSize, (20, 30), overlayProcesses)
+    if Flag_SMS:
+        sms = alerts.AlertDispatcher(sms_transport)
+    store = detections.DetectionStore()
+    if Flag_Archive:
+        frame_archive = archive.FrameArchive()
+    messengers.clear()
+    for cam in cameras:
+        messengers[cam['name']] = make_messenger(cam)
+    await asyncio.gather(*(run_camera(messenger, MaxCycle) for messenger in messengers.values()))
+    # the last uploads are recorded in the detection store before it is closed
+    await loop.run_in_executor(None, uploads.close)
+    if sms is not None:
+        await loop.run_in_executor(None, sms.close)
+    if images is not None:
+        await loop.run_in_executor(None, images.close)
+    await loop.run_in_executor(None, store.close)
+    if frame_archive is not None:
+        await loop.run_in_executor(None, frame_archive.close)
+    return {name: camera_stats(messenger) for name, messenger in messengers.items()}
+
+# target and actual cadence of a camera, or of each preset of its guard tour
+def cadence(messenger):
+    report = messenger.schedule.report() if messenger.schedule is not None else {}
+    if 'guardtour' in messenger.camera:
+        return {messenger.guardtour[position]['preset']: r for position, r in report.items()}
+    return {'': r for r in report.values()}
+
+# save detection information of all cameras
+def save_summary(stats, utc_start, path='summary-fleet.txt'):
+    utc_last = pytz.utc.localize(datetime.datetime.utcnow())
+    time_spent = utc_last - utc_start
+    with open(path, mode='w') as file_object:
+        print('LookOut Messenger mission completed.\n', file=file_object)
+        print('Start time: ' + local_str(utc_start) + ', ' + location, file=file_object)
+        print('Last time: ' + local_str(utc_last) + ', ' + location + '\n', file=file_object)
+        print(str(len(stats)) + ' cameras in the last ' + str(int(time_spent.total_seconds())) + ' seconds.\n', file=file_object)
+        for name, s in stats.items():
+            print('LookOut camera: ' + name, file=file_object)
+            print(str(s['cycle']) + ' cycles of every preset in ' + str(s['visits']) + ' visits, fastest cycle is ' + str(s['min_cycle_time']) + ' seconds.', file=file_object)
+            print(str(s['uploads']) + ' image uploads, ' + str(s['skipped']) + ' unchanged images skipped, ' + str(s['detection']) + ' images with positives, and ' + str(s['failure']) + ' failure.', file=file_object)
+            if s['throttled']:
+                print(str(s['throttled']) + ' images not taken, all slots of the camera busy with uploads.', file=file_object)
+            if 'stream' in s:
+                print(s['stream'], file=file_object)
+            if 'planner' in s:
+                print(s['planner'], file=file_object)
+            if 'encoding' in s:
+                print('Upload encoding of site ' + s['encoding'] + ' Images by scale/quality: ' + str(s['encodings']), file=file_object)
+            for preset, r in s['cadence'].items():
+                print((preset + ': ' if preset else '') + 'detection interval ' + str(r['target']) + ' s, actual ' + str(r['actual']) + ' s, ' + str(r['per_hour']) + ' visits per hour, ' + str(r['missed']) + ' ticks missed, ' + str(r['late_max']) + ' s latest start.', file=file_object)
+            print('', file=file_object)
+        print(httppool.report(), file=file_object)
+        print(deadline.report(), file=file_object)
+        if uploads is not None:
+            print(uploads.report(), file=file_object)
+        if uploadMode == 'http2':
+            print(http2pool.report(), file=file_object)
+        if sms is not None:
+            print(sms.report(), file=file_object)
+        if images is not None:
+            print(images.report(), file=file_object)
+        if store is not None:
+            print(store.report(), file=file_object)
+        if frame_archive is not None:
+            print(frame_archive.report(), file=file_object)
+
+# main program
+# usage: python fleet.py cycles [cameras.json]
+if __name__ == '__main__':
+    MaxCycle = 3
+    if len(sys.argv) >= 2:
+        MaxCycle = int(sys.argv[1])
+    if MaxCycle < 0 or MaxCycle > 86400:
+        print('Parameter is out of range.')
+        sys.exit()
+    # cameras can also be loaded from a JSON file with the same format
+    if len(sys.argv) >= 3:
+        with open(sys.argv[2]) as f:
+            cameras = json.load(f)
+
+    print(f'Your want to run {MaxCycle} cycles of {len(cameras)} cameras.\n')
+    # timing of each stage is served on the metrics endpoint and saved to metrics.json every minute
+    if metricsPort:
+        metrics.serve(metricsPort)
+    metrics.start_dump('metrics.json')
+    utc_start = pytz.utc.localize(datetime.datetime.utcnow())
+    try:
+        asyncio.run(run_fleet(cameras, MaxCycle))
+    finally:
+        # save detection information at the end, also of a run stopped by Ctrl-C or an error
+        save_summary({name: camera_stats(messenger) for name, messenger in messengers.items()}, utc_start)
+        metrics.dump_json('metrics.json')
+    print(f'LookOut Messenger mission completed at {local_str(pytz.utc.localize(datetime.datetime.utcnow()))}.')
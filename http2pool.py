@@ -0,0 +1,305 @@
+#! python3
+# http2pool.py - HTTP Post to LookOut multiplexed on one HTTP/2 connection per host, the keep-alive pool of httppool.py as fallback
+# Last update: 20261018: one HTTP/2 connection per LookOut host through the optional h2 package, h2c with prior knowledge on http:// URLs,
+#              a stream out of time is reset alone, hosts that do not speak HTTP/2 and gateways without h2 post through httppool
+# Developer: @roboticscats, @jiansuo
+import ssl, json, time, socket, threading, httppool
+import deadline as budget
+from urllib.parse import urlsplit
+
+# seconds to wait for the HTTP/2 settings of a new connection, a host that does not send them posts through httppool
+settings_timeout = 3.05
+# bytes of response body a stream may receive before the server waits for a window update
+receive_window = 1024 * 1024
+
+_connections = {}
+# hosts that do not speak HTTP/2, they post through httppool
+_http1 = set()
+# None until the first post, then True if h2 can be imported
+_available = None
+_lock = threading.Lock()
+_stats = {'posts': 0, 'http2': 0, 'connections': 0, 'fallbacks': 0, 'reset': 0, 'failed': 0}
+
+def count(key):
+    with _lock:
+        _stats[key] = _stats[key] + 1
+
+class NotHttp2(Exception):
+    pass
+
+# response of an HTTP/2 stream, with the parts of requests.Response the upload queue and detections.score read
+class Response:
+    http_version = 'HTTP/2'
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+# one HTTP Post in flight on a connection
+class Stream:
+    def __init__(self):
+        self.status = None
+        self.headers = {}
+        self.chunks = []
+        self.error = None
+        self.done = threading.Event()
+
+    def fail(self, error):
+        if not self.done.is_set():
+            self.error = error
+            self.done.set()
+
+# HTTP/2 connection to a LookOut host. Any thread sends its post as a stream, a reader thread hands each response
+# to its stream, so the posts of a guard tour overlap on one connection without a thread or connection each
+class Connection:
+    def __init__(self, scheme, hostname, port):
+        import h2.config, h2.connection
+        self.authority = hostname if port in (80, 443) else hostname + ':' + str(port)
+        self.scheme = scheme
+        sock = socket.create_connection((hostname, port), timeout=budget.connect_timeout)
+        if scheme == 'https':
+            context = ssl.create_default_context()
+            context.set_alpn_protocols(['h2', 'http/1.1'])
+            sock = context.wrap_socket(sock, server_hostname=hostname)
+            if sock.selected_alpn_protocol() != 'h2':
+                sock.close()
+                raise NotHttp2(hostname + ' chose ' + str(sock.selected_alpn_protocol()))
+        sock.settimeout(None)
+        self.sock = sock
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=True, header_encoding='utf-8'))
+        # the state of the connection and its streams, the reader and the senders wait on it for responses and window updates
+        self.lock = threading.Condition()
+        self.streams = {}
+        self.error = None
+        self.settled = threading.Event()
+        with self.lock:
+            self.conn.local_settings.initial_window_size = receive_window
+            self.conn.initiate_connection()
+            self.flush()
+        threading.Thread(target=self.reader, daemon=True).start()
+        # a server with HTTP/2 answers the connection preface with its settings before any post is sent,
+        # so a host without HTTP/2 has not received an image when it is given up
+        if not self.settled.wait(settings_timeout) or self.error is not None:
+            self.close()
+            raise NotHttp2(self.authority + ' did not send HTTP/2 settings')
+
+    # send the frames h2 has ready, call with the lock held so frames go out in order
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def reader(self):
+        import h2.events
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise ConnectionError('connection closed by ' + self.authority)
+                with self.lock:
+                    for event in self.conn.receive_data(data):
+                        stream = self.streams.get(getattr(event, 'stream_id', 0))
+                        if isinstance(event, h2.events.RemoteSettingsChanged):
+                            self.settled.set()
+                        elif isinstance(event, h2.events.ResponseReceived) and stream is not None:
+                            stream.headers = dict(event.headers)
+                            stream.status = int(stream.headers.get(':status', 0))
+                        elif isinstance(event, h2.events.DataReceived):
+                            self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                            if stream is not None:
+                                stream.chunks.append(event.data)
+                        elif isinstance(event, h2.events.StreamEnded) and stream is not None:
+                            stream.done.set()
+                        elif isinstance(event, h2.events.StreamReset) and stream is not None:
+                            stream.fail(ConnectionError('stream reset by ' + self.authority))
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            raise ConnectionError('connection ended by ' + self.authority)
+                    self.flush()
+                    # window updates and settings let waiting senders go on
+                    self.lock.notify_all()
+        except Exception as e:
+            self.fail(e)
+
+    # end the connection and fail every stream still waiting on it
+    def fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+            for stream in self.streams.values():
+                stream.fail(error)
+            self.lock.notify_all()
+        self.settled.set()
+        self.close()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def usable(self):
+        return self.error is None
+
+    # reset a stream that is out of time or cancelled, the other streams of the connection go on
+    def reset(self, stream_id, stream, error):
+        import h2.errors
+        with self.lock:
+            if stream.done.is_set():
+                return
+            stream.fail(error)
+            try:
+                self.conn.reset_stream(stream_id, h2.errors.ErrorCodes.CANCEL)
+                self.flush()
+            except Exception:
+                pass
+            self.lock.notify_all()
+        count('reset')
+
+    # wait on the lock until ready() is True, False if the stream ended or until (time.monotonic()) came first
+    def wait_for(self, ready, stream, until):
+        while not ready():
+            remaining = until - time.monotonic()
+            if self.error is not None or stream.done.is_set() or remaining <= 0:
+                return False
+            self.lock.wait(remaining)
+        return True
+
+    # HTTP Post of body to a path, return the Response. Raises deadline.DeadlineExceeded when the deadline ends it
+    def post(self, path, headers, body, deadline=None):
+        stream = Stream()
+        remaining = deadline.remaining() if deadline is not None else None
+        # without a deadline a post waits at most read_timeout for a stream, the window and the response
+        until = time.monotonic() + (budget.read_timeout if remaining is None else remaining)
+        timeout = out_of_time(deadline) if remaining is not None else TimeoutError('no response from ' + self.authority)
+        with self.lock:
+            if self.error is not None:
+                raise ConnectionError(str(self.error))
+            # the server limits the streams in flight at the same time
+            if not self.wait_for(lambda: self.conn.open_outbound_streams < self.conn.remote_settings.max_concurrent_streams, stream, until):
+                raise timeout
+            # a stream id is taken when its headers are sent, both under the lock so threads get their own
+            stream_id = self.conn.get_next_available_stream_id()
+            request = [(':method', 'POST'), (':scheme', self.scheme), (':authority', self.authority), (':path', path),
+                       ('content-length', str(len(body)))] + [(key.lower(), str(value)) for key, value in headers.items()]
+            self.conn.send_headers(stream_id, request, end_stream=not body)
+            self.flush()
+            self.streams[stream_id] = stream
+        if deadline is not None:
+            cancel = lambda: self.reset(stream_id, stream, budget.DeadlineExceeded('cancelled'))
+            deadline.on_cancel(cancel)
+        try:
+            with self.lock:
+                sent = 0
+                while sent < len(body):
+                    # the body goes out as the flow control windows of the stream and the connection allow
+                    if not self.wait_for(lambda: self.conn.local_flow_control_window(stream_id) > 0, stream, until):
+                        break
+                    size = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size, len(body) - sent)
+                    self.conn.send_data(stream_id, body[sent:sent + size], end_stream=sent + size == len(body))
+                    self.flush()
+                    sent = sent + size
+            if not stream.done.wait(max(until - time.monotonic(), 0)) or sent < len(body):
+                self.reset(stream_id, stream, timeout)
+            if stream.error is not None:
+                raise stream.error
+            return Response(stream.status, stream.headers, b''.join(stream.chunks))
+        finally:
+            if deadline is not None:
+                deadline.discard(cancel)
+            with self.lock:
+                self.streams.pop(stream_id, None)
+
+def out_of_time(deadline):
+    return budget.DeadlineExceeded('cancelled' if deadline.is_cancelled() else 'deadline exceeded')
+
+# True if h2 is installed, imported at the first call
+def available():
+    global _available
+    with _lock:
+        if _available is None:
+            try:
+                import h2
+                _available = True
+            except ImportError:
+                print('Warning: h2 is not installed, HTTP Posts to LookOut use HTTP/1.1 keep-alive connections')
+                _available = False
+        return _available
+
+# the HTTP/2 connection of a host, a new one if there is none or the last one failed. None if the host does not speak HTTP/2.
+# A new connection is opened by one thread, the other posts wait for it
+def connection(scheme, hostname, port):
+    key = (scheme, hostname, port)
+    with _lock:
+        if key in _http1:
+            return None
+        c = _connections.get(key)
+        if c is not None and c.usable():
+            return c
+        try:
+            c = Connection(scheme, hostname, port)
+        except NotHttp2 as e:
+            print('Warning: ' + str(e) + ', HTTP Posts to it use HTTP/1.1 keep-alive connections')
+            _http1.add(key)
+            _stats['fallbacks'] = _stats['fallbacks'] + 1
+            return None
+        _connections[key] = c
+        _stats['connections'] = _stats['connections'] + 1
+        return c
+
+# HTTP Post to LookOut, the same arguments as httppool.post. Concurrent posts to a host from any thread share its one
+# connection as HTTP/2 streams, each with its own endpoint path and response. A post out of time (deadline.Deadline)
+# resets its own stream and raises deadline.DeadlineExceeded, the other posts on the connection are not touched
+def post(url, deadline=None, **kwargs):
+    parts = urlsplit(url)
+    c = None
+    if available() and parts.scheme in ('http', 'https'):
+        if deadline is not None:
+            deadline.check()
+        c = connection(parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+    if c is None:
+        return httppool.post(url, deadline, **kwargs)
+    count('posts')
+    path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    try:
+        response = c.post(path, kwargs.get('headers') or {}, bytes(kwargs.get('data') or b''), deadline)
+    except Exception:
+        count('failed')
+        raise
+    count('http2')
+    return response
+
+# HTTP Post image bytes to LookOut by the deadline, return the response or None. The post function of uploadqueue.UploadQueue
+def post_image(url, image_data, deadline=None):
+    try:
+        return post(url, deadline, headers={'Content-Type': 'image/jpeg'}, data=image_data)
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+# close the connections, the next post finds out again which hosts speak HTTP/2
+def close():
+    with _lock:
+        connections = list(_connections.values())
+        _connections.clear()
+        _http1.clear()
+    for c in connections:
+        c.fail(ConnectionError('closed'))
+
+# counters of posts, connections, hosts that fell back to HTTP/1.1, reset and failed streams
+def stats():
+    with _lock:
+        return dict(_stats)
+
+# one line report of the HTTP/2 counters
+def report():
+    s = stats()
+    return str(s['http2']) + ' HTTP/2 posts on ' + str(s['connections']) + ' connections, ' + str(s['fallbacks']) + ' hosts fell back to HTTP/1.1, ' + str(s['reset']) + ' streams reset, ' + str(s['failed']) + ' failed.'
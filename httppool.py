@@ -0,0 +1,242 @@
+#! python3
+# httppool.py - Shared HTTP sessions with keep-alive connection pools and reusable digest auth
+# Last update: 20261018: one connection pool per host for camera, LookOut and OpenWeather, hard timeouts and deadlines, digest auth per camera,
+#              a cancelled deadline drops the connection of its request
+# Developer: @roboticscats, @jiansuo
+import socket, threading, types, requests, urllib3
+import deadline as budget
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPDigestAuth
+from urllib.parse import urlsplit
+
+# number of hosts to keep connection pools for
+pool_connections = 10
+# number of keep-alive connections kept per host
+pool_maxsize = 10
+
+_session = None
+_adapters = []
+_auths = {}
+_lock = threading.Lock()
+# the call under a deadline running in this thread, its connection registers with it
+_calls = threading.local()
+
+# a request under a deadline: cancelling the deadline shuts down the socket of the connection it runs on,
+# so a thread blocked on the response headers or body returns at once. A connect in progress ends by its timeout
+class Call:
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.connection = None
+        self.lock = threading.Lock()
+
+    # the connection the request is sent on, called in the thread of the request
+    def attach(self, connection):
+        with self.lock:
+            self.connection = connection
+
+    def abort(self):
+        with self.lock:
+            sock = getattr(self.connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+# connection that tells the call of its thread it is sending a request, and drops it if the call was cancelled meanwhile
+class CancellableMixin:
+    def request(self, *args, **kwargs):
+        call = getattr(_calls, 'call', None)
+        if call is not None:
+            call.attach(self)
+        super().request(*args, **kwargs)
+        if call is not None and call.deadline.is_cancelled():
+            call.abort()
+
+class CancellableHTTPConnection(CancellableMixin, urllib3.connection.HTTPConnection):
+    pass
+
+class CancellableHTTPSConnection(CancellableMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+class CancellableHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = CancellableHTTPConnection
+
+class CancellableHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = CancellableHTTPSConnection
+
+# HTTP adapter that remembers the counters of connection pools closed by the pool manager,
+# its connections can be dropped by cancelling the deadline of their request
+class CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': CancellableHTTPConnectionPool, 'https': CancellableHTTPSConnectionPool}
+        self.closed = {}
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+        def dispose_counted(pool):
+            add_counts(self.closed, pool)
+            if dispose:
+                dispose(pool)
+        pools.dispose_func = dispose_counted
+
+    # counters of each host: requests sent, new connections opened
+    def counts(self):
+        counts = {}
+        for host, c in self.closed.items():
+            counts[host] = dict(c)
+        with self.poolmanager.pools.lock:
+            pools = list(self.poolmanager.pools._container.values())
+        for pool in pools:
+            add_counts(counts, pool)
+        return counts
+
+# add the counters of an urllib3 connection pool to counts
+def add_counts(counts, pool):
+    host = pool.scheme + '://' + str(pool.host) + ':' + str(pool.port)
+    c = counts.setdefault(host, {'requests': 0, 'connections': 0})
+    c['requests'] = c['requests'] + pool.num_requests
+    c['connections'] = c['connections'] + pool.num_connections
+
+# digest auth state: the server nonce is shared by all threads, the 401 retry state of a request stays in its own thread
+class DigestState(threading.local):
+    def __init__(self, shared):
+        self.shared = shared
+
+def shared_property(name):
+    return property(lambda self: getattr(self.shared, name), lambda self, value: setattr(self.shared, name, value))
+
+for name in ('last_nonce', 'nonce_count', 'chal'):
+    setattr(DigestState, name, shared_property(name))
+
+# digest auth that reuses the server nonce in every thread, so only the first request pays the 401 challenge
+class SharedDigestAuth(HTTPDigestAuth):
+    def __init__(self, username, password):
+        super().__init__(username, password)
+        self._thread_local = DigestState(types.SimpleNamespace(last_nonce='', nonce_count=0, chal={}))
+        self.lock = threading.Lock()
+
+    def init_per_thread_state(self):
+        if not hasattr(self._thread_local, 'init'):
+            self._thread_local.init = True
+            self._thread_local.pos = None
+            self._thread_local.num_401_calls = None
+
+    def build_digest_header(self, method, url):
+        # nonce count must go up by one for every request using the same nonce
+        with self.lock:
+            return super().build_digest_header(method, url)
+
+# change the pool sizes, call before the first request. The connections of the old session are closed,
+# their counters stay in stats()
+def configure(connections=None, maxsize=None):
+    global pool_connections, pool_maxsize, _session
+    with _lock:
+        if connections is not None:
+            pool_connections = connections
+        if maxsize is not None:
+            pool_maxsize = maxsize
+        old = _session
+        _session = None
+    if old is not None:
+        old.close()
+
+# the shared session of this process
+def session():
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            for prefix in ('http://', 'https://'):
+                adapter = CountingAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+                s.mount(prefix, adapter)
+                _adapters.append(adapter)
+            _session = s
+        return _session
+
+# digest auth for a username and password on the camera at url, the same object is reused for every request to it.
+# Each camera has its own server nonce, so cameras with the same credentials still get their own object
+def digest_auth(username, password, url=''):
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), username, password)
+    with _lock:
+        auth = _auths.get(key)
+        if auth is None:
+            auth = SharedDigestAuth(username, password)
+            _auths[key] = auth
+        return auth
+
+# HTTP request via the shared session. Without a deadline it has the connect and read timeouts of deadline.py.
+# With a deadline (deadline.Deadline) the whole request, body included, ends by the deadline or when it is cancelled:
+# the connection is dropped and deadline.DeadlineExceeded is raised
+def request(method, url, deadline=None, **kwargs):
+    if deadline is None:
+        kwargs.setdefault('timeout', (budget.connect_timeout, budget.read_timeout))
+        return session().request(method, url, **kwargs)
+    kwargs['timeout'] = deadline.timeout()
+    kwargs['stream'] = True
+    call = Call(deadline)
+    deadline.on_cancel(call.abort)
+    _calls.call = call
+    try:
+        return read_response(session().request(method, url, **kwargs), deadline)
+    except Exception as e:
+        # a call cancelled, or out of time when requests timed it out, raises DeadlineExceeded as documented
+        if (deadline.is_cancelled() or deadline.expired()) and not isinstance(e, budget.DeadlineExceeded):
+            raise budget.DeadlineExceeded('cancelled' if deadline.is_cancelled() else 'deadline exceeded') from e
+        raise
+    finally:
+        _calls.call = None
+        deadline.discard(call.abort)
+
+# the body of a streamed response read by the deadline
+def read_response(response, deadline):
+    try:
+        chunks = []
+        # read1 returns after one socket read, so a slow body is checked against the deadline as it arrives
+        read1 = getattr(response.raw, 'read1', None)
+        if read1 is not None:
+            chunk = read1(budget.chunk_size, decode_content=True)
+            while chunk:
+                chunks.append(chunk)
+                deadline.check()
+                chunk = read1(budget.chunk_size, decode_content=True)
+        else:
+            for chunk in response.iter_content(budget.chunk_size):
+                chunks.append(chunk)
+                deadline.check()
+        response._content = b''.join(chunks)
+        return response
+    except Exception:
+        response.close()
+        raise
+
+# HTTP Get via the shared session
+def get(url, deadline=None, **kwargs):
+    return request('GET', url, deadline, **kwargs)
+
+# HTTP Post via the shared session
+def post(url, deadline=None, **kwargs):
+    return request('POST', url, deadline, **kwargs)
+
+# counters of connections reused vs. newly opened, in total and for each host
+def stats():
+    hosts = {}
+    for adapter in list(_adapters):
+        for host, c in adapter.counts().items():
+            h = hosts.setdefault(host, {'requests': 0, 'connections': 0})
+            h['requests'] = h['requests'] + c['requests']
+            h['connections'] = h['connections'] + c['connections']
+    total = {'requests': 0, 'new': 0, 'reused': 0, 'hosts': {}}
+    for host, c in hosts.items():
+        reused = max(c['requests'] - c['connections'], 0)
+        total['hosts'][host] = {'requests': c['requests'], 'new': c['connections'], 'reused': reused}
+        total['requests'] = total['requests'] + c['requests']
+        total['new'] = total['new'] + c['connections']
+        total['reused'] = total['reused'] + reused
+    return total
+
+# one line report of the connection counters
+def report():
+    s = stats()
+    return str(s['requests']) + ' HTTP requests, ' + str(s['reused']) + ' reused connections and ' + str(s['new']) + ' new connections.'
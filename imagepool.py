@@ -0,0 +1,123 @@
+#! python3
+# imagepool.py - Decode, overlay and encode jpeg images in worker processes, so every core of the gateway draws headers
+# Last update: 20261018: process pool with shared memory frame slots, drawn in this process when the pool fails
+# Developer: @roboticscats, @jiansuo
+import os, queue, threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from PIL import ImageFont
+import overlay
+
+# bytes of one shared memory slot, larger images are sent to the worker by pickling
+slot_size = 8 * 1024 * 1024
+# shared memory slots for each worker process, a caller waits for a free slot
+slots_per_process = 2
+
+# state of a worker process: the header renderer and the shared memory slots attached so far
+_renderer = None
+_attached = {}
+
+# make the header renderer of a worker process once, with the overlay settings of the parent process
+def init_worker(font_path, font_size, position, settings):
+    global _renderer
+    for name, value in settings.items():
+        setattr(overlay, name, value)
+    try:
+        font = ImageFont.truetype(font_path, font_size)
+    except Exception as e:
+        print(f"Error: {e}")
+        font = ImageFont.load_default()
+    _renderer = overlay.HeaderRenderer(font, position)
+
+# overlay the image in a shared memory slot and write the new image back to the slot.
+# Return its size, the new image bytes if it does not fit in the slot, or None if the image is broken
+def overlay_slot(name, size, local_time, weather, scale=1.0, jpeg_quality=None):
+    shm = _attached.get(name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    image_data = _renderer.overlay(shm.buf[:size], local_time, weather, scale, jpeg_quality)
+    if image_data is None or len(image_data) > shm.size:
+        return image_data
+    shm.buf[:len(image_data)] = image_data
+    return len(image_data)
+
+# overlay image bytes sent by pickling, for images larger than a slot
+def overlay_bytes(image_data, local_time, weather, scale=1.0, jpeg_quality=None):
+    return _renderer.overlay(image_data, local_time, weather, scale, jpeg_quality)
+
+class ImagePool:
+    # processes None uses all cores
+    def __init__(self, font_path, font_size, position=(20, 30), processes=None):
+        processes = processes or os.cpu_count() or 1
+        self.processes = processes
+        self.font_path = font_path
+        self.font_size = font_size
+        self.position = position
+        # header renderer of this process, made when the worker processes fail
+        self.renderer = None
+        settings = {name: getattr(overlay, name) for name in ('brand', 'quality', 'subsampling', 'default_quality', 'default_subsampling', 'segment_cache_size')}
+        # spawn starts clean worker processes, a fork of this process would copy its threads' locks
+        self.executor = ProcessPoolExecutor(processes, mp_context=get_context('spawn'), initializer=init_worker, initargs=(font_path, font_size, position, settings))
+        self.slots = queue.Queue()
+        self.shms = []
+        for i in range(processes * slots_per_process):
+            shm = shared_memory.SharedMemory(create=True, size=slot_size)
+            self.shms.append(shm)
+            self.slots.put(shm)
+        self.stats = {'images': 0, 'pickled': 0, 'failed': 0}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] = self.stats[key] + 1
+
+    # write 'brand | local time | weather' on the image in a worker process, same as HeaderRenderer.overlay.
+    # Called from a thread, it waits for a free slot and for the worker. If the worker fails, e.g. the pool is broken
+    # by a killed worker, the image is drawn in this process
+    def overlay(self, image_data, local_time, weather='', scale=1.0, jpeg_quality=None):
+        self.count('images')
+        try:
+            if len(image_data) > slot_size:
+                self.count('pickled')
+                return self.executor.submit(overlay_bytes, bytes(image_data), local_time, weather, scale, jpeg_quality).result()
+            return self.overlay_shared(image_data, local_time, weather, scale, jpeg_quality)
+        except Exception as e:
+            print(f"Error: {e}")
+            self.count('failed')
+        try:
+            if self.renderer is None:
+                try:
+                    font = ImageFont.truetype(self.font_path, self.font_size)
+                except Exception:
+                    font = ImageFont.load_default()
+                self.renderer = overlay.HeaderRenderer(font, self.position)
+            return self.renderer.overlay(image_data, local_time, weather, scale, jpeg_quality)
+        except Exception as e:
+            print(f"Error: {e}")
+            return None
+
+    # overlay the image in a worker through a free shared memory slot
+    def overlay_shared(self, image_data, local_time, weather, scale, jpeg_quality):
+        size = len(image_data)
+        shm = self.slots.get()
+        try:
+            shm.buf[:size] = image_data
+            result = self.executor.submit(overlay_slot, shm.name, size, local_time, weather, scale, jpeg_quality).result()
+            if isinstance(result, int):
+                return bytes(shm.buf[:result])
+            if result is not None:
+                self.count('pickled')
+            return result
+        finally:
+            self.slots.put(shm)
+
+    def close(self):
+        self.executor.shutdown()
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+
+    # one line report of the pool counters
+    def report(self):
+        return str(self.stats['images']) + ' images drawn in ' + str(self.processes) + ' worker processes, ' + str(self.stats['pickled']) + ' sent without shared memory, ' + str(self.stats['failed']) + ' drawn here after a worker failed.'
@@ -1,13 +1,11 @@
 #! python3
 # messenger.py - Get images from camera, overlay local time and weather, and sent to LookOut
 # LookOut Messeger (beta) is a free application for LookOut Wildfire Detection SaaS customers
-# Last update: 20230814: add Flag_Overlay, Flag_Weather, Flag_SMS
+# Last update: 20261018: the guard tour is run by engine.GuardTour, this file is the customer settings and the command line, summary also of a stopped run
 # Developer: @roboticscats, @jiansuo
-import sys, requests, os, time, datetime, pytz, re, threading
-from PIL import Image, ImageDraw, ImageFont
+import sys, os
 from pathlib import Path
-from requests.auth import HTTPDigestAuth
-import weather, uploadimage
+import engine, metrics
 
 # BELOW this line is customer-specific information
 # Global constants unique to each LookOut camera endpoints
@@ -15,6 +13,12 @@ import weather, uploadimage
 Flag_Overlay = True
 Flag_Weather = False
 Flag_SMS = False
+# The flag to fit the upload resolution and jpeg quality to the uplink bandwidth, see bandwidth.py for the floors
+Flag_Adaptive = False
+# The flag to visit presets that scored recently or look hazy or smoky more often than quiet ones, see planner.py
+Flag_Planner = False
+# The flag to keep the uploaded frames of the last days on disk to review and replay, see archive.py
+Flag_Archive = False
 lookoutName = 'your_camera_name'
 # your location for timezone info
 location = 'Asia/Hong_Kong'
@@ -23,13 +27,24 @@ latitude = 22.00
 longitude = 114.00
 # detection interval is 60 for standard plan and 30 for premium plan respectively
 interval = 60
-# font to draw text on image
-Font = ImageFont.truetype('/Users/andre/Library/Group Containers/UBF8T346G9.Office/FontCache/4/CloudFonts/Segoe UI/38386564244.ttf', 23)
-# Font = ImageFont.truetype('/usr/share/fonts/truetype/freefont/FreeMonoBold.ttf', 20)
+# local port of the metrics endpoint, http://127.0.0.1:9108/metrics and /metrics.json. 0 to turn off
+metricsPort = 9108
+# font to draw text on image, loaded at the first overlay
+FontPath = '/Users/andre/Library/Group Containers/UBF8T346G9.Office/FontCache/4/CloudFonts/Segoe UI/38386564244.ttf'
+FontSize = 23
+# FontPath = '/usr/share/fonts/truetype/freefont/FreeMonoBold.ttf'
+# FontSize = 20
 # camera admin URL
 cameraUrl = 'http://your_camera_hostname_or_IP_address'
+cameraUser = 'username'
+cameraPassword = 'password'
+# 'image' gets each image by HTTP Get of image.cgi, 'stream' takes it from one open MJPEG stream of the camera
+captureMode = 'image'
+# 'threads' posts each image on its own connection, 'http2' posts the images of the tour as streams of one HTTP/2 connection per LookOut host
+uploadMode = 'threads'
 # guard tour is a list of presets.
 # Each preset is list of preset name, LookOut camera endpoint, PTZ movement time, heading direction, FOV.
+# A preset may have its own detection 'interval' in seconds, otherwise it is visited every interval.
 guardtour = [
     {'preset':'preset_name_1', 'lookout':'your_lookout_endpoint_url_of_preset_name_1', 'ptz':5, 'heading':0, 'FOV':60},
     {'preset':'preset_name_2', 'lookout':'your_lookout_endpoint_url_of_preset_name_2', 'ptz':5, 'heading':60, 'FOV':60},
@@ -41,202 +56,57 @@ guardtour = [
 
 # BELOW this line is program code. Please DO NOT modify if you are not sure what you do.
 
-# move the AXIS camera to a specific position in the guardtour
-def movetopreset(position, time):
-    url = cameraUrl + '/axis-cgi/com/ptz.cgi?gotoserverpresetname=' + guardtour[position]['preset']
-    try:
-        response = requests.get(url, auth=HTTPDigestAuth('username', 'password'))
-        return response.status_code
-    except Exception as exc:
-        print('There was a problem: %s' % (exc))
-        return response.status_code
-
 # main program
-cycle = 0
-MaxCycle = 3
-detection = 0
-failure = 0
-status = False
-
-# check program arguments
-if len(sys.argv) >= 2:
-    MaxCycle = int(sys.argv[1])
-    
-if MaxCycle < 0 or MaxCycle > 86400:
-    print('Parameter is out of range.')
-    sys.exit()
-
-# if there is no program argumemt, then ask user input
-while len(sys.argv) < 2:
-    status = True
-    print('How many guard tour cycles?')
-    MaxCycle = input()
-    try:
-        MaxCycle = int(MaxCycle)
-    except:
-        print('Please use numeric digits.')
-        continue
-    if MaxCycle < 1:
-        print('Please enter a positive number.')
-        continue
-    if MaxCycle > 86400:
-        print('Please enter a positive number less than 86400.')
-        continue
-    break
-
-print(f'Your want to run {MaxCycle} guard tour cycles.\n')
-
-# start time of the main loop
-utc_start = pytz.utc.localize(datetime.datetime.utcnow())
-location_start = utc_start.astimezone(pytz.timezone(location))
-
-# first time weather info check. Need to import weather
-# use weather_now = '' if don't use weather
-if Flag_Weather:
-    weather_now = weather.weather(latitude, longitude)
-else:
-    weather_now = ''
-
-# last time to call OpenWeather API
-lastOWtime = utc_start
-
-# change current working directory to ~/Documents/python
-os.chdir(Path.home()/Path('Documents/python'))
-
-# Save the downloaded image to temp.jpg
-file_path = Path('temp.jpg')
-
-# create temp.jpg
-temp_image = Image.new('YCbCr', (1920, 1080))
-temp_image.save(file_path, 'JPEG')
-
-# measure the fastest cycle time in seconds
-min_cycle_time = 180.0
-
-# main loop
-while cycle < MaxCycle:
-    
-    uploadThreads = []
-    
-    #print('Cycle ' + str(cycle) + ' : ' + pytz.utc.localize(datetime.datetime.utcnow()).astimezone(pytz.timezone(location)).strftime('%Y-%m-%d %H:%M:%S'))
+if __name__ == '__main__':
+    MaxCycle = 3
 
-    # start time of cycle
-    utc_now = pytz.utc.localize(datetime.datetime.utcnow())
-    location_now = utc_now.astimezone(pytz.timezone(location))
-    location_now_str = location_now.strftime('%Y-%m-%d %H:%M:%S')
-    
-    # guard tour: move the camera among presets in guardtour, get and post images
-    for position in range(len(guardtour)):
-        # start time of each preset
-        position_utc_now = pytz.utc.localize(datetime.datetime.utcnow())
-        position_loc_now = position_utc_now.astimezone(pytz.timezone(location))
-        position_loc_now_str = position_loc_now.strftime('%Y-%m-%d %H:%M:%S')
+    # check program arguments
+    if len(sys.argv) >= 2:
+        MaxCycle = int(sys.argv[1])
         
-        if (len(guardtour)) > 1:
-            movetopreset(position, position_loc_now_str)
-        
-        # wait for camera to move the preset properly
-        time.sleep(guardtour[position]['ptz'])
-        
-        # HTTP Get image from an AXIS visual camera
+    if MaxCycle < 0 or MaxCycle > 86400:
+        print('Parameter is out of range.')
+        sys.exit()
+
+    # if there is no program argumemt, then ask user input
+    while len(sys.argv) < 2:
+        print('How many guard tour cycles?')
+        MaxCycle = input()
         try:
-            res = requests.get(cameraUrl + '/axis-cgi/jpg/image.cgi?resolution=1920X1080', auth=HTTPDigestAuth('username', 'password'))
-        except Exception as exc:
-            print('There was a problem: %s' % (exc))
-            
-        # if HTTP Get successes
-        if res.status_code == 200:
-        
-            # Check weather info at 10 minutes interval. Need to import weather
-            if Flag_Weather:
-                if lastOWtime + datetime.timedelta(seconds=600) < position_utc_now:
-                    weather_now = weather.weather(latitude, longitude)
-                    lastOWtime = position_utc_now
-                    #print('Last time to call OpenWeather API: ' + position_loc_now_str)
-            
-            # write respone image to file_path
-            try:
-                inputReady = False
-                with file_path.open(mode='wb') as imageFile:
-                    for chunk in res.iter_content(100000):
-                        imageFile.write(chunk) 
-                inputReady = True
-            except Exception as e:
-                print(f"Error1: {e}")
-                            
-            # Header includes local time and weather info
-            if Flag_Overlay:
-                header = 'roboticscats.com | ' + position_loc_now_str + ' | ' + weather_now
-                # write timestamp and weather info on the image top left corner
-                try:
-                   with Image.open(file_path) as imageText:
-                        draw = ImageDraw.Draw(imageText)
-                        draw.text((20,30), header, font=Font)
-                        imageText.save(file_path)
-                except Exception as e:
-                    print(f"Error2: {e}")
-            
-            # HTTP Post image to LookOut
-            if inputReady:
-                lookoutUrl = guardtour[position]['lookout']
-                message = lookoutName + '-' + str(guardtour[position]['preset']) + ' at ' + location_now_str + '. Weather: ' + weather_now
-                try:
-                    # thread to achieve concurrent network uploads
-                    if Flag_SMS:
-                        message = lookoutName + '-' + str(guardtour[position]['preset']) + ' at ' + location_now_str + '. Weather: ' + weather_now
-                        uploadThread = threading.Thread(target=uploadimage.upload_image_alert, args=(lookoutUrl, file_path, message)) 
-                    else:
-                        uploadThread = threading.Thread(target=uploadimage.upload_image, args=(lookoutUrl, file_path))                                    
-                    uploadThreads.append(uploadThread)
-                    uploadThread.start()
-                except Exception as e:
-                    print(f"Error3: {e}")
-                    failure = failure + 1
-
-            else:               
-                failure = failure + 1
-                
-        else:
-            failure = failure + 1
-
-    for uploadThread in uploadThreads:
-        uploadThread.join()
-        
-    # dt is the total time used in this cycle           
-    dt = pytz.utc.localize(datetime.datetime.utcnow()) - utc_now
-    
-    #print('\t  Busy time for PTZ, HTTP Get, overlay, & Post: ' + str(round(dt.total_seconds(),2)))
-    if min_cycle_time > round(dt.total_seconds(),2):
-        min_cycle_time = round(dt.total_seconds(),2)
-        
-    # wait till next interval
-    if MaxCycle > 1 and (dt.total_seconds() < interval):
-        time.sleep(interval - dt.total_seconds())
-
-    # save detection information at the end of each guard tour cycles
-    utc_last = pytz.utc.localize(datetime.datetime.utcnow())
-    location_last = utc_last.astimezone(pytz.timezone(location))
-    location_last_str = location_last.strftime('%Y-%m-%d %H:%M:%S')
-    time_spent = utc_last - utc_start
-
-    # go to next guard tour cycle
-    cycle = cycle + 1   
-
-    with open('summary-wwf.txt', mode='w') as file_object:
-        print('LookOut Messenger mission completed.\n', file=file_object)
-        
-        print('LookOut camera: ' + lookoutName, file=file_object)
-        print('Detection interval: ' + str(interval) + ' seconds', file=file_object)
-        print('Guard tour cycle: ' + str(MaxCycle) + '\n', file=file_object)
-        
-        print('Start time: ' + location_start.strftime('%Y-%m-%d %H:%M:%S') + ', ' + location, file=file_object)
-        print('Last time: ' + location_last_str + ', ' + location +'\n', file=file_object)
-        
-        print(str(cycle) + ' guard tour cycles made in the last ' + str(int(time_spent.total_seconds())) + ' seconds.', file=file_object)
-        print('Fastest cycle is ' + str(min_cycle_time) + ' seconds.', file=file_object)
-        print(str(cycle * len(guardtour)) + ' image uploads and ' + str(failure) + ' upload failure.', file=file_object)
-        #print(str(failure) + ' image upload failure.', file=file_object)
-       
-    
-# the main program ends
-print(f'LookOut Messenger mission completed at {location_last_str}.')
+            MaxCycle = int(MaxCycle)
+        except:
+            print('Please use numeric digits.')
+            continue
+        if MaxCycle < 1:
+            print('Please enter a positive number.')
+            continue
+        if MaxCycle > 86400:
+            print('Please enter a positive number less than 86400.')
+            continue
+        break
+
+    print(f'Your want to run {MaxCycle} guard tour cycles.\n')
+
+    # change current working directory to ~/Documents/python
+    os.chdir(Path.home()/Path('Documents/python'))
+
+    # timing of each stage is served on the metrics endpoint and saved to metrics.json every minute
+    if metricsPort:
+        metrics.serve(metricsPort)
+    metrics.start_dump('metrics.json')
+
+    camera = {'name':lookoutName, 'cameraUrl':cameraUrl, 'username':cameraUser, 'password':cameraPassword, 'latitude':latitude, 'longitude':longitude,
+              'interval':interval, 'capture':captureMode, 'upload':uploadMode, 'guardtour':guardtour}
+    tour = engine.GuardTour(camera, location, Flag_Overlay=Flag_Overlay, Flag_Weather=Flag_Weather, Flag_SMS=Flag_SMS, Flag_Adaptive=Flag_Adaptive, Flag_Planner=Flag_Planner, Flag_Archive=Flag_Archive,
+                            font_path=FontPath, font_size=FontSize, position=(20,30))
+    location_last_str = None
+    try:
+        tour.run(MaxCycle)
+    finally:
+        # save detection information at the end, also of a run stopped by Ctrl-C or an error. Live numbers are on the metrics endpoint
+        if tour.started:
+            location_last_str = tour.save_summary('summary-wwf.txt')
+        metrics.dump_json('metrics.json')
+
+    # the main program ends
+    print(f'LookOut Messenger mission completed at {location_last_str}.')
@@ -0,0 +1,195 @@
+#! python3
+# metrics.py - Time each stage (PTZ, HTTP Get, overlay, HTTP Post, SMS) by camera and preset
+# Last update: 20261018: p50/p95/p99 of each stage, gauges, Prometheus text and JSON, gauges of each queue
+# Developer: @roboticscats, @jiansuo
+import os, json, time, threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# most recent samples of each stage kept for p50/p95/p99
+window = 1024
+quantiles = (0.5, 0.95, 0.99)
+# metrics names start with prefix
+prefix = 'messenger'
+
+_histograms = {}
+_gauges = {}
+# objects made of each kind, for the queue label of their gauges
+_made = {}
+_lock = threading.Lock()
+
+# timings of one stage of one camera and preset
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count = self.count + 1
+        self.sum = self.sum + seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    # {'count', 'sum', 'max', 'p50', 'p95', 'p99'}
+    def summary(self):
+        samples = sorted(self.samples)
+        s = {'count': self.count, 'sum': round(self.sum, 4), 'max': round(self.max, 4)}
+        for q in quantiles:
+            s['p' + str(round(q * 100))] = round(samples[min(int(q * len(samples)), len(samples) - 1)], 4) if samples else None
+        return s
+
+# add one timing in seconds of a stage
+def observe(stage, seconds, camera='', preset=''):
+    key = (stage, camera, preset)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = Histogram()
+            _histograms[key] = h
+        h.observe(seconds)
+
+# time a block of code: with metrics.timer('get', camera, preset): ...
+class timer:
+    def __init__(self, stage, camera='', preset=''):
+        self.key = (stage, camera, preset)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        observe(self.key[0], self.seconds, self.key[1], self.key[2])
+
+# call func(*args) and time it as a stage
+def timed(stage, camera, preset, func, *args):
+    with timer(stage, camera, preset):
+        return func(*args)
+
+# timings of a stage of all cameras and presets together
+def stage_summary(stage):
+    merged = Histogram()
+    merged.samples = deque()
+    with _lock:
+        for key, h in _histograms.items():
+            if key[0] == stage:
+                merged.count = merged.count + h.count
+                merged.sum = merged.sum + h.sum
+                merged.max = max(merged.max, h.max)
+                merged.samples.extend(h.samples)
+    return merged.summary()
+
+# set a gauge to a number, or to a function called when the metrics are read.
+# queue names the object the gauge belongs to, so two upload queues or alert dispatchers keep their own gauges
+def gauge(name, value, camera='', queue=''):
+    with _lock:
+        _gauges[(name, camera, queue)] = value
+
+# remove the gauges of a queue, e.g. when it is closed
+def drop_gauges(queue):
+    with _lock:
+        for key in [key for key in _gauges if key[2] == queue]:
+            del _gauges[key]
+
+# a queue name for the next object of a kind: 'uploads-1', 'uploads-2', ...
+def queue_name(kind):
+    with _lock:
+        _made[kind] = _made.get(kind, 0) + 1
+        return kind + '-' + str(_made[kind])
+
+# all metrics as a dict
+def snapshot():
+    with _lock:
+        histograms = [(key, h.summary()) for key, h in _histograms.items()]
+        gauges = list(_gauges.items())
+    stages = []
+    for (stage, camera, preset), s in sorted(histograms):
+        stages.append(dict(stage=stage, camera=camera, preset=preset, **s))
+    values = []
+    for (name, camera, queue), value in sorted(gauges, key=lambda g: g[0]):
+        try:
+            value = value() if callable(value) else value
+        except Exception as e:
+            print(f"Error: {e}")
+            value = None
+        values.append({'name': name, 'camera': camera, 'queue': queue, 'value': value})
+    return {'time': time.time(), 'stages': stages, 'gauges': values}
+
+# label text of Prometheus
+def labels(**kwargs):
+    return '{' + ','.join(k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for k, v in kwargs.items()) + '}'
+
+# all metrics as Prometheus text
+def prometheus():
+    s = snapshot()
+    lines = ['# TYPE ' + prefix + '_stage_seconds summary']
+    for h in s['stages']:
+        for q in quantiles:
+            value = h['p' + str(round(q * 100))]
+            if value is not None:
+                lines.append(prefix + '_stage_seconds' + labels(stage=h['stage'], camera=h['camera'], preset=h['preset'], quantile=q) + ' ' + str(value))
+        lines.append(prefix + '_stage_seconds_sum' + labels(stage=h['stage'], camera=h['camera'], preset=h['preset']) + ' ' + str(h['sum']))
+        lines.append(prefix + '_stage_seconds_count' + labels(stage=h['stage'], camera=h['camera'], preset=h['preset']) + ' ' + str(h['count']))
+    typed = set()
+    for g in s['gauges']:
+        if g['value'] is None:
+            continue
+        if g['name'] not in typed:
+            typed.add(g['name'])
+            lines.append('# TYPE ' + prefix + '_' + g['name'] + ' gauge')
+        lines.append(prefix + '_' + g['name'] + (labels(camera=g['camera'], queue=g['queue']) if g['queue'] else labels(camera=g['camera'])) + ' ' + str(g['value']))
+    return '\n'.join(lines) + '\n'
+
+# write all metrics to a JSON file, write a new file then rename so a reader never sees half a file
+def dump_json(path):
+    try:
+        temp_file = str(path) + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(temp_file, path)
+    except Exception as e:
+        print(f"Error: {e}")
+
+# write the JSON file every few seconds in the background
+def start_dump(path, every=60):
+    def dump():
+        while True:
+            time.sleep(every)
+            dump_json(path)
+    thread = threading.Thread(target=dump, daemon=True)
+    thread.start()
+    return thread
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(snapshot()).encode()
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics'):
+            body = prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# serve /metrics (Prometheus text) and /metrics.json on a local port in the background, return the server
+def serve(port=9108, host='127.0.0.1'):
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,159 @@
+#! python3
+# mjpeg.py - Keep one MJPEG stream of an AXIS camera open and take the latest frame from memory
+# Last update: 20261018: incremental multipart parser, ring buffer of the latest frames, reconnect, frame age
+# Developer: @roboticscats, @jiansuo
+import time, threading, requests, metrics
+from collections import deque
+
+# frames of the stream asked from the camera per second, lower saves uplink bandwidth of remote sites
+stream_fps = 2
+# frames kept of each stream, the newest one is the capture
+buffer_frames = 3
+# seconds to wait before reconnecting a broken stream, doubled after every failure up to reconnect_max
+reconnect_min = 1.0
+reconnect_max = 30.0
+# bytes read from the stream at a time
+chunk_size = 64 * 1024
+# most bytes of one part, a stream without boundaries in this many bytes is broken
+max_part_size = 16 * 1024 * 1024
+# seconds a capture waits for a new frame before falling back to image.cgi
+capture_timeout = 3.0
+
+# incremental parser of a multipart/x-mixed-replace stream, feed it chunks and get the complete jpeg frames
+class MultipartParser:
+    def __init__(self, boundary):
+        self.boundary = b'--' + boundary.encode('latin-1').lstrip(b'-')
+        self.buffer = bytearray()
+        # bytes of the body of the current part, -1 if the part has no Content-Length, None while reading headers
+        self.length = None
+
+    # add a chunk of the stream, return a list of the jpeg frames completed by it
+    def feed(self, data):
+        self.buffer.extend(data)
+        frames = []
+        while True:
+            if self.length is None:
+                # the CRLF after a body belongs to the next boundary
+                while self.buffer.startswith(b'\r\n'):
+                    del self.buffer[:2]
+                end = self.buffer.find(b'\r\n\r\n')
+                if end < 0:
+                    break
+                self.length = -1
+                for line in bytes(self.buffer[:end]).decode('latin-1').split('\r\n'):
+                    key, _, value = line.partition(':')
+                    if key.strip().lower() == 'content-length':
+                        self.length = int(value)
+                del self.buffer[:end + 4]
+            if self.length >= 0:
+                if len(self.buffer) < self.length:
+                    break
+                frame = bytes(self.buffer[:self.length])
+                del self.buffer[:self.length]
+            else:
+                end = self.buffer.find(self.boundary)
+                if end < 0:
+                    break
+                frame = bytes(self.buffer[:end]).rstrip(b'\r\n')
+                del self.buffer[:end]
+            self.length = None
+            if frame.startswith(b'\xff\xd8'):
+                frames.append(frame)
+        if len(self.buffer) > max_part_size:
+            raise ValueError('no multipart boundary in ' + str(len(self.buffer)) + ' bytes')
+        return frames
+
+# a captured frame that looks like the HTTP response of image.cgi, so change detection and upload take it as is
+class FrameResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {}
+
+# one long lived MJPEG stream of a camera read by a background thread
+class StreamGrabber:
+    def __init__(self, cameraUrl, auth=None, name='', resolution='1920x1080'):
+        self.url = cameraUrl + '/axis-cgi/mjpg/video.cgi?resolution=' + resolution + '&fps=' + str(stream_fps)
+        self.auth = auth
+        self.name = name
+        # (time.monotonic() when the frame arrived, jpeg bytes), newest last
+        self.frames = deque(maxlen=buffer_frames)
+        self.cond = threading.Condition()
+        self.stopped = threading.Event()
+        self.response = None
+        self.stats = {'frames': 0, 'connects': 0, 'errors': 0}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        metrics.gauge('frame_age_seconds', self.age, name)
+
+    def run(self):
+        delay = reconnect_min
+        # a session of its own, the stream holds its connection for ever and must not take one of the shared pool
+        session = requests.Session()
+        while not self.stopped.is_set():
+            try:
+                self.response = session.get(self.url, auth=self.auth, stream=True, timeout=(5, 10))
+                with self.response:
+                    if self.response.status_code != 200:
+                        raise ValueError('HTTP ' + str(self.response.status_code) + ' from ' + self.url)
+                    content_type = self.response.headers.get('Content-Type', '')
+                    boundary = content_type.partition('boundary=')[2].split(';')[0].strip().strip('"') or 'myboundary'
+                    parser = MultipartParser(boundary)
+                    self.stats['connects'] = self.stats['connects'] + 1
+                    for chunk in self.response.iter_content(chunk_size):
+                        if self.stopped.is_set():
+                            break
+                        for frame in parser.feed(chunk):
+                            self.put(frame)
+                            delay = reconnect_min
+            except Exception as e:
+                if not self.stopped.is_set():
+                    print(f"Error: {e}")
+                    self.stats['errors'] = self.stats['errors'] + 1
+            if self.stopped.wait(delay):
+                break
+            delay = min(delay * 2, reconnect_max)
+        session.close()
+
+    def put(self, frame):
+        with self.cond:
+            self.frames.append((time.monotonic(), frame))
+            self.stats['frames'] = self.stats['frames'] + 1
+            self.cond.notify_all()
+
+    # seconds since the newest frame arrived, None before the first frame
+    def age(self):
+        with self.cond:
+            if not self.frames:
+                return None
+            return round(time.monotonic() - self.frames[-1][0], 3)
+
+    # the newest frame that arrived at or after time.monotonic() after, waiting at most timeout seconds.
+    # A PTZ camera passes the time it settled so no frame taken while moving is used. Return a FrameResponse or None
+    def capture(self, after=None, timeout=None):
+        after = time.monotonic() if after is None else after
+        deadline = time.monotonic() + (capture_timeout if timeout is None else timeout)
+        with self.cond:
+            while not self.frames or self.frames[-1][0] < after:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.stopped.is_set():
+                    return None
+                self.cond.wait(remaining)
+            arrived, frame = self.frames[-1]
+        metrics.observe('frame_age', time.monotonic() - arrived, self.name)
+        return FrameResponse(frame)
+
+    def close(self):
+        self.stopped.set()
+        response = self.response
+        if response is not None:
+            # unblock the read of the stream thread
+            response.close()
+        with self.cond:
+            self.cond.notify_all()
+        self.thread.join(5)
+
+    # one line report of the stream counters
+    def report(self):
+        return 'MJPEG stream ' + self.name + ': ' + str(self.stats['frames']) + ' frames, ' + str(self.stats['connects']) + ' connections, ' + str(self.stats['errors']) + ' errors.'
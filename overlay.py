@@ -0,0 +1,146 @@
+#! python3
+# overlay.py - Write local time and weather info on a jpeg image kept in memory
+# Last update: 20261018: cached header glyphs and segments, jpeg quality/subsampling settings, scaled upload encoding
+# Developer: @roboticscats, @jiansuo
+import io, threading
+from collections import OrderedDict
+from PIL import Image, ImageDraw, ImageColor, ImageChops
+
+# brand text at the start of every header
+brand = 'roboticscats.com'
+# jpeg encoder settings of the overlaid image.
+# 'keep' reuses the quantization tables and chroma subsampling of the camera image, so the image looks the same as before
+quality = 'keep'
+subsampling = 'keep'
+# settings used when the input image is not a jpeg, or is scaled down
+default_quality = 75
+default_subsampling = -1
+# number of rendered static segments (e.g. weather strings) kept in the cache
+segment_cache_size = 64
+
+# header renderer of one font and position.
+# Static segments (brand, weather) are rendered once and cached as a whole,
+# dynamic segments (local time) are put together from cached glyphs.
+class HeaderRenderer:
+    def __init__(self, font, position=(20, 30), fill='white'):
+        self.font = font
+        self.position = position
+        self.fill = fill
+        self.glyphs = {}
+        self.segments = OrderedDict()
+        self.lock = threading.Lock()
+
+    # render text into a mask, return (mask, offset, advance)
+    def render_text(self, text):
+        left, top, right, bottom = self.font.getbbox(text)
+        ox, oy = min(left, 0), min(top, 0)
+        mask = Image.new('L', (max(right - ox, 1), max(bottom - oy, 1)))
+        ImageDraw.Draw(mask).text((-ox, -oy), text, fill=255, font=self.font)
+        return mask, (ox, oy), self.font.getlength(text)
+
+    # cached mask of a static segment
+    def segment(self, text):
+        with self.lock:
+            item = self.segments.get(text)
+            if item is not None:
+                self.segments.move_to_end(text)
+                return [(0, item)]
+        item = self.render_text(text)
+        with self.lock:
+            self.segments[text] = item
+            while len(self.segments) > segment_cache_size:
+                self.segments.popitem(last=False)
+        return [(0, item)]
+
+    # masks of a dynamic segment from cached glyphs
+    def glyph_run(self, text):
+        run = []
+        pen = 0
+        for ch in text:
+            item = self.glyphs.get(ch)
+            if item is None:
+                item = self.render_text(ch)
+                self.glyphs[ch] = item
+            run.append((pen, item))
+            pen = pen + item[2]
+        return run
+
+    # header mask of the segments, a segment is (text, static)
+    def header_mask(self, segments):
+        parts = []
+        pen = 0
+        for text, static in segments:
+            if not text:
+                continue
+            run = self.segment(text) if static else self.glyph_run(text)
+            for x, (mask, (ox, oy), advance) in run:
+                parts.append((round(pen + x + ox), oy, mask))
+            pen = pen + self.font.getlength(text)
+        if not parts:
+            return None, (0, 0)
+        left = min(x for x, y, mask in parts)
+        top = min(y for x, y, mask in parts)
+        width = max(x + mask.size[0] for x, y, mask in parts) - left
+        height = max(y + mask.size[1] for x, y, mask in parts) - top
+        header = Image.new('L', (width, height))
+        for x, y, mask in parts:
+            # glyph boxes may overlap, keep the brightest pixel like drawing the whole text would
+            box = (x - left, y - top, x - left + mask.size[0], y - top + mask.size[1])
+            header.paste(ImageChops.lighter(header.crop(box), mask), box)
+        return header, (left, top)
+
+    # write the segments on the image scaled by scale, return the new jpeg bytes or None if the image is broken.
+    # jpeg_quality None uses the quality setting
+    def render(self, image_data, segments, scale=1.0, jpeg_quality=None):
+        try:
+            mask, (left, top) = self.header_mask(segments)
+            with Image.open(io.BytesIO(image_data)) as imageText:
+                if scale < 1.0:
+                    imageText = scaled(imageText, scale)
+                if mask is not None:
+                    # only the header band of the image is changed
+                    box = (self.position[0] + left, self.position[1] + top)
+                    imageText.paste(ImageColor.getcolor(self.fill, imageText.mode), box + (box[0] + mask.size[0], box[1] + mask.size[1]), mask)
+                output = io.BytesIO()
+                if jpeg_quality is not None:
+                    imageText.save(output, 'JPEG', quality=jpeg_quality, subsampling=default_subsampling)
+                elif imageText.format == 'JPEG':
+                    imageText.save(output, 'JPEG', quality=quality, subsampling=subsampling)
+                else:
+                    imageText.save(output, 'JPEG', quality=default_quality, subsampling=default_subsampling)
+                return output.getvalue()
+        except Exception as e:
+            print(f"Error2: {e}")
+            return None
+
+    # write 'brand | local time | weather' on the image
+    def overlay(self, image_data, local_time, weather='', scale=1.0, jpeg_quality=None):
+        return self.render(image_data, [(brand + ' | ', True), (local_time, False), (' | ' + weather, True)], scale, jpeg_quality)
+
+# the image scaled by scale. The jpeg decoder skips most of its work for 1/2, 1/4 and 1/8
+def scaled(image, scale):
+    size = (max(round(image.size[0] * scale), 1), max(round(image.size[1] * scale), 1))
+    image.draft('RGB', size)
+    if image.size != size:
+        image = image.resize(size, Image.BILINEAR)
+    return image
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+# the shared renderer of a font and position
+def renderer(font, position=(20, 30)):
+    with _renderers_lock:
+        r = _renderers.get((id(font), position))
+        if r is None:
+            r = HeaderRenderer(font, position)
+            _renderers[(id(font), position)] = r
+        return r
+
+# scale and encode the image without a header, return the new jpeg bytes or None if the image is broken
+def reencode(image_data, scale=1.0, jpeg_quality=None):
+    return HeaderRenderer(None).render(image_data, [], scale, jpeg_quality)
+
+# write header on the image at position, return the new jpeg bytes or None if the image is broken
+def overlay_header(image_data, header, font, position=(20, 30)):
+    return renderer(font, position).render(image_data, [(header, False)])
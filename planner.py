@@ -0,0 +1,160 @@
+#! python3
+# planner.py - Visit the presets of a guard tour that scored recently, or look hazy or smoky, more often than quiet ones
+# Last update: 20261018: preset weights from LookOut scores, detection history and a pre-screen of each frame
+# Developer: @roboticscats, @jiansuo
+import io, time, threading
+from PIL import Image, ImageChops, ImageStat
+
+# seconds for the weight of a LookOut score to halve
+half_life = 1800
+# weight a quiet preset has, added by each LookOut score, and added while the last frame of the preset is flagged
+base_weight = 1.0
+score_weight = 4.0
+screen_weight = 2.0
+# weight of a preset with a hit rate of 1.0 in the detection store history, and the days of history read at the start
+history_weight = 4.0
+history_days = 7
+# fastest and slowest interval of a preset, as a factor of its interval in the guard tour
+min_factor = 0.5
+max_factor = 3.0
+# the pre-screen decodes the frame at about this width
+screen_width = 64
+# a frame is flagged when its haze (mean of the darkest colour of each pixel) or its smoke share
+# (bright pixels with little colour) rise this much over the usual frames of the preset
+haze_threshold = 12.0
+smoke_threshold = 0.04
+# saturation below and brightness above which a pixel counts as smoke, 0-255
+smoke_saturation = 40
+smoke_brightness = 150
+# weight of the newest frame in the usual frame statistics of a preset
+baseline_alpha = 0.1
+
+# (haze, smoke share) of a jpeg frame, None if the image is broken.
+# The jpeg decoder scales the frame down while decoding, the statistics are computed by Pillow in C
+def screen_stats(image_data):
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image.draft('RGB', (screen_width, screen_width))
+            image = image.convert('RGB')
+            if image.size[0] > screen_width:
+                image = image.resize((screen_width, max(round(image.size[1] * screen_width / image.size[0]), 1)), Image.BILINEAR)
+            r, g, b = image.split()
+            haze = ImageStat.Stat(ImageChops.darker(ImageChops.darker(r, g), b)).mean[0]
+            h, s, v = image.convert('HSV').split()
+            grey = s.point(lambda x: 255 if x < smoke_saturation else 0)
+            bright = v.point(lambda x: 255 if x > smoke_brightness else 0)
+            smoke = ImageStat.Stat(ImageChops.multiply(grey, bright)).mean[0] / 255
+            return haze, smoke
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+# visit weights and intervals of the presets of one guard tour.
+# presets is the guardtour list, interval the detection interval of presets without their own
+class Planner:
+    def __init__(self, name, presets, interval):
+        self.name = name
+        self.base = {p['preset']: p.get('interval', interval) for p in presets}
+        # decayed sum of score weights of each preset and when it was last decayed
+        self.heat = {preset: 0.0 for preset in self.base}
+        self.decayed = {preset: time.monotonic() for preset in self.base}
+        # usual (haze, smoke) of each preset, and if its last frame was flagged
+        self.baseline = {}
+        self.flagged = {preset: False for preset in self.base}
+        self.hits = {preset: 0 for preset in self.base}
+        self.intervals = dict(self.base)
+        self.stats = {'screened': 0, 'flagged': 0, 'scores': 0}
+        self.lock = threading.Lock()
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats[key] + n
+
+    # start from the hit rates of the last history_days in the detection store
+    def seed(self, path=None):
+        import detections
+        try:
+            rows = detections.hit_rates(path, self.name, time.time() - history_days * 86400)
+        except Exception as e:
+            print(f"Error: {e}")
+            return
+        with self.lock:
+            for row in rows:
+                if row['preset'] in self.heat and row['rate']:
+                    self.heat[row['preset']] = self.heat[row['preset']] + history_weight * row['rate']
+
+    # heat of a preset decayed to now, called with the lock held
+    def decay(self, preset):
+        now = time.monotonic()
+        self.heat[preset] = self.heat[preset] * 0.5 ** ((now - self.decayed[preset]) / half_life)
+        self.decayed[preset] = now
+        return self.heat[preset]
+
+    # add the LookOut result of a preset, score None if there is no detection
+    def record(self, preset, score):
+        if preset not in self.heat or score is None:
+            return
+        self.count('scores')
+        with self.lock:
+            self.decay(preset)
+            self.heat[preset] = self.heat[preset] + score_weight
+            self.hits[preset] = self.hits[preset] + 1
+
+    # pre-screen a frame of a preset, return True if it looks hazier or smokier than the usual frames of the preset
+    def screen(self, preset, image_data):
+        stats = screen_stats(image_data)
+        if stats is None or preset not in self.flagged:
+            return False
+        self.count('screened')
+        with self.lock:
+            usual = self.baseline.get(preset)
+            flagged = usual is not None and (stats[0] - usual[0] > haze_threshold or stats[1] - usual[1] > smoke_threshold)
+            # the usual statistics follow slow changes of the scene, e.g. the time of day
+            self.baseline[preset] = stats if usual is None else tuple((1 - baseline_alpha) * u + baseline_alpha * x for u, x in zip(usual, stats))
+            self.flagged[preset] = flagged
+        if flagged:
+            self.count('flagged')
+        return flagged
+
+    # visit weight of each preset
+    def weights(self):
+        with self.lock:
+            return {preset: base_weight + self.decay(preset) + (screen_weight if self.flagged[preset] else 0.0) for preset in self.base}
+
+    # interval of each preset: the tour makes as many visits per hour as with the guard tour intervals,
+    # shared out by weight, each preset within min_factor and max_factor of its guard tour interval.
+    # The visit rate of a preset is factor * weight / interval clamped to its range, the factor is found by bisection
+    def plan(self):
+        weights = self.weights()
+        active = {preset: base for preset, base in self.base.items() if base > 0}
+        intervals = dict(self.base)
+        if not active:
+            return intervals
+        budget = sum(1.0 / base for base in active.values())
+        def rates(factor):
+            return {preset: min(max(factor * weights[preset] / base, 1.0 / (max_factor * base)), 1.0 / (min_factor * base)) for preset, base in active.items()}
+        low, high = 0.0, 1.0 / (min_factor * min(weights.values()))
+        for i in range(50):
+            factor = (low + high) / 2
+            if sum(rates(factor).values()) < budget:
+                low = factor
+            else:
+                high = factor
+        for preset, rate in rates(high).items():
+            intervals[preset] = round(1.0 / rate, 3)
+        with self.lock:
+            self.intervals = intervals
+        return intervals
+
+    # weight, planned interval and hits of each preset
+    def report(self):
+        weights = self.weights()
+        with self.lock:
+            return {preset: {'weight': round(weights[preset], 2), 'interval': self.intervals[preset], 'base': self.base[preset],
+                             'hits': self.hits[preset], 'flagged': self.flagged[preset]} for preset in self.base}
+
+    # one line report of the planner counters
+    def report_line(self):
+        with self.lock:
+            s = dict(self.stats)
+        return self.name + ' tour planner: ' + str(s['screened']) + ' frames screened, ' + str(s['flagged']) + ' flagged, ' + str(s['scores']) + ' LookOut scores.'
@@ -0,0 +1,99 @@
+#! python3
+# ptz.py - Move an AXIS PTZ camera to a preset and wait until it has settled
+# Last update: 20261018: settle detection by polling the camera PTZ position, calls bound by the deadline of the preset,
+#              a move from an unknown position waits for a change or min_settle
+# Developer: @roboticscats, @jiansuo
+import time, httppool
+
+# seconds between two PTZ position queries
+poll_interval = 0.2
+# seconds to wait after the move before the first position query
+min_wait = 0.4
+# number of same position readings in a row for the camera to be settled
+stable_polls = 2
+# seconds after the move before same readings count as settled when the position before the move is unknown
+# and the readings have not changed yet, the camera may not have started to move
+min_settle = 1.0
+# the largest pan/tilt (degree) and zoom (step) change counted as the same position
+tolerance = {'pan': 0.05, 'tilt': 0.05, 'zoom': 1.0}
+
+# move the AXIS camera to a preset, return the HTTP status code or None.
+# deadline (deadline.Deadline) bounds the HTTP calls, None uses the default timeouts
+def movetopreset(cameraUrl, preset, auth, deadline=None):
+    url = cameraUrl + '/axis-cgi/com/ptz.cgi?gotoserverpresetname=' + preset
+    try:
+        response = httppool.get(url, auth=auth, deadline=deadline)
+        return response.status_code
+    except Exception as exc:
+        print('There was a problem: %s' % (exc))
+        return None
+
+# current pan, tilt, zoom of the AXIS camera, or None if the camera does not tell
+def query_position(cameraUrl, auth, deadline=None):
+    try:
+        response = httppool.get(cameraUrl + '/axis-cgi/com/ptz.cgi?query=position', auth=auth, deadline=deadline)
+        if response.status_code != 200:
+            return None
+        # the response is lines of key=value, e.g. pan=12.5
+        position = {}
+        for line in response.text.splitlines():
+            key, _, value = line.partition('=')
+            if key.strip() in tolerance:
+                position[key.strip()] = float(value)
+        return position or None
+    except Exception as exc:
+        print('There was a problem: %s' % (exc))
+        return None
+
+# True if two positions are the same within tolerance
+def same_position(a, b):
+    if a is None or b is None:
+        return False
+    for key, limit in tolerance.items():
+        if abs(a.get(key, 0.0) - b.get(key, 0.0)) > limit:
+            return False
+    return True
+
+# settle state of one move: start is the position before the move, or None if unknown.
+# The camera has moved when a reading differs from start, or from the first reading when start is unknown.
+# With start unknown, readings that never change count after min_settle seconds, the camera may have been there already
+class Settle:
+    def __init__(self, start=None, clock=time.monotonic):
+        self.start = start
+        self.known = start is not None
+        self.clock = clock
+        self.started = clock()
+        self.previous = None
+        self.stable = 0
+        self.moved = False
+
+    # add a position reading, return True when the camera has settled
+    def update(self, position):
+        if self.start is None:
+            self.start = position
+        if not self.moved and (not same_position(self.start, position) or (not self.known and self.clock() - self.started >= min_settle)):
+            self.moved = True
+        if same_position(self.previous, position):
+            self.stable = self.stable + 1
+        else:
+            self.stable = 0
+        self.previous = position
+        return self.moved and self.stable + 1 >= stable_polls
+
+# wait until the camera stops moving, at most max_wait seconds and never past deadline. Return the settled position or None
+def wait_settled(cameraUrl, auth, max_wait, start=None, deadline=None):
+    if deadline is not None:
+        max_wait = deadline.limit(max_wait)
+    started = time.monotonic()
+    settle = Settle(start)
+    time.sleep(min(min_wait, max_wait))
+    while time.monotonic() - started < max_wait:
+        position = query_position(cameraUrl, auth, deadline)
+        if position is None:
+            # no position feedback, wait the full PTZ movement time
+            time.sleep(max(max_wait - (time.monotonic() - started), 0))
+            return None
+        if settle.update(position):
+            return position
+        time.sleep(poll_interval)
+    return settle.previous
@@ -0,0 +1,135 @@
+#! python3
+# scheduler.py - Drift-free detection schedule on the monotonic clock, earliest deadline first
+# Last update: 20261018: interval of each camera and preset, missed tick policy, cadence report, intervals changed on the fly
+# Developer: @roboticscats, @jiansuo
+import time, heapq
+
+# what to do when a tick is missed because a cycle ran over:
+# 'skip' goes on with the next tick in the future, 'catchup' runs the missed ticks back to back
+missed_policy = 'skip'
+# most missed ticks made up by 'catchup', older ones are skipped
+max_catchup = 3
+# presets due within this many seconds of each other join the same guard tour
+slack = 1.0
+
+class Scheduler:
+    def __init__(self, policy=None, clock=time.monotonic):
+        self.policy = policy or missed_policy
+        self.clock = clock
+        self.heap = []
+        self.entries = {}
+        # keys taken out by due() and not finished yet
+        self.taken = set()
+        self.seq = 0
+
+    # heap items of a key pushed before its last push are stale, they are dropped when they come first
+    def push(self, key):
+        self.entries[key]['seq'] = self.seq
+        heapq.heappush(self.heap, (self.entries[key]['deadline'], self.seq, key))
+        self.seq = self.seq + 1
+
+    def drop_stale(self):
+        while self.heap and self.entries[self.heap[0][2]]['seq'] != self.heap[0][1]:
+            heapq.heappop(self.heap)
+
+    # add a camera or preset with its interval in seconds, first due at start (default now)
+    def add(self, key, interval, start=None):
+        self.entries[key] = {'interval': interval, 'deadline': self.clock() if start is None else start,
+                             'last': None, 'ticks': 0, 'missed': 0, 'gap_sum': 0.0, 'gaps': 0, 'late_sum': 0.0, 'late_max': 0.0}
+        self.push(key)
+
+    # change the interval of key. A key waiting for its next tick is moved to the new interval after its last deadline
+    def retime(self, key, interval):
+        entry = self.entries[key]
+        if interval == entry['interval']:
+            return
+        previous = entry['deadline'] - entry['interval']
+        entry['interval'] = interval
+        if key not in self.taken and entry['last'] is not None and interval > 0:
+            entry['deadline'] = previous + interval
+            self.push(key)
+
+    # (deadline, key) due first, or None
+    def peek(self):
+        self.drop_stale()
+        if not self.heap:
+            return None
+        deadline, seq, key = self.heap[0]
+        return deadline, key
+
+    # seconds until the first deadline
+    def wait(self):
+        first = self.peek()
+        return 0.0 if first is None else max(first[0] - self.clock(), 0.0)
+
+    # sleep until the first deadline
+    def sleep(self):
+        time.sleep(self.wait())
+
+    # take out the keys due now, or within slack seconds, earliest deadline first. finish() puts them back
+    def due(self, slack=0.0):
+        now = self.clock()
+        keys = []
+        self.drop_stale()
+        while self.heap and self.heap[0][0] <= now + slack:
+            keys.append(heapq.heappop(self.heap)[2])
+            self.drop_stale()
+        self.taken.update(keys)
+        return keys
+
+    # a tick of key starts now: record how late it is and the time since the last tick. Return the lateness
+    def start(self, key):
+        entry = self.entries[key]
+        now = self.clock()
+        late = max(now - entry['deadline'], 0.0)
+        entry['late_sum'] = entry['late_sum'] + late
+        entry['late_max'] = max(entry['late_max'], late)
+        if entry['last'] is not None:
+            entry['gap_sum'] = entry['gap_sum'] + now - entry['last']
+            entry['gaps'] = entry['gaps'] + 1
+        entry['last'] = now
+        entry['ticks'] = entry['ticks'] + 1
+        return late
+
+    # the tick of key is done, schedule the next one interval after the last deadline (not after now, so no drift)
+    def finish(self, key):
+        entry = self.entries[key]
+        now = self.clock()
+        interval = entry['interval']
+        if interval <= 0:
+            entry['deadline'] = now
+        else:
+            entry['deadline'] = entry['deadline'] + interval
+            if entry['deadline'] < now:
+                behind = int((now - entry['deadline']) // interval) + 1
+                # catch up at most max_catchup ticks, skip the rest
+                keep = min(behind, max_catchup) if self.policy == 'catchup' else 0
+                skipped = behind - keep
+                entry['missed'] = entry['missed'] + skipped
+                entry['deadline'] = entry['deadline'] + skipped * interval
+        self.taken.discard(key)
+        self.push(key)
+
+    # finish the keys left taken by a cycle that failed half way, so they are scheduled again
+    def release(self):
+        for key in list(self.taken):
+            self.finish(key)
+
+    # target and actual cadence of each key
+    def report(self):
+        report = {}
+        for key, entry in self.entries.items():
+            report[key] = {'target': entry['interval'],
+                           'actual': round(entry['gap_sum'] / entry['gaps'], 3) if entry['gaps'] else None,
+                           'ticks': entry['ticks'], 'missed': entry['missed'],
+                           'late_mean': round(entry['late_sum'] / entry['ticks'], 3) if entry['ticks'] else None,
+                           'late_max': round(entry['late_max'], 3),
+                           'per_hour': round(3600 * entry['gaps'] / entry['gap_sum'], 1) if entry['gap_sum'] > 0 else None}
+        return report
+
+    # one line for each key of the cadence report
+    def report_lines(self):
+        lines = []
+        for key, r in self.report().items():
+            lines.append(str(key) + ': target ' + str(r['target']) + ' s, actual ' + str(r['actual']) + ' s, ' + str(r['per_hour']) + ' visits per hour, ' + str(r['ticks']) + ' ticks, ' + str(r['missed']) + ' missed, ' + str(r['late_max']) + ' s latest start.')
+        return lines
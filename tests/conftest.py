@@ -0,0 +1,5 @@
+# the modules of LookOut Messenger are in the folder above the tests
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,58 @@
+# SMS alert dispatcher with a stub transport: first hit at once, later hits coalesced until the cooldown ends
+import time
+import alerts
+
+def wait_sent(transport, n, timeout=5):
+    end = time.monotonic() + timeout
+    while len(transport.sent) < n and time.monotonic() < end:
+        time.sleep(0.01)
+    return list(transport.sent)
+
+def test_first_hit_is_sent_at_once():
+    transport = alerts.StubTransport()
+    sms = alerts.AlertDispatcher(transport, cooldown=600)
+    try:
+        started = time.monotonic()
+        assert sms.alert('cam', 'p1 10:00', 'Wind 3 m/s')
+        assert wait_sent(transport, 1) == [alerts.prefix + 'cam: p1 10:00. Wind 3 m/s']
+        assert time.monotonic() - started < 1
+    finally:
+        sms.close()
+
+def test_hits_in_the_cooldown_are_one_message():
+    transport = alerts.StubTransport()
+    sms = alerts.AlertDispatcher(transport, cooldown=0.5)
+    try:
+        sms.alert('cam', 'p1')
+        assert len(wait_sent(transport, 1)) == 1
+        for detail in ('p2', 'p3', 'p2'):
+            sms.alert('cam', detail)
+        # another camera has its own cooldown
+        sms.alert('other', 'p1')
+        sent = wait_sent(transport, 2)
+        assert sent[1] == alerts.prefix + 'other: p1'
+        sent = wait_sent(transport, 3)
+        assert sent[2] == alerts.prefix + 'cam: p2, p3 (3 hits)'
+    finally:
+        sms.close()
+    assert sms.stats['sent'] == 3
+    assert sms.stats['coalesced'] == 2
+
+def test_close_sends_the_waiting_hits():
+    transport = alerts.StubTransport()
+    sms = alerts.AlertDispatcher(transport, cooldown=600)
+    sms.alert('cam', 'p1')
+    wait_sent(transport, 1)
+    sms.alert('cam', 'p2')
+    sms.close()
+    assert transport.sent == [alerts.prefix + 'cam: p1', alerts.prefix + 'cam: p2']
+
+def test_full_queue_drops_without_waiting():
+    transport = alerts.StubTransport(latency=0.5)
+    sms = alerts.AlertDispatcher(transport, cooldown=0, queue_size=1)
+    try:
+        results = [sms.alert('cam' + str(n)) for n in range(5)]
+        assert not all(results)
+        assert sms.stats['dropped'] == results.count(False)
+    finally:
+        sms.close()
@@ -0,0 +1,109 @@
+# frame archive: batched appends, expiry by size and age, time range lookups on the index
+import os, time, bisect, socket
+import archive, fakeservers, uploadqueue
+
+def frame(n, size=60):
+    return b'\xff\xd8' + bytes([n % 256]) * (size - 2)
+
+def write(path, items, **settings):
+    store = archive.FrameArchive(path, flush_interval=0.05, **settings)
+    for camera, preset, data, ts in items:
+        store.add(camera, preset, data, ts)
+    store.close()
+    return store
+
+def test_append_and_read_back(tmp_path):
+    now = time.time()
+    items = [('cam', 'p%d' % (n % 2), frame(n), now + n) for n in range(10)]
+    store = write(tmp_path, items)
+    assert store.stats['written'] == 10
+    got = list(archive.frames('cam', path=tmp_path))
+    assert [f['data'] for f in got] == [data for camera, preset, data, ts in items]
+    assert [f['preset'] for f in got] == [preset for camera, preset, data, ts in items]
+    assert list(archive.frames('other', path=tmp_path)) == []
+
+def test_time_range_and_preset(tmp_path):
+    now = time.time()
+    write(tmp_path, [('cam', 'p%d' % (n % 2), frame(n), now + n) for n in range(10)])
+    # since is inclusive, until is exclusive
+    assert [f['ts'] - now for f in archive.frames('cam', now + 3, now + 7, path=tmp_path)] == [3, 4, 5, 6]
+    assert [f['ts'] - now for f in archive.frames('cam', now + 3, preset='p1', path=tmp_path)] == [3, 5, 7, 9]
+
+def test_search_is_a_binary_search_of_the_index():
+    times = [1.0, 2.0, 2.0, 5.0, 8.0, 13.0]
+    index = b''.join(archive.record.pack(ts, 0, n // 2, 0, 0) for n, ts in enumerate(times))
+    for value in (0.0, 1.0, 2.0, 3.0, 8.0, 13.0, 20.0):
+        assert archive.search(index, len(times), value) == bisect.bisect_left(times, value)
+    # the segment numbers grow too: 0, 0, 1, 1, 2, 2
+    assert archive.search(index, len(times), 1, field=2) == 2
+
+def test_expire_by_size(tmp_path):
+    now = time.time()
+    # one 60 byte frame per 100 byte segment, at most 250 bytes kept
+    store = write(tmp_path, [('cam', 'p', frame(n), now + n) for n in range(8)], segment_bytes=100, max_bytes=250)
+    assert store.stats['expired'] > 0
+    assert sum(os.path.getsize(archive.segment_path(tmp_path, n)) for n in archive.segments(tmp_path)) <= 250
+    got = [f['ts'] - now for f in archive.frames('cam', path=tmp_path)]
+    # the newest frames are kept, and the index has no records of deleted segments
+    assert got == list(range(8 - len(got), 8))
+    names = archive.load_names(tmp_path)
+    size = os.path.getsize(archive.index_path(tmp_path, names['cameras']['cam']))
+    assert size == len(got) * archive.record.size
+
+def test_expire_by_age(tmp_path):
+    now = time.time()
+    old = [('cam', 'p', frame(n), now - 10 * 86400 + n) for n in range(3)]
+    new = [('cam', 'p', frame(n), now + n) for n in range(2)]
+    write(tmp_path, old + new, segment_bytes=100)
+    assert [f['ts'] - now for f in archive.frames('cam', path=tmp_path)] == [0, 1]
+
+def test_max_age_none_keeps_any_age(tmp_path):
+    now = time.time()
+    old = [('cam', 'p', frame(n), now - 10 * 86400 + n) for n in range(3)]
+    new = [('cam', 'p', frame(n), now + n) for n in range(2)]
+    store = write(tmp_path, old + new, segment_bytes=100, max_age=None)
+    assert store.max_age is None
+    assert len(list(archive.frames('cam', path=tmp_path))) == 5
+    assert archive.FrameArchive(tmp_path/'other').max_age == archive.max_age
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def test_replay_posts_the_frames(tmp_path):
+    now = time.time()
+    write(tmp_path, [('cam', 'p', frame(n), now + n) for n in range(3)])
+    lookout = fakeservers.LookOutServer(score_rate=1.0)
+    url = fakeservers.start(lookout)
+    try:
+        got = archive.replay('cam', None, None, url, rate=100, path=tmp_path)
+    finally:
+        fakeservers.stop(lookout)
+    assert [ts - now for ts, preset, response in got] == [0, 1, 2]
+    assert all(response.status_code == 200 for ts, preset, response in got)
+
+def test_replay_never_uses_the_live_spool(tmp_path, monkeypatch):
+    now = time.time()
+    write(tmp_path/'archive', [('cam', 'p', frame(n), now + n) for n in range(3)])
+    live = tmp_path/'spool'
+    monkeypatch.setattr(uploadqueue, 'spool_dir', live)
+    monkeypatch.setattr(uploadqueue, 'retries', 0)
+    # LookOut is down: the frames are not posted, and nothing is left for the live queue to send later
+    got = archive.replay('cam', None, None, 'http://127.0.0.1:%d/' % closed_port(), rate=100, path=tmp_path/'archive')
+    assert [response for ts, preset, response in got] == [None, None, None]
+    assert not live.exists() or not list(live.iterdir())
+
+def test_replay_on_a_live_queue_is_labelled_apart(tmp_path):
+    now = time.time()
+    write(tmp_path/'archive', [('cam', 'p', frame(n), now + n) for n in range(2)])
+    posted = []
+    uploads = uploadqueue.UploadQueue(spool_dir=tmp_path/'spool', on_post=lambda camera, *args: posted.append(camera))
+    lookout = fakeservers.LookOutServer()
+    url = fakeservers.start(lookout)
+    try:
+        archive.replay('cam', None, None, url, rate=100, path=tmp_path/'archive', uploads=uploads)
+    finally:
+        uploads.close()
+        fakeservers.stop(lookout)
+    assert posted == ['replay:cam', 'replay:cam']
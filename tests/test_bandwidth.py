@@ -0,0 +1,68 @@
+# uplink estimate of a site from HTTP Post timings, and the encoding chosen so the tours of its cameras fit
+import pytest
+import bandwidth
+
+def test_estimate_bandwidth_and_latency():
+    site = bandwidth.Site('seq')
+    # one post after another: 0.1 s latency and 100 kB/s
+    for n, nbytes in enumerate((50000, 100000, 200000, 400000, 150000)):
+        site.record(nbytes, 0.1 + nbytes / 100000, end=10.0 * n)
+    rate, latency = site.estimate()
+    assert rate == pytest.approx(100000, rel=0.01)
+    assert latency == pytest.approx(0.1, abs=0.01)
+
+def test_posts_in_flight_share_the_link():
+    site = bandwidth.Site('shared')
+    # 4 posts of 100 kB at once on a 100 kB/s link each take 4 s, the link is not 25 kB/s
+    for round in range(3):
+        for n in range(4):
+            site.record(100000, 4.0, end=10.0 * round + 4.0)
+    rate, latency = site.estimate()
+    assert rate == pytest.approx(100000, rel=0.01)
+
+def choose(site, frames, interval, camera):
+    step, scale, q = site.choose(1000000, frames, interval, camera)
+    return site.last['budget']
+
+def test_one_camera_budget():
+    site = bandwidth.Site('one')
+    assert site.choose(1000000, 5, 60, 'cam') == (0, 1.0, None)
+    site.record(100000, 1.0)
+    # half of 60 s for 5 images at 100 kB/s
+    assert choose(site, 5, 60, 'cam') == 600000
+
+def test_cameras_of_a_site_share_the_budget():
+    site = bandwidth.Site('tower')
+    site.record(100000, 1.0)
+    assert choose(site, 5, 60, 'cam1') == 600000
+    # a second camera with the same tour on the tower halves the budget of each image
+    assert choose(site, 5, 60, 'cam2') == 300000
+    assert choose(site, 5, 60, 'cam1') == 300000
+    # a camera with a tour every 30 s uploads twice as often
+    assert choose(site, 5, 30, 'cam3') == 150000
+
+def test_gone_camera_leaves_the_site():
+    site = bandwidth.Site('gone')
+    site.record(100000, 1.0)
+    choose(site, 5, 60, 'cam1')
+    choose(site, 5, 60, 'cam2')
+    frames, interval, seen = site.tours['cam2']
+    site.tours['cam2'] = (frames, interval, seen - 121)
+    assert choose(site, 5, 60, 'cam1') == 600000
+    assert 'cam2' not in site.tours
+
+def test_slow_link_picks_the_smallest_encoding_above_the_floors():
+    site = bandwidth.Site('lte')
+    site.record(1000, 1.0)
+    step, scale, q = site.choose(1000000, 5, 60, 'cam')
+    assert step == len(site.steps) - 1
+    assert scale >= bandwidth.min_scale and q >= bandwidth.min_quality
+    # a fast link keeps the camera image
+    fast = bandwidth.Site('fiber')
+    fast.record(10000000, 1.0)
+    assert fast.choose(1000000, 5, 60, 'cam') == (0, 1.0, None)
+
+def test_encoded_learns_the_size_of_a_step():
+    site = bandwidth.Site('learn')
+    site.encoded(3, 1000000, 500000)
+    assert site.ratios[3] == pytest.approx((1 - bandwidth.alpha) * bandwidth.ladder[3][2] + bandwidth.alpha * 0.5)
@@ -0,0 +1,67 @@
+# unchanged images skipped by conditional GET validators, sha1 of the bytes and the perceptual hash
+import io
+import pytest
+from PIL import Image, ImageDraw
+import changedetect
+
+class Response:
+    def __init__(self, content=b'', status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+def jpeg(shade, quality=85, box=None):
+    image = Image.linear_gradient('L').resize((160, 90)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(box or (20, 20, 60, 60), fill=(shade, shade, shade))
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+def test_conditional_get_validators():
+    detector = changedetect.ChangeDetector()
+    assert 'If-None-Match' not in detector.headers('cam')
+    assert detector.changed('cam', Response(jpeg(0), headers={'ETag': '"a"', 'Last-Modified': 'Sun, 18 Oct 2026 10:00:00 GMT'}))
+    headers = detector.headers('cam')
+    assert headers['If-None-Match'] == '"a"'
+    assert headers['If-Modified-Since'] == 'Sun, 18 Oct 2026 10:00:00 GMT'
+    assert not detector.changed('cam', Response(status_code=304))
+    assert detector.skipped['not modified'] == 1
+    # the validators are of each key
+    assert 'If-None-Match' not in detector.headers('other')
+
+def test_identical_bytes_skipped_until_max_skip_time():
+    detector = changedetect.ChangeDetector(max_skip_time=60)
+    image = jpeg(0)
+    assert detector.changed('cam', Response(image))
+    assert not detector.changed('cam', Response(image))
+    assert detector.skipped['identical'] == 1
+    assert detector.changed('cam', Response(jpeg(255)))
+    # after max_skip_time the same image is uploaded again, and no validators are sent
+    detector.state['cam']['uploaded'] = detector.state['cam']['uploaded'] - 61
+    assert 'If-None-Match' not in detector.headers('cam')
+    assert detector.changed('cam', Response(jpeg(255)))
+
+def test_perceptual_hash_is_opt_in():
+    # the same picture encoded again has other bytes
+    first, again = jpeg(0, quality=90), jpeg(0, quality=70)
+    assert first != again
+    assert changedetect.distance(changedetect.dhash(first), changedetect.dhash(again)) <= 4
+    detector = changedetect.ChangeDetector()
+    assert detector.changed('cam', Response(first))
+    assert detector.changed('cam', Response(again))
+    assert detector.skipped['similar'] == 0
+
+def test_perceptual_hash_skips_similar_images():
+    detector = changedetect.ChangeDetector(threshold=4)
+    assert detector.changed('cam', Response(jpeg(0, quality=90)))
+    assert not detector.changed('cam', Response(jpeg(0, quality=70)))
+    assert detector.skipped['similar'] == 1
+    # a new shape moves many bits
+    assert detector.changed('cam', Response(jpeg(255, box=(100, 10, 150, 80))))
+
+def test_dhash_of_a_broken_image():
+    assert changedetect.dhash(b'not a jpeg') is None
+    detector = changedetect.ChangeDetector(threshold=4)
+    assert detector.changed('cam', Response(b'not a jpeg'))
+    assert detector.changed('cam', Response(b'not a jpeg either'))
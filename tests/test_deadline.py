@@ -0,0 +1,92 @@
+# deadlines of HTTP calls, cancellation of a call in flight, and hedged camera HTTP Gets against a fake AXIS camera
+import time, threading
+import pytest
+import deadline, fakeservers, httppool
+
+# random numbers of the fake camera in a given order: below its tail_rate a request stalls
+class Draws:
+    def __init__(self, values):
+        self.values = list(values)
+
+    def random(self):
+        return self.values.pop(0) if self.values else 1.0
+
+@pytest.fixture
+def camera():
+    camera = fakeservers.AxisServer(frames=fakeservers.make_frames((64, 48), 2), tail_rate=0.5, tail_latency=5.0)
+    url = fakeservers.start(camera)
+    yield camera, url + '/axis-cgi/jpg/image.cgi', httppool.digest_auth('username', 'password', url)
+    fakeservers.stop(camera)
+
+def test_child_deadline():
+    parent = deadline.Deadline(10)
+    assert parent.child(30).remaining() <= 10
+    assert parent.child(1).remaining() <= 1
+    child = parent.child()
+    called = []
+    child.on_cancel(lambda: called.append(1))
+    parent.cancel()
+    assert child.is_cancelled() and called == [1]
+    with pytest.raises(deadline.DeadlineExceeded):
+        child.check()
+    # a function given to a cancelled deadline is called at once
+    child.on_cancel(lambda: called.append(2))
+    assert called == [1, 2]
+    assert deadline.Deadline(0).expired()
+    assert deadline.Deadline().remaining() is None
+
+def test_cancel_drops_a_hung_call(camera):
+    server, url, auth = camera
+    server.random = Draws([0.0])
+    call = deadline.Deadline(30)
+    threading.Timer(0.3, call.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(deadline.DeadlineExceeded):
+        httppool.get(url, deadline=call, auth=auth)
+    assert time.monotonic() - started < 2.0
+
+def test_deadline_bounds_a_hung_call(camera):
+    server, url, auth = camera
+    server.random = Draws([0.0])
+    started = time.monotonic()
+    with pytest.raises(deadline.DeadlineExceeded):
+        httppool.get(url, deadline=deadline.Deadline(0.5), auth=auth)
+    assert time.monotonic() - started < 2.0
+
+def test_hedged_second_get_wins(camera):
+    server, url, auth = camera
+    # the first HTTP Get stalls, the second answers at once
+    server.random = Draws([0.0, 0.9])
+    before = deadline.stats()
+    started = time.monotonic()
+    response = deadline.hedged(url, deadline.Deadline(10), 0.2, auth=auth)
+    assert response.status_code == 200 and response.content.startswith(b'\xff\xd8')
+    assert time.monotonic() - started < 2.0
+    after = deadline.stats()
+    assert after['hedged'] == before['hedged'] + 1
+    assert after['hedge_won'] == before['hedge_won'] + 1
+
+def test_hedged_fast_get_needs_no_second(camera):
+    server, url, auth = camera
+    server.random = Draws([0.9])
+    before = deadline.stats()
+    response = deadline.hedged(url, deadline.Deadline(10), 0.5, auth=auth)
+    assert response.status_code == 200
+    time.sleep(0.6)
+    assert deadline.stats()['hedged'] == before['hedged']
+    assert server.counts['images'] == 1
+
+def test_get_hedges_only_above_the_recent_p95(camera, monkeypatch):
+    server, url, auth = camera
+    monkeypatch.setattr(deadline, 'hedge', True)
+    assert deadline.hedge_delay('hedge-test') is None
+    for n in range(deadline.hedge_min_samples - 1):
+        deadline.observe('hedge-test', 0.01)
+    assert deadline.hedge_delay('hedge-test') is None
+    deadline.observe('hedge-test', 0.01)
+    # never earlier than hedge_min_delay
+    assert deadline.hedge_delay('hedge-test') == deadline.hedge_min_delay
+    server.random = Draws([0.0, 0.9])
+    before = deadline.stats()
+    assert deadline.get(url, 'hedge-test', deadline.Deadline(10), auth=auth).status_code == 200
+    assert deadline.stats()['hedge_won'] == before['hedge_won'] + 1
@@ -0,0 +1,46 @@
+# scores of LookOut responses, and the store of detection records with its queries
+import pytest
+import detections
+
+class Response:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+@pytest.mark.parametrize('text, expected', [
+    ('{}', None),
+    ('{"score": 0.87, "bbox": [100, 200, 180, 260]}', 0.87),
+    ('[{"score": 0.4}, {"score": 0.9}, {"label": "smoke"}]', 0.9),
+    ('{"detections": [{"score": 0.3}, {"score": 0.6}]}', 0.6),
+    ('{"detections": []}', None),
+    ('{"score": null}', None),
+    # not the JSON we know
+    ('smoke score=0.72', 0.72),
+    ('{"result": {"score": 0.8}}', 0.8),
+    ('score', 1.0),
+])
+def test_score(text, expected):
+    assert detections.score(Response(text)) == expected
+
+def test_no_score_without_a_good_response():
+    assert detections.score(None) is None
+    assert detections.score(Response('{"score": 0.9}', 503)) is None
+
+def test_store_and_queries(tmp_path):
+    path = tmp_path/'detections.db'
+    store = detections.DetectionStore(path, flush_interval=0.05)
+    for n in range(10):
+        score = 0.9 if n % 5 == 0 else None
+        store.add('cam', 'p' + str(n % 2), heading=90, fov=60, ts=1000.0 + n, score=score, latency=1.0 + n / 10, status=200, nbytes=1000)
+    # a failed upload is stored but not counted as an image
+    store.add('cam', 'p0', ts=1010.0, status=503)
+    store.add('other', 'p0', ts=1011.0, score=0.5, latency=2.0, status=200)
+    store.close()
+    assert store.stats['written'] == 12
+    rates = detections.hit_rates(path, 'cam')
+    assert rates == [{'camera': 'cam', 'preset': 'p0', 'images': 5, 'hits': 1, 'rate': 0.2},
+                     {'camera': 'cam', 'preset': 'p1', 'images': 5, 'hits': 1, 'rate': 0.2}]
+    assert [r['ts'] for r in detections.recent_hits(path, 'cam')] == [1005.0, 1000.0]
+    trend = detections.latency_trend(path, 'cam', bucket=5)
+    assert [(t['start'], t['images'], t['max']) for t in trend] == [(1000, 5, 1.4), (1005, 5, 1.9)]
+    assert [r['camera'] for r in detections.hit_rates(path, since=1011.0)] == ['other']
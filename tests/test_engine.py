@@ -0,0 +1,116 @@
+# the detection cycle of a guard tour against a fake AXIS camera and a fake LookOut
+import time
+import pytest
+import detections, engine, fakeservers, ptz, uploadqueue
+
+@pytest.fixture(scope='module')
+def frames():
+    return fakeservers.make_frames((64, 48), 8)
+
+@pytest.fixture
+def servers(frames, monkeypatch):
+    monkeypatch.setattr(ptz, 'poll_interval', 0.02)
+    monkeypatch.setattr(ptz, 'min_wait', 0.02)
+    monkeypatch.setattr(ptz, 'min_settle', 0.1)
+    camera = fakeservers.AxisServer(frames=frames, move_time=0.05)
+    lookout = fakeservers.LookOutServer(latency=1.0, score_rate=0.0)
+    urls = fakeservers.start(camera), fakeservers.start(lookout)
+    yield camera, lookout, urls
+    fakeservers.stop(camera)
+    fakeservers.stop(lookout)
+
+def guard_tour(urls, tmp_path, presets=3, **settings):
+    camera_url, lookout_url = urls
+    cam = {'name': 'ptz', 'cameraUrl': camera_url, 'username': 'username', 'password': 'password', 'latitude': 22.0, 'longitude': 114.0,
+           'interval': 0, 'guardtour': [{'preset': 'p%d' % p, 'lookout': lookout_url + '/p%d' % p, 'ptz': 1.0, 'heading': 60 * p, 'FOV': 60} for p in range(presets)]}
+    cam.update(settings)
+    uploads = uploadqueue.UploadQueue(workers=4, spool_dir=tmp_path/'spool')
+    store = detections.DetectionStore(tmp_path/'detections.db', flush_interval=0.05)
+    return engine.GuardTour(cam, 'UTC', Flag_Overlay=False, Flag_Weather=False, uploads=uploads, store=store)
+
+def close(tour):
+    tour.close()
+    tour.uploads.close()
+    tour.store.close()
+
+def test_concurrency_limits_images_in_flight(servers, tmp_path):
+    camera, lookout, urls = servers
+    tour = guard_tour(urls, tmp_path, concurrency=1)
+    try:
+        started = time.monotonic()
+        futures = tour.run_cycle()
+        # each image waits for the HTTP Post of the one before it, 1 s each
+        assert time.monotonic() - started >= 2.0
+        assert len(futures) == 3
+        assert [f.result(5).status_code for p, f in futures] == [200, 200, 200]
+    finally:
+        close(tour)
+    assert tour.stats['uploads'] == 3
+    assert tour.stats['throttled'] == 0
+    assert tour.slots.acquire(blocking=False)
+
+def test_more_slots_overlap_the_uploads(servers, tmp_path):
+    camera, lookout, urls = servers
+    tour = guard_tour(urls, tmp_path, concurrency=3)
+    try:
+        started = time.monotonic()
+        futures = tour.run_cycle()
+        # the tour does not wait for the uploads
+        assert time.monotonic() - started < 1.5
+        assert [f.result(5).status_code for p, f in futures] == [200, 200, 200]
+    finally:
+        close(tour)
+
+def test_no_free_slot_by_the_deadline(servers, tmp_path):
+    camera, lookout, urls = servers
+    lookout.latency = 3.0
+    tour = guard_tour(urls, tmp_path, concurrency=1, interval=2)
+    try:
+        futures = tour.run_cycle()
+        # the first image holds the only slot, the next preset gives up by its share of the cycle budget
+        assert len(futures) == 1
+        assert tour.stats['throttled'] >= 1
+        assert tour.stats['failures'] == 2
+    finally:
+        close(tour)
+
+def test_cycle_counts_whole_tours(servers, tmp_path):
+    camera, lookout, urls = servers
+    lookout.latency = 0.0
+    tour = guard_tour(urls, tmp_path, presets=2, concurrency=4)
+    # the first preset is due every 0.5 s, the second every 2 s
+    tour.guardtour[0]['interval'] = 0.5
+    tour.guardtour[1]['interval'] = 2.0
+    tour.guardtour[0]['ptz'] = tour.guardtour[1]['ptz'] = 0.3
+    try:
+        tour.run(2)
+    finally:
+        tour.uploads.close()
+        tour.store.close()
+    # a cycle is done when both presets have been visited, the extra visits of the first preset are not cycles
+    assert tour.stats['cycles'] == 2
+    assert tour.stats['visits'] >= 5
+    cadence = tour.schedule.report()
+    assert cadence[0]['ticks'] > cadence[1]['ticks'] == 2
+    assert tour.toured == set()
+
+def test_http2_upload_mode(servers, tmp_path, monkeypatch):
+    import http2pool
+    camera, lookout, urls = servers
+    lookout.http2 = True
+    monkeypatch.setattr(uploadqueue, 'spool_dir', tmp_path/'spool')
+    http2pool.close()
+    cam = {'name': 'ptz', 'cameraUrl': urls[0], 'username': 'username', 'password': 'password', 'latitude': 22.0, 'longitude': 114.0, 'interval': 0, 'concurrency': 3, 'upload': 'http2',
+           'guardtour': [{'preset': 'p%d' % p, 'lookout': urls[1] + '/p%d' % p, 'ptz': 1.0, 'heading': 60 * p, 'FOV': 60} for p in range(3)]}
+    store = detections.DetectionStore(tmp_path/'detections.db', flush_interval=0.05)
+    tour = engine.GuardTour(cam, 'UTC', Flag_Overlay=False, Flag_Weather=False, store=store)
+    try:
+        futures = tour.run_cycle()
+        assert [f.result(5).http_version for p, f in futures] == ['HTTP/2'] * 3
+    finally:
+        tour.close()
+        store.close()
+        http2pool.close()
+    # the images of the tour were streams of one connection
+    assert lookout.counts['connections'] == 1
+    assert tour.stats['uploads'] == 3
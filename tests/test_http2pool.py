@@ -0,0 +1,80 @@
+# HTTP/2 posts against the fake LookOut: streams of one connection, fallback to HTTP/1.1, a stream out of time reset alone
+import time, threading
+import pytest
+import deadline, detections, fakeservers, http2pool, uploadqueue
+
+@pytest.fixture
+def lookout():
+    servers = []
+    def start(**settings):
+        server = fakeservers.LookOutServer(**settings)
+        servers.append(server)
+        return server, fakeservers.start(server)
+    http2pool.close()
+    yield start
+    http2pool.close()
+    for server in servers:
+        fakeservers.stop(server)
+
+# post to each path from its own thread at the same time, return the responses in order
+def post_all(urls, deadlines=None):
+    responses = [None] * len(urls)
+    def post(n):
+        try:
+            responses[n] = http2pool.post(urls[n], deadlines[n] if deadlines else None, headers={'Content-Type': 'image/jpeg'}, data=b'\xff\xd8' + bytes([n]) * 200000)
+        except Exception as e:
+            responses[n] = e
+    threads = [threading.Thread(target=post, args=(n,)) for n in range(len(urls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return responses
+
+def test_posts_share_one_connection(lookout):
+    server, url = lookout(latency=0.3, score_rate=0.0, hot={'/cam/p0': 1.0}, http2=True)
+    started = time.monotonic()
+    # frames larger than the 65535 byte windows go out as the window updates come
+    responses = post_all([url + '/cam/p%d' % n for n in range(5)])
+    assert time.monotonic() - started < 1.2
+    assert [r.status_code for r in responses] == [200] * 5
+    assert [r.http_version for r in responses] == ['HTTP/2'] * 5
+    # each frame has the response of its own endpoint
+    assert [detections.score(r) for r in responses] == [0.87, None, None, None, None]
+    assert server.counts == {'posts': 5, 'bytes': 5 * 200002, 'connections': 1}
+
+def test_fallback_to_http1(lookout):
+    server, url = lookout(score_rate=1.0)
+    before = http2pool.stats()
+    responses = post_all([url + '/cam/p%d' % n for n in range(3)])
+    assert [r.status_code for r in responses] == [200] * 3
+    assert detections.score(responses[0]) == 0.87
+    after = http2pool.stats()
+    assert after['fallbacks'] - before['fallbacks'] == 1
+    assert after['http2'] == before['http2']
+    # the host got no image on the connection that tried HTTP/2
+    assert server.counts['posts'] == 3
+
+def test_stream_out_of_time_is_reset_alone(lookout):
+    server, url = lookout(latency=1.0, http2=True)
+    before = http2pool.stats()
+    started = time.monotonic()
+    responses = post_all([url + '/late', url + '/on_time'], [deadline.Deadline(0.3), None])
+    assert isinstance(responses[0], deadline.DeadlineExceeded)
+    # the other stream of the connection still gets its response
+    assert responses[1].status_code == 200
+    assert time.monotonic() - started < 3
+    after = http2pool.stats()
+    assert after['reset'] - before['reset'] == 1
+    assert after['connections'] - before['connections'] == 1
+
+def test_upload_queue_over_http2(lookout, tmp_path):
+    server, url = lookout(score_rate=0.0, hot={'/cam/p1': 1.0}, http2=True)
+    uploads = uploadqueue.UploadQueue(workers=3, spool_dir=tmp_path, post=http2pool.post_image)
+    try:
+        futures = [uploads.submit(url + '/cam/p%d' % n, b'\xff\xd8frame', 'cam', 'p%d' % n) for n in range(3)]
+        assert [detections.score(f.result(10)) for f in futures] == [None, 0.87, None]
+    finally:
+        uploads.close()
+    assert uploads.stats['posted'] == 3
+    assert server.counts['connections'] == 1
@@ -0,0 +1,42 @@
+# shared session against fake AXIS cameras: one digest auth per camera, pools closed when the session is replaced
+import pytest
+import fakeservers, httppool
+
+@pytest.fixture(scope='module')
+def frames():
+    return fakeservers.make_frames((64, 48), 2)
+
+def test_digest_auth_per_camera(frames):
+    cameras = [fakeservers.AxisServer(frames=frames) for n in range(2)]
+    urls = [fakeservers.start(camera) for camera in cameras]
+    try:
+        auths = [httppool.digest_auth('username', 'password', url) for url in urls]
+        # the same credentials on two cameras, each camera has its own nonce
+        assert auths[0] is not auths[1]
+        assert httppool.digest_auth('username', 'password', urls[0] + '/axis-cgi/jpg/image.cgi') is auths[0]
+        for n in range(3):
+            for url, auth in zip(urls, auths):
+                assert httppool.get(url + '/axis-cgi/jpg/image.cgi', auth=auth).status_code == 200
+    finally:
+        for camera in cameras:
+            fakeservers.stop(camera)
+    # one challenge each, later requests reuse the nonce
+    assert [camera.counts['challenges'] for camera in cameras] == [1, 1]
+
+def test_configure_closes_the_old_session(frames):
+    camera = fakeservers.AxisServer(frames=frames)
+    url = fakeservers.start(camera)
+    try:
+        auth = httppool.digest_auth('username', 'password', url)
+        httppool.get(url + '/axis-cgi/jpg/image.cgi', auth=auth)
+        old = httppool.session()
+        pools = [adapter.poolmanager.pools for adapter in old.adapters.values()]
+        assert sum(len(p) for p in pools) > 0
+        before = httppool.stats()['requests']
+        httppool.configure()
+        assert httppool.session() is not old
+        # the pools of the old session are closed, their requests are still counted
+        assert sum(len(p) for p in pools) == 0
+        assert httppool.stats()['requests'] == before
+    finally:
+        fakeservers.stop(camera)
@@ -0,0 +1,34 @@
+# overlay in worker processes through shared memory slots, and in this process when the pool is broken
+import os, signal, time
+import pytest
+import fakeservers, imagepool
+
+@pytest.fixture(scope='module')
+def frame():
+    return fakeservers.make_frames((320, 180), 1)[0]
+
+@pytest.fixture
+def pool():
+    pool = imagepool.ImagePool('/no/such/font.ttf', 20, (20, 30), processes=1)
+    yield pool
+    pool.close()
+
+def test_overlay_in_a_worker(pool, frame, monkeypatch):
+    image_data = pool.overlay(frame, '2026-10-18 12:00:00', 'Temp 24.4 C')
+    assert image_data.startswith(b'\xff\xd8') and image_data != frame
+    # an image larger than a slot is sent by pickling
+    monkeypatch.setattr(imagepool, 'slot_size', 1000)
+    assert pool.overlay(frame, '2026-10-18 12:00:00').startswith(b'\xff\xd8')
+    assert pool.stats == {'images': 2, 'pickled': 1, 'failed': 0}
+
+@pytest.mark.parametrize('slot_size', [imagepool.slot_size, 1000])
+def test_broken_pool_draws_here(pool, frame, monkeypatch, slot_size):
+    monkeypatch.setattr(imagepool, 'slot_size', slot_size)
+    pool.overlay(frame, '2026-10-18 12:00:00')
+    for pid in list(pool.executor._processes):
+        os.kill(pid, signal.SIGKILL)
+    time.sleep(0.5)
+    image_data = pool.overlay(frame, '2026-10-18 12:00:00', 'Temp 24.4 C')
+    assert image_data.startswith(b'\xff\xd8') and image_data != frame
+    assert pool.stats['failed'] == 1
+    assert pool.overlay(b'not a jpeg', '2026-10-18 12:00:00') is None
@@ -0,0 +1,21 @@
+# gauges of several queues of the same kind in one process
+import metrics, uploadqueue
+
+def gauges(name):
+    return {g['queue']: g['value'] for g in metrics.snapshot()['gauges'] if g['name'] == name}
+
+def test_each_queue_keeps_its_gauges(tmp_path):
+    first = uploadqueue.UploadQueue(workers=1, spool_dir=tmp_path/'a', post=lambda url, data: None)
+    second = uploadqueue.UploadQueue(workers=1, spool_dir=tmp_path/'b', post=lambda url, data: None, name='replay')
+    try:
+        (tmp_path/'b').mkdir()
+        (tmp_path/'b'/'1-000001.upload').write_bytes(b'{}\n')
+        depth = gauges('upload_spool_files')
+        assert depth[first.name] == 0
+        assert depth['replay'] == 1
+        assert 'queue="replay"' in metrics.prometheus()
+    finally:
+        first.close()
+        second.close()
+    assert first.name not in gauges('upload_spool_files')
+    assert 'replay' not in gauges('upload_spool_files')
@@ -0,0 +1,62 @@
+# multipart/x-mixed-replace parsing of an MJPEG stream fed in chunks of any size
+import pytest
+import fakeservers, mjpeg
+
+@pytest.fixture(scope='module')
+def frames():
+    return fakeservers.make_frames((64, 48), 3)
+
+def stream(frames, length=True):
+    parts = []
+    for frame in frames:
+        headers = b'--myboundary\r\nContent-Type: image/jpeg\r\n'
+        if length:
+            headers = headers + b'Content-Length: ' + str(len(frame)).encode() + b'\r\n'
+        parts.append(headers + b'\r\n' + frame + b'\r\n')
+    return b''.join(parts)
+
+def feed(parser, data, chunk):
+    got = []
+    for i in range(0, len(data), chunk):
+        got.extend(parser.feed(data[i:i + chunk]))
+    return got
+
+@pytest.mark.parametrize('chunk', [1, 7, 1000, 100000])
+def test_parts_with_content_length(frames, chunk):
+    parser = mjpeg.MultipartParser('myboundary')
+    assert feed(parser, stream(frames), chunk) == frames
+
+@pytest.mark.parametrize('chunk', [1, 7, 1000, 100000])
+def test_parts_without_content_length(frames, chunk):
+    # a part without Content-Length ends at the next boundary, so the last one waits for it
+    parser = mjpeg.MultipartParser('--myboundary')
+    got = feed(parser, stream(frames, length=False), chunk)
+    assert got == frames[:-1]
+    assert parser.feed(b'--myboundary\r\n') == frames[-1:]
+
+def test_parts_not_jpeg_are_skipped(frames):
+    parser = mjpeg.MultipartParser('myboundary')
+    data = b'--myboundary\r\nContent-Type: text/plain\r\nContent-Length: 5\r\n\r\nhello\r\n' + stream(frames[:1])
+    assert parser.feed(data) == frames[:1]
+
+def test_no_boundary_raises(frames, monkeypatch):
+    monkeypatch.setattr(mjpeg, 'max_part_size', 1000)
+    parser = mjpeg.MultipartParser('myboundary')
+    with pytest.raises(ValueError):
+        parser.feed(b'--myboundary\r\nContent-Type: image/jpeg\r\n\r\n' + b'\xff\xd8' + b'x' * 2000)
+
+def test_stream_of_fake_camera(frames):
+    camera = fakeservers.AxisServer(frames=frames)
+    url = fakeservers.start(camera)
+    try:
+        import requests
+        with requests.get(url + '/axis-cgi/mjpg/video.cgi?fps=50', auth=requests.auth.HTTPDigestAuth('username', 'password'), stream=True, timeout=5) as r:
+            parser = mjpeg.MultipartParser(r.headers['Content-Type'].partition('boundary=')[2])
+            got = []
+            for data in r.iter_content(4096):
+                got.extend(parser.feed(data))
+                if len(got) >= 4:
+                    break
+        assert all(frame in frames for frame in got)
+    finally:
+        fakeservers.stop(camera)
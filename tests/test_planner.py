@@ -0,0 +1,75 @@
+# tour planner: preset intervals from LookOut scores, history and the pre-screen, at the same visits per hour
+import io
+import pytest
+from PIL import Image
+import detections, planner
+
+def tour(intervals):
+    return [{'preset': 'p%d' % n, 'interval': interval} for n, interval in enumerate(intervals)]
+
+def visits(intervals):
+    return sum(1.0 / i for i in intervals.values() if i > 0)
+
+def test_quiet_presets_keep_their_intervals():
+    p = planner.Planner('cam', tour([60, 60, 120]), 60)
+    assert p.plan() == {'p0': 60, 'p1': 60, 'p2': 120}
+
+def test_scored_preset_is_visited_more_often():
+    p = planner.Planner('cam', tour([60, 60, 60, 60]), 60)
+    p.record('p0', 0.9)
+    p.record('p1', None)
+    intervals = p.plan()
+    assert intervals['p0'] < 60
+    assert intervals['p1'] == intervals['p2'] == intervals['p3'] > 60
+    # the same visits per hour as the guard tour
+    assert visits(intervals) == pytest.approx(4 / 60, rel=1e-3)
+    assert p.report()['p0']['hits'] == 1
+
+def test_intervals_stay_within_the_factors():
+    p = planner.Planner('cam', tour([60, 60, 60]), 60)
+    for n in range(20):
+        p.record('p0', 1.0)
+    intervals = p.plan()
+    assert intervals['p0'] >= 60 * planner.min_factor - 1e-6
+    assert all(i <= 60 * planner.max_factor + 1e-6 for i in intervals.values())
+    assert visits(intervals) == pytest.approx(3 / 60, rel=1e-3)
+
+def test_scores_decay():
+    p = planner.Planner('cam', tour([60, 60]), 60)
+    p.record('p0', 0.9)
+    assert p.weights()['p0'] == pytest.approx(planner.base_weight + planner.score_weight, rel=1e-3)
+    p.decayed['p0'] = p.decayed['p0'] - planner.half_life
+    assert p.weights()['p0'] == pytest.approx(planner.base_weight + planner.score_weight / 2, rel=1e-3)
+
+def test_preset_without_interval_is_not_planned():
+    p = planner.Planner('cam', tour([60, 0]), 60)
+    p.record('p1', 0.9)
+    assert p.plan() == {'p0': 60, 'p1': 0}
+
+def test_seed_from_the_detection_store(tmp_path):
+    store = detections.DetectionStore(tmp_path/'detections.db', flush_interval=0.05)
+    for n in range(10):
+        store.add('cam', 'p1', score=0.8 if n < 5 else None, status=200)
+    store.close()
+    p = planner.Planner('cam', tour([60, 60]), 60)
+    p.seed(tmp_path/'detections.db')
+    assert p.weights()['p1'] == pytest.approx(planner.base_weight + planner.history_weight * 0.5, rel=1e-3)
+    assert p.plan()['p1'] < 60
+
+def jpeg(colour):
+    output = io.BytesIO()
+    Image.new('RGB', (320, 180), colour).save(output, 'JPEG')
+    return output.getvalue()
+
+def test_screen_flags_haze_and_smoke():
+    p = planner.Planner('cam', tour([60, 60]), 60)
+    clear = jpeg((40, 90, 30))
+    # the first frame sets the usual statistics of the preset
+    assert not p.screen('p0', clear)
+    assert not p.screen('p0', clear)
+    assert p.screen('p0', jpeg((200, 200, 195)))
+    assert p.weights()['p0'] == pytest.approx(planner.base_weight + planner.screen_weight)
+    assert p.plan()['p0'] < 60
+    assert not p.screen('p0', clear)
+    assert p.screen('p0', b'not a jpeg') is False
+    assert p.stats['flagged'] == 1
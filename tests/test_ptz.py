@@ -0,0 +1,60 @@
+# settle detection of a preset move from position readings, and against a fake PTZ camera
+import pytest
+import fakeservers, httppool, ptz
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def at(pan):
+    return {'pan': pan, 'tilt': 0.0, 'zoom': 1.0}
+
+def test_known_start_waits_for_the_move():
+    settle = ptz.Settle(at(0.0))
+    # the camera has not left the start yet, same readings are not settled
+    assert not settle.update(at(0.0))
+    assert not settle.update(at(0.0))
+    assert not settle.update(at(20.0))
+    assert not settle.update(at(40.0))
+    assert settle.update(at(40.01))
+    assert settle.moved
+
+def test_unknown_start_settles_on_a_change():
+    clock = Clock()
+    settle = ptz.Settle(clock=clock)
+    # the first reading is the reference
+    assert not settle.update(at(10.0))
+    clock.now = 0.2
+    assert not settle.update(at(30.0))
+    clock.now = 0.4
+    assert settle.update(at(30.0))
+
+def test_unknown_start_without_change_settles_after_min_settle():
+    clock = Clock()
+    settle = ptz.Settle(clock=clock)
+    for n in range(4):
+        clock.now = n * 0.2
+        assert not settle.update(at(10.0))
+    clock.now = ptz.min_settle
+    # the camera was at the preset already
+    assert settle.update(at(10.0))
+
+def test_wait_settled_on_fake_camera(monkeypatch):
+    monkeypatch.setattr(ptz, 'poll_interval', 0.05)
+    monkeypatch.setattr(ptz, 'min_wait', 0.05)
+    camera = fakeservers.AxisServer(frames=fakeservers.make_frames((64, 48), 1), move_time=0.5)
+    url = fakeservers.start(camera)
+    try:
+        auth = httppool.digest_auth('username', 'password', url)
+        assert ptz.movetopreset(url, 'first', auth) == 204
+        start = ptz.wait_settled(url, auth, 5)
+        assert start['pan'] == pytest.approx(0.0)
+        assert ptz.movetopreset(url, 'second', auth) == 204
+        position = ptz.wait_settled(url, auth, 5, start)
+        # the second preset is 60 degrees further, the camera is not settled half way
+        assert position['pan'] == pytest.approx(60.0)
+    finally:
+        fakeservers.stop(camera)
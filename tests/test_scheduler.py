@@ -0,0 +1,90 @@
+# detection schedule on a fake clock: earliest deadline first, no drift, missed tick policies
+import scheduler
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def tick(s, clock, run_time=0.0, slack=0.0):
+    keys = s.due(slack)
+    for key in keys:
+        s.start(key)
+    clock.now = clock.now + run_time
+    for key in keys:
+        s.finish(key)
+    return keys
+
+def test_due_earliest_deadline_first():
+    clock = Clock()
+    s = scheduler.Scheduler(clock=clock)
+    s.add('b', 10, start=105)
+    s.add('a', 10, start=102)
+    s.add('c', 10, start=130)
+    assert s.due() == []
+    assert s.peek() == (102, 'a')
+    assert s.wait() == 2
+    clock.now = 106
+    assert s.due() == ['a', 'b']
+    # taken keys are not due again until finished
+    assert s.due() == []
+
+def test_finish_does_not_drift():
+    clock = Clock()
+    s = scheduler.Scheduler(clock=clock)
+    s.add('cam', 10)
+    starts = []
+    for n in range(5):
+        clock.now = s.peek()[0] + 0.5
+        starts.append(clock.now)
+        tick(s, clock, run_time=3.0)
+    # every tick starts 0.5 s late, the next deadline is still interval after the last one
+    assert s.peek()[0] == 150
+    assert s.report()['cam']['actual'] == 10
+    assert s.report()['cam']['late_max'] == 0.5
+
+def test_skip_policy_counts_missed_ticks():
+    clock = Clock()
+    s = scheduler.Scheduler(policy='skip', clock=clock)
+    s.add('cam', 10)
+    tick(s, clock, run_time=35.0)
+    # deadlines 110, 120 and 130 passed during the cycle
+    assert s.report()['cam']['missed'] == 3
+    assert s.peek()[0] == 140
+
+def test_catchup_policy_runs_missed_ticks():
+    clock = Clock()
+    s = scheduler.Scheduler(policy='catchup', clock=clock)
+    s.add('cam', 10)
+    tick(s, clock, run_time=55.0)
+    # deadlines 110 to 150 passed, the last max_catchup of them are made up back to back
+    assert s.report()['cam']['missed'] == 5 - scheduler.max_catchup
+    assert s.peek()[0] == 160 - 10 * scheduler.max_catchup
+    for n in range(scheduler.max_catchup):
+        assert tick(s, clock) == ['cam']
+    assert tick(s, clock) == []
+
+def test_retime_moves_the_waiting_key():
+    clock = Clock()
+    s = scheduler.Scheduler(clock=clock)
+    s.add('a', 60)
+    s.add('b', 30, start=125)
+    tick(s, clock)
+    assert s.peek() == (125, 'b')
+    s.retime('a', 20)
+    # the old heap item of a at 160 is stale, a is next due 20 s after its last deadline
+    assert s.peek() == (120, 'a')
+    clock.now = 160
+    assert s.due() == ['a', 'b']
+    assert s.due() == []
+    assert len(s.heap) == 0
+
+def test_release_schedules_taken_keys_again():
+    clock = Clock()
+    s = scheduler.Scheduler(clock=clock)
+    s.add('a', 10)
+    assert s.due() == ['a']
+    s.release()
+    assert s.peek() == (110, 'a')
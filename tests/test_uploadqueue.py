@@ -0,0 +1,69 @@
+# upload queue against a fake LookOut: posts, the disk spool while LookOut is down, and the uplink state
+import socket, threading
+import pytest
+import deadline, fakeservers, uploadqueue
+
+@pytest.fixture
+def fast(monkeypatch):
+    monkeypatch.setattr(uploadqueue, 'retries', 0)
+    monkeypatch.setattr(uploadqueue, 'backoff_base', 0.01)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def test_post(tmp_path, fast):
+    lookout = fakeservers.LookOutServer(score_rate=1.0)
+    url = fakeservers.start(lookout)
+    uploads = uploadqueue.UploadQueue(workers=2, spool_dir=tmp_path)
+    try:
+        futures = [uploads.submit(url + '/cam', b'\xff\xd8frame', 'cam', 'p') for n in range(4)]
+        assert all(f.result(10).status_code == 200 for f in futures)
+        assert not any(f.spooled for f in futures)
+    finally:
+        uploads.close()
+        fakeservers.stop(lookout)
+    assert uploads.stats['posted'] == 4
+    assert lookout.counts['posts'] == 4
+
+def test_spool_while_down_then_drain(tmp_path, fast):
+    port = free_port()
+    url = 'http://127.0.0.1:%d' % port
+    results = []
+    done = threading.Event()
+    def on_result(camera, preset, response, ts, nbytes):
+        results.append((camera, preset, response.status_code, nbytes))
+        done.set()
+    uploads = uploadqueue.UploadQueue(workers=1, spool_dir=tmp_path, drain_rate=20, on_result=on_result)
+    lookout = None
+    try:
+        future = uploads.submit(url + '/cam', b'\xff\xd8frame', 'cam', 'p')
+        # nothing listens on the port, the image is spooled and the next ones go straight to the spool
+        assert future.result(10) is None
+        assert future.spooled
+        assert uploads.uplink is False
+        assert uploads.submit(url + '/cam', b'\xff\xd8frame', 'cam', 'p').spooled
+        lookout = fakeservers.LookOutServer(('127.0.0.1', port))
+        fakeservers.start(lookout)
+        assert done.wait(10)
+    finally:
+        uploads.close()
+        if lookout is not None:
+            fakeservers.stop(lookout)
+    assert results[0] == ('cam', 'p', 200, 7)
+    assert uploads.uplink is True
+
+def test_timeout_keeps_uplink_up(tmp_path, fast):
+    lookout = fakeservers.LookOutServer(latency=1.0)
+    url = fakeservers.start(lookout)
+    uploads = uploadqueue.UploadQueue(workers=1, spool_dir=tmp_path)
+    try:
+        future = uploads.submit(url + '/cam', b'\xff\xd8frame', 'cam', 'p', deadline=deadline.Deadline(0.3))
+        # LookOut answers too late for this image only, it can still be reached
+        assert future.result(10) is None
+        assert future.spooled
+        assert uploads.uplink is True
+    finally:
+        uploads.close()
+        fakeservers.stop(lookout)
@@ -8,8 +8,13 @@ authToken = ''
 myNumber = ""
 twilioNumber = ''
 
-from twilio.rest import Client
+# one Twilio client for all messages, made at the first message.
+# twilio is imported there too, so importing this module costs nothing until an SMS is sent
+twilioCli = None
 
 def textmyself(message):
-    twilioCli = Client(accountSID, authToken)
+    global twilioCli
+    if twilioCli is None:
+        from twilio.rest import Client
+        twilioCli = Client(accountSID, authToken)
     twilioCli.messages.create(body=message, from_=twilioNumber, to=myNumber)
@@ -1,15 +1,21 @@
 #! python3
 # uploadimage.py - upload image via HTTP Post
-# Last update: 20230810: function call by thread
+# Last update: 20261018: upload image bytes kept in memory, no temp file, alerts imported only when used, alert cooldown per camera
 # Developer: @roboticscats, @jiansuo
-import requests, textMyself
-
-# upload image to LookOut via HTTP Post
-def upload_image(url, image_path):
+import httppool
+
+# image is the jpeg bytes owned by the caller, or a path to a jpeg file
+def read_image(image):
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return image
+    # Open the image file in binary mode and read its contents
+    with open(image, 'rb') as image_file:
+        return image_file.read()
+
+# upload image to LookOut via HTTP Post. deadline (deadline.Deadline) bounds the HTTP Post, None uses the default timeouts
+def upload_image(url, image, deadline=None):
     try:
-        # Open the image file in binary mode and read its contents
-        with open(image_path, 'rb') as image_file:
-            image_data = image_file.read()
+        image_data = read_image(image)
 
         # Set the headers for the HTTP POST request
         headers = {
@@ -17,24 +23,21 @@ def upload_image(url, image_path):
         }
 
         # Make the HTTP POST request with the image data
-        response = requests.post(url, headers=headers, data=image_data)
-        
-        #if 'score' in response.text:
-            #detection = detection + 1
+        response = httppool.post(url, headers=headers, data=image_data, deadline=deadline)
 
         return response
 
     except Exception as e:
         print(f"Error: {e}")
-        return response
+        return None
         
 
-# upload image to LookOut via HTTP Post and send SMS alert of result
-def upload_image_alert(url, image_path, alert):
+# upload image to LookOut via HTTP Post and queue an SMS alert of result, the upload does not wait for the SMS.
+# camera is the camera or preset name the alert cooldown is kept for, detail (e.g. preset and time) and note go in the message
+def upload_image_alert(url, image, camera, detail='', note=''):
+    import alerts, detections
     try:
-        # Open the image file in binary mode and read its contents
-        with open(image_path, 'rb') as image_file:
-            image_data = image_file.read()
+        image_data = read_image(image)
 
         # Set the headers for the HTTP POST request
         headers = {
@@ -42,15 +45,15 @@ def upload_image_alert(url, image_path, alert):
         }
 
         # Make the HTTP POST request with the image data
-        response = requests.post(url, headers=headers, data=image_data)
+        response = httppool.post(url, headers=headers, data=image_data)
         
-        if 'score' in response.text:
-            # send SMS via Twilio. Need to import textMyself
-            textMyself.textmyself('LookOut detects wildfire from the camera ' + alert)
+        if detections.score(response) is not None:
+            # send SMS via Twilio in the background. Need to import alerts
+            alerts.dispatcher().alert(camera, detail, note)
 
         return response
 
     except Exception as e:
         print(f"Error: {e}")
-        return response
+        return None
 
@@ -0,0 +1,236 @@
+#! python3
+# uploadqueue.py - Upload images to LookOut with a fixed pool of workers, retry, and a disk spool
+# Last update: 20261018: bounded upload queue with backoff and store-and-forward, uploads bound by a deadline,
+#              results of spooled images handed back, the uplink is down only when LookOut does not answer
+# Developer: @roboticscats, @jiansuo
+import os, time, json, random, queue, threading, metrics
+from concurrent.futures import Future
+from pathlib import Path
+
+# number of upload worker threads
+workers = 4
+# most uploads waiting in memory, a full queue pushes back on the caller
+queue_size = 16
+# seconds the caller waits for a free place in the queue before the image goes to the disk spool
+put_timeout = 1.0
+# retries of a failed HTTP Post, with jittered exponential backoff
+retries = 3
+backoff_base = 1.0
+backoff_max = 30.0
+# images are kept in this folder while LookOut cannot be reached
+spool_dir = Path.home()/Path('Documents/python/spool')
+# the oldest spooled images are deleted above this size in bytes
+spool_max_bytes = 200 * 1024 * 1024
+# spooled images sent per second once LookOut can be reached again
+drain_rate = 1.0
+
+# True if the HTTP Post should be tried again
+def retriable(response):
+    if response is None:
+        return True
+    return response.status_code in (408, 429) or response.status_code >= 500
+
+# seconds to wait before retry number attempt, full jitter
+def backoff(attempt):
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+class UploadQueue:
+    # settings left as None use the module settings
+    # name labels the gauges of this queue in metrics, default uploads-1, uploads-2, ...
+    def __init__(self, workers=None, queue_size=None, spool_dir=None, spool_max_bytes=None, drain_rate=None, post=None, on_post=None, on_result=None, name=None):
+        g = globals()
+        workers = workers or g['workers']
+        self.queue = queue.Queue(queue_size or g['queue_size'])
+        self.spool_dir = Path(spool_dir or g['spool_dir'])
+        self.spool_max_bytes = spool_max_bytes or g['spool_max_bytes']
+        self.drain_rate = drain_rate or g['drain_rate']
+        if post is None:
+            import uploadimage
+            post = uploadimage.upload_image
+        # post(url, image_data, deadline=None) returns the LookOut response or None
+        self.post = post
+        # on_post(camera, bytes, seconds) is told the time of every successful HTTP Post, e.g. to measure the uplink
+        self.on_post = on_post
+        # on_result(camera, preset, response, ts, bytes) is told the LookOut response of every image sent from the disk spool,
+        # ts is the UTC time the image was queued. The Future of a spooled image is done with None and has spooled True
+        self.on_result = on_result
+        self.uplink = True
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.closed = threading.Event()
+        self.stats = {'queued': 0, 'posted': 0, 'retried': 0, 'failed': 0, 'spooled': 0, 'drained': 0, 'dropped': 0, 'inflight': 0}
+        self.threads = [threading.Thread(target=self.worker, daemon=True) for i in range(workers)]
+        self.threads.append(threading.Thread(target=self.drainer, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        self.name = name or metrics.queue_name('uploads')
+        metrics.gauge('upload_queue_depth', self.queue.qsize, queue=self.name)
+        metrics.gauge('upload_inflight', lambda: self.stats['inflight'], queue=self.name)
+        metrics.gauge('upload_spool_files', lambda: len(self.spooled()), queue=self.name)
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] = self.stats[key] + n
+
+    # queue an image for upload. Return a Future of the LookOut response, None if the image is spooled or failed.
+    # camera and preset label the HTTP Post timing in metrics. deadline (deadline.Deadline) bounds the HTTP Posts
+    # and retries, an image still not posted by then goes to the disk spool
+    def submit(self, url, image_data, camera='', preset='', deadline=None):
+        future = Future()
+        future.spooled = False
+        if not self.uplink:
+            # LookOut is down, do not wait for it
+            self.spool(url, image_data, future, camera, preset)
+            return future
+        try:
+            self.queue.put((url, image_data, future, camera, preset, deadline), timeout=put_timeout)
+            self.count('queued')
+        except queue.Full:
+            self.spool(url, image_data, future, camera, preset)
+        return future
+
+    # HTTP Post with retry, return the response or None
+    def post_retry(self, url, image_data, attempts, camera='', deadline=None):
+        response = None
+        for attempt in range(attempts):
+            if attempt > 0:
+                wait = backoff(attempt - 1)
+                if deadline is not None and deadline.limit(wait) < wait:
+                    break
+                self.count('retried')
+                time.sleep(wait)
+            if deadline is not None and deadline.expired():
+                break
+            started = time.perf_counter()
+            response = self.post(url, image_data) if deadline is None else self.post(url, image_data, deadline=deadline)
+            if self.on_post is not None and response is not None and response.status_code == 200:
+                self.on_post(camera, len(image_data), time.perf_counter() - started)
+            if not retriable(response):
+                break
+        return response
+
+    def worker(self):
+        while True:
+            url, image_data, future, camera, preset, deadline = self.queue.get()
+            self.count('inflight')
+            try:
+                with metrics.timer('post', camera, preset):
+                    response = self.post_retry(url, image_data, retries + 1, camera, deadline)
+                if response is not None and response.status_code == 200:
+                    self.uplink = True
+                    self.count('posted')
+                    future.set_result(response)
+                elif retriable(response):
+                    # no answer at all before the deadline means LookOut cannot be reached, the next images go to the spool.
+                    # An answer out of time or a server error fails this image only
+                    if response is None and not (deadline is not None and deadline.expired()):
+                        self.uplink = False
+                    self.spool(url, image_data, future, camera, preset)
+                else:
+                    self.count('failed')
+                    future.set_result(response)
+            except Exception as e:
+                print(f"Error: {e}")
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                self.count('inflight', -1)
+                self.queue.task_done()
+
+    # save an image to the disk spool, the file has one JSON line of the url, camera, preset and time, then the image bytes
+    def spool(self, url, image_data, future, camera='', preset=''):
+        try:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            with self.lock:
+                self.seq = self.seq + 1
+                name = '%d-%06d.upload' % (time.time_ns(), self.seq)
+            temp_file = self.spool_dir/Path(name + '.tmp')
+            with temp_file.open(mode='wb') as f:
+                f.write(json.dumps({'url': url, 'camera': camera, 'preset': preset, 'ts': time.time()}).encode() + b'\n')
+                f.write(image_data)
+            os.replace(temp_file, self.spool_dir/Path(name))
+            self.count('spooled')
+            future.spooled = True
+            self.trim_spool()
+        except Exception as e:
+            print(f"Error: {e}")
+            self.count('dropped')
+        future.set_result(None)
+
+    # spooled files, oldest first
+    def spooled(self):
+        try:
+            return sorted(self.spool_dir.glob('*.upload'))
+        except Exception:
+            return []
+
+    # delete the oldest spooled images above the size cap
+    def trim_spool(self):
+        files = self.spooled()
+        sizes = [f.stat().st_size for f in files]
+        total = sum(sizes)
+        for f, size in zip(files, sizes):
+            if total <= self.spool_max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total = total - size
+            self.count('dropped')
+
+    # send spooled images at drain_rate, try one image at a time while LookOut is down
+    def drainer(self):
+        attempt = 0
+        while not self.closed.wait(1.0 / self.drain_rate):
+            files = self.spooled()
+            if not files:
+                continue
+            try:
+                with files[0].open(mode='rb') as f:
+                    header = json.loads(f.readline())
+                    image_data = f.read()
+            except Exception as e:
+                print(f"Error: {e}")
+                files[0].unlink(missing_ok=True)
+                continue
+            response = self.post(header['url'], image_data)
+            if response is not None and response.status_code == 200:
+                attempt = 0
+                self.uplink = True
+                files[0].unlink(missing_ok=True)
+                self.count('drained')
+            elif retriable(response):
+                if response is None:
+                    self.uplink = False
+                if self.closed.wait(backoff(attempt)):
+                    break
+                attempt = attempt + 1
+                continue
+            else:
+                files[0].unlink(missing_ok=True)
+                self.count('failed')
+            # the score of a spooled image goes the same way as of an image posted by a worker
+            if self.on_result is not None:
+                try:
+                    self.on_result(header.get('camera', ''), header.get('preset', ''), response, header.get('ts'), len(image_data))
+                except Exception as e:
+                    print(f"Error: {e}")
+
+    # number of uploads waiting in memory and on disk
+    def depth(self):
+        return self.queue.qsize(), len(self.spooled())
+
+    # wait until all queued uploads are done, spooled images stay on disk
+    def join(self):
+        self.queue.join()
+
+    # wait for the queued uploads and the spooled image being sent, the rest of the spool stays on disk
+    def close(self):
+        self.join()
+        self.closed.set()
+        self.threads[-1].join()
+        metrics.drop_gauges(self.name)
+
+    # one line report of the upload counters
+    def report(self):
+        with self.lock:
+            s = dict(self.stats)
+        return str(s['posted']) + ' images posted, ' + str(s['retried']) + ' retries, ' + str(s['spooled']) + ' spooled, ' + str(s['drained']) + ' sent from spool, ' + str(s['dropped']) + ' dropped.'
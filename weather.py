@@ -1,34 +1,108 @@
 #! python3
 # weather.py - Get the current weather info - temperature, humidity, wind speed - via OpenWeather API
-# Last update: 20230801
+# Last update: 20261018: background refresh, shared cache saved to disk, one JSON parse
 # Developer: @roboticscats @jiansuo
-import re, requests
+import os, json, time, threading, httppool
+from pathlib import Path
 
 # This is the OpenWeather API key. SECRET info.
 apikey = ''
+# OpenWeather One Call API
+apiUrl = 'https://api.openweathermap.org/data/3.0/onecall'
+# seconds between two OpenWeather API calls of the same place
+refresh = 600
+# seconds to wait before calling OpenWeather API again after a failure
+retry = 60
+# cameras within about 1 km (2 decimal places of lat/lon) share the same weather info
+places = 2
+# the weather cache is saved to this file, so a restart does not call the API again
+cache_file = Path.home()/Path('Documents/python/weather-cache.json')
+
+# cache is {place key: {'info': str, 'time': epoch seconds of the last successful call}}
+_cache = None
+_tried = {}
+_refreshing = set()
+_lock = threading.Lock()
+
+# turn the One Call API response into 'temperature | humidity | wind speed', parse the JSON once
+def parse(text):
+    current = json.loads(text)['current']
+    return str(round(float(current['temp']), 1)) + chr(176) + 'C | ' + str(current['humidity']) + ' % | ' + str(current['wind_speed']) + ' km/h'
+
+# get current weather info (temperature, humidity, wind speed), return '' on failure
+def weather(lat, long):
+    url = apiUrl + '?lat=' + str(round(lat,4)) + '&lon=' + str(round(long,4)) + '&exclude=minutely,hourly,daily&units=metric&appid=' + str(apikey)
 
-# get current weather info (temperature, humidity, wind speed)
-def weather(lat,long):
-    # define the regexes
-    temperature = re.compile(r'("temp":)(\d?\d?\d.\d?\d?)')
-    humidity = re.compile(r'("humidity":)(\d?\d?\d)')
-    wind_speed = re.compile(r'("wind_speed":)(\d?\d?\d.\d?\d?)')
-    
-    url = 'https://api.openweathermap.org/data/3.0/onecall?lat=' + str(round(lat,4)) + '&lon=' + str(round(long,4)) + '&exclude=minutely,hourly,daily&units=metric&appid=' + str(apikey)
-    
     try:
         # call the OpenWeather API to get current weather
-        current = requests.get(url)
+        current = httppool.get(url)
 
         if current.status_code == 200:
-            t = temperature.search(current.text)
-            h = humidity.search(current.text)
-            w = wind_speed.search(current.text)
-                      
-            info = str(round(float(t.group(2)),1)) + chr(176) + 'C | ' + h.group(2) +' % | ' + w.group(2) + ' km/h'
-            return info
+            return parse(current.text)
+
+    except Exception as e:
+        print(f"Error: {e}")
+    return ''
 
+# cache key of a place
+def place(lat, long):
+    return str(round(lat, places)) + ',' + str(round(long, places))
+
+# load the weather cache file once
+def load_cache():
+    global _cache
+    if _cache is None:
+        _cache = {}
+        try:
+            with open(cache_file) as f:
+                _cache = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error: {e}")
+    return _cache
+
+# save the weather cache file, write a new file then rename so a crash never leaves half a file
+def save_cache():
+    try:
+        with _lock:
+            data = json.dumps(_cache)
+        temp_file = str(cache_file) + '.' + str(threading.get_ident()) + '.tmp'
+        with open(temp_file, 'w') as f:
+            f.write(data)
+        os.replace(temp_file, cache_file)
     except Exception as e:
         print(f"Error: {e}")
-        return('')
-    
+
+# call OpenWeather API in the background and update the cache
+def update(key, lat, long):
+    try:
+        info = weather(lat, long)
+        if info:
+            with _lock:
+                _cache[key] = {'info': info, 'time': time.time()}
+            save_cache()
+    finally:
+        with _lock:
+            _refreshing.discard(key)
+
+# current weather info of a place from the cache. It never waits for OpenWeather unless wait > 0:
+# an old entry starts a refresh in the background, and '' is returned until the first call finishes.
+def current(lat, long, wait=0):
+    key = place(lat, long)
+    with _lock:
+        entry = load_cache().get(key)
+        now = time.time()
+        stale = entry is None or now - entry['time'] > refresh
+        if stale and key not in _refreshing and now - _tried.get(key, 0) > retry:
+            _refreshing.add(key)
+            _tried[key] = now
+            thread = threading.Thread(target=update, args=(key, lat, long), daemon=True)
+            thread.start()
+        else:
+            thread = None
+    if thread is not None and wait > 0:
+        thread.join(wait)
+        with _lock:
+            entry = _cache.get(key)
+    return entry['info'] if entry else ''